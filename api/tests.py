@@ -1,3 +1,31 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
 from django.test import TestCase
+from rest_framework.authtoken.models import Token
+
+
+class AdminEndpointsTests(TestCase):
+    """Служебные эндпоинты — только staff по DRF-токену."""
+
+    def _get(self, url, user=None):
+        headers = {"HTTP_AUTHORIZATION": f"Token {Token.objects.create(user=user).key}"} if user else {}
+        return self.client.get(url, **headers)
+
+    def test_board_cache_stats_requires_staff(self):
+        url = "/api/v1/board/cache-stats"
+        self.assertEqual(self._get(url).status_code, 401)
+        self.assertEqual(self._get(url, User.objects.create(username="u")).status_code, 403)
+        resp = self._get(url, User.objects.create(username="admin", is_staff=True))
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("registry", resp.json())
 
-# Create your tests here.
+    def test_board_analytics_requires_staff(self):
+        url = "/api/v1/board/analytics"
+        summary = mock.Mock(return_value={"expected_rolls": 1.0})
+        with mock.patch("games.services.board_analytics.board_summary", summary):
+            self.assertEqual(self._get(url).status_code, 401)
+            self.assertEqual(self._get(url, User.objects.create(username="u")).status_code, 403)
+            summary.assert_not_called()  # анониму расчёт не запускаем
+            resp = self._get(url, User.objects.create(username="admin", is_staff=True))
+        self.assertEqual(resp.status_code, 200)
@@ -1,11 +1,15 @@
 from django.urls import path
 from .views import ping
+from .views import board_cache_stats
+from .views import board_analytics
 from .views import roll_dice
 from .views import create_player
 
 
 urlpatterns = [
     path("ping", ping),
+    path("board/cache-stats", board_cache_stats),
+    path("board/analytics", board_analytics),
     path("game/roll", roll_dice),
     path("players", create_player),
 ]
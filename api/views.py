@@ -4,12 +4,47 @@ from rest_framework import exceptions
 from .models import ApiKey
 from django.urls import path
 from django.http import JsonResponse
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 
 
 def ping(request):
     return JsonResponse({"ok": True, "service": "api", "v": 1})
 
 
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def board_cache_stats(request):
+    """
+    Счётчики кэшей доски в этом воркере (alt-правила, реестр досок, карточки ходов).
+    Только для staff: Authorization: Token <DRF_TOKEN>.
+    """
+    from games.services.board import registry
+    from games.services.card_cache import get_card_cache_stats
+    from games.services.game_utils import get_alt_map_stats
+    return JsonResponse({
+        "ok": True,
+        "alt_map": get_alt_map_stats(),
+        "registry": registry.stats(),
+        "cards": get_card_cache_stats(),
+    })
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def board_analytics(request):
+    """
+    Сводка цепи Маркова по текущей доске; считается один раз на версию board.json (секунды CPU —
+    поэтому только для staff, как и cache-stats).
+    """
+    from django.core.cache import cache
+    from games.services.board import get_compiled_board
+    from games.services.board_analytics import board_summary
+
+    key = f"board_analytics:{get_compiled_board().version}"
+    return JsonResponse({"ok": True, **cache.get_or_set(key, board_summary, timeout=None)})
+
+
 class ApiKeyAuthentication(BaseAuthentication):
     keyword = "Bearer"  # чтобы работало с Authorization: Bearer <ключ>
 
@@ -44,35 +79,8 @@ from rest_framework import status
 
 from players.models import Player
 from games.models import Game
-from games.services.board import get_cell
-
-MAX_CELL = 72
-
-def _apply_board_events(cell_obj, to_cell):
-    """
-    Логика «змейки/стрелы»: ladders eat snakes → приоритет у лестницы.
-    cell_obj — объект клетки, на которую мы пришли до событий.
-    """
-    if not cell_obj:
-        return to_cell, "normal"
-    # Поля могут называться ladder_to/snake_to или event:{type,to}
-    ladder_to = cell_obj.get("ladder_to")
-    snake_to  = cell_obj.get("snake_to")
-    event     = cell_obj.get("event")
-
-    if event and isinstance(event, dict):
-        et = event.get("type")
-        if et == "ladder":
-            return int(event.get("to")), "ladder"
-        if et == "snake":
-            return int(event.get("to")), "snake"
-
-    # Приоритет лестницы
-    if ladder_to:
-        return int(ladder_to), "ladder"
-    if snake_to:
-        return int(snake_to), "snake"
-    return to_cell, "normal"
+from games.services.board import board_for_game, get_cell
+from games.services.entry import GameEntryManager
 
 @api_view(["POST"])
 def roll_dice(request):
@@ -104,38 +112,18 @@ def roll_dice(request):
 
     rolled = random.randint(1, 6)
     from_cell = game.current_cell or 0
-    tentative = from_cell + rolled
-    if tentative > MAX_CELL:
-        tentative = MAX_CELL
-
-    # Смотрим описание клетки, на которую пришли (до событий)
-    base_cell_obj = get_cell(tentative)
-    to_cell, event_type = _apply_board_events(base_cell_obj, tentative)
-
-    # Описание финальной клетки (после событий)
-    final_cell_obj = get_cell(to_cell)
-
-    # Собираем state_after (что хочешь — минимум финальная клетка)
-    state_after = {
-        "rolled": rolled,
-        "from_cell": from_cell,
-        "to_cell": to_cell,
-        "event_type": event_type,
-    }
 
-    # Пишем ход и обновляем игру
-    game.add_move(
-        rolled=rolled,
-        from_cell=from_cell,
-        to_cell=to_cell,
-        event_type=event_type,
-        note="API roll",
-        state_after=state_after,
-    )
+    # тот же движок правил, что и в Telegram-вебхуке (шестёрки на старте, серии, комбо, верхний ряд)
+    res = GameEntryManager().apply_roll(game, rolled, player_id=player.id)
+    game.refresh_from_db()
+    to_cell = int(game.current_cell or 0)
+    last = res.moves[-1] if res.moves else None
+    event_type = last["event_type"] if last else "normal"
 
-    # Если дошли до финала — закроем игру
-    if to_cell >= MAX_CELL:
-        game.finish()
+    # Описание клеток: где встали до правил и где оказались в итоге — на доске этой игры
+    board = board_for_game(game)
+    base_cell_obj = get_cell(last["pre_rule_cell"] if last else to_cell, board=board)
+    final_cell_obj = get_cell(to_cell, board=board)
 
     # Что отдать наружу
     def pack(cell_obj):
@@ -160,6 +148,9 @@ def roll_dice(request):
         "from_cell": from_cell,
         "to_cell": to_cell,
         "event_type": event_type,
+        "result": res.status,
+        "message": res.message,
+        "moves": res.moves,
         "base_cell": pack(base_cell_obj),   # куда встали до применения событий
         "final_cell": pack(final_cell_obj), # где оказались в итоге
         "last_move_number": game.last_move_number,
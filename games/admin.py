@@ -73,7 +73,8 @@ class GameAdmin(admin.ModelAdmin):
                     'last_move_number', 'current_cell', 'started_at', "payment_status", 'updated_at')
     list_filter = ('status', 'is_active', 'game_type', "payment_status")
     search_fields = ('id', 'player__email', 'player__telegram_username', 'game_name', "user_game_intention")
-    readonly_fields = ('started_at', 'updated_at', 'finished_at', 'last_move_number')
+    readonly_fields = ('started_at', 'updated_at', 'finished_at', 'last_move_number',
+                       'confirmed_moves', 'unanswered_moves', 'next_unanswered_move')
     inlines = [MoveInline]
 
 
@@ -132,4 +133,13 @@ class GameSettingsAdmin(admin.ModelAdmin):
         # Разрешаем создать только одну запись
         if GameSettings.objects.exists():
             return False
-        return super().has_add_permission(request)
\ No newline at end of file
+        return super().has_add_permission(request)
+
+from .models import TelegramFile
+
+@admin.register(TelegramFile)
+class TelegramFileAdmin(admin.ModelAdmin):
+    # заполняется при отправке карточек и manage.py warm_card_file_ids; удалить запись = загрузить файл заново
+    list_display = ('relpath', 'bot_id', 'sha256', 'created_at')
+    search_fields = ('relpath',)
+    readonly_fields = ('bot_id', 'relpath', 'sha256', 'file_id', 'file_unique_id', 'created_at')
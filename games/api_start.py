@@ -1,18 +1,20 @@
+from asgiref.sync import sync_to_async
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse, HttpResponseBadRequest
 import json
 import os
 from django.utils.timezone import now
 from games.models import Game, Player
+from games.services import tg_async
 from games.services.tg_send import send_dice
+from games.services.board import pin_board_version
 from django.conf import settings
 BOT_TOKEN = getattr(settings, "TELEGRAM_BOT_TOKEN", None)
 
-@csrf_exempt
-def start_game_endpoint(request):
-    """Старт игры без какой-либо доп. аутентификации (как у вебхука)."""
+def _parse_start(request):
+    """(payload, chat_id) или HttpResponse с ошибкой."""
     if request.method != "POST":
-        return HttpResponseBadRequest("POST only")
+        return None, HttpResponseBadRequest("POST only")
 
     # читаем payload
     try:
@@ -21,14 +23,17 @@ def start_game_endpoint(request):
         payload = request.POST.dict()
 
     chat_id = payload.get("chat_id") or payload.get("telegram_id") or payload.get("user_id")
-    email   = payload.get("email")
     if not chat_id:
-        return HttpResponseBadRequest("chat_id or telegram_id required")
+        return None, HttpResponseBadRequest("chat_id or telegram_id required")
 
     if not BOT_TOKEN:
-        return JsonResponse({"ok": False, "error": "bot_token_not_set"}, status=500)
+        return None, JsonResponse({"ok": False, "error": "bot_token_not_set"}, status=500)
+    return (payload, chat_id), None
+
 
-    # находим/создаём игрока
+def _player_and_game(payload: dict, chat_id) -> Game:
+    """Находим/создаём игрока и его активную игру (только ORM, без Telegram)."""
+    email = payload.get("email")
     player = None
     if email:
         player = Player.objects.filter(email=email).first()
@@ -49,11 +54,12 @@ def start_game_endpoint(request):
             current_six_number=0,
             game_type="default",
             game_name=f"Game {now():%Y-%m-%d %H:%M:%S}",
+            board_version=pin_board_version("default"),
         )
+    return game
 
-    # сразу кидаем первый кубик от бота
-    tg_resp = send_dice(BOT_TOKEN, chat_id)
 
+def _start_response(game: Game, tg_resp) -> JsonResponse:
     # если Telegram не принял (обычно 403 — пользователь не нажал Start у бота)
     if not (isinstance(tg_resp, dict) and tg_resp.get("ok")):
         return JsonResponse({
@@ -68,3 +74,35 @@ def start_game_endpoint(request):
         "game_id": str(game.id),
         "telegram_response": tg_resp.get("result", {}),
     })
+
+
+async def start_game_endpoint(request):
+    """
+    Старт игры без какой-либо доп. аутентификации (как у вебхука).
+    Async: ORM — в потоке через sync_to_async, первый кубик — через общий httpx.AsyncClient,
+    пока ждём Telegram, воркер обслуживает другие запросы.
+    """
+    parsed, error = _parse_start(request)
+    if error is not None:
+        return error
+    payload, chat_id = parsed
+    game = await sync_to_async(_player_and_game)(payload, chat_id)
+
+    # сразу кидаем первый кубик от бота
+    tg_resp = await tg_async.send_dice(BOT_TOKEN, chat_id)
+    return _start_response(game, tg_resp)
+
+
+# csrf_exempt в Django 4.2 оборачивает view синхронной функцией — для async-вьюхи ставим флаг сами
+start_game_endpoint.csrf_exempt = True
+
+
+@csrf_exempt
+def start_game_endpoint_sync(request):
+    """Прежний синхронный вариант (WSGI, requests): блокирует поток воркера на время запроса к Telegram."""
+    parsed, error = _parse_start(request)
+    if error is not None:
+        return error
+    payload, chat_id = parsed
+    game = _player_and_game(payload, chat_id)
+    return _start_response(game, send_dice(BOT_TOKEN, chat_id))
@@ -0,0 +1,131 @@
+import asyncio
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.test import AsyncRequestFactory, RequestFactory
+
+from games import api_start
+from games.models import Game
+from games.services import telegram_client, tg_async, tg_rate
+from players.models import Player
+
+# служебные игроки бенчмарка: telegram_id из этого диапазона, удаляются после прогона
+BENCH_TG_BASE = -9_100_000_000
+
+
+class Command(BaseCommand):
+    help = ("Бенчмарк /api/start-game/ при медленном Telegram: синхронная вьюха на пуле потоков "
+            "(как sync-воркеры gunicorn) против async-вьюхи в одном event loop (как uvicorn-воркер). "
+            "Telegram подменён ответом с задержкой --latency; игроки служебные, удаляются после прогона.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chats", type=int, default=300, help="Одновременных запросов (разных чатов)")
+        parser.add_argument("--latency", type=float, default=0.2, help="Задержка ответа Telegram, сек")
+        parser.add_argument("--threads", type=int, default=8,
+                            help="Потоков у sync-варианта (workers × threads у gunicorn)")
+        parser.add_argument("--json", action="store_true")
+
+    def handle(self, *args, **opts):
+        chats, latency = opts["chats"], opts["latency"]
+        self._setup(chats)
+        try:
+            # меряем ожидание I/O, а не лимиты Telegram: лимитер без ограничений
+            unlimited = tg_rate.RateLimiter(1e9, 10 ** 9, 1e9, 10 ** 9, 1e9)
+            with mock.patch.object(api_start, "BOT_TOKEN", "bench"), \
+                    mock.patch.object(tg_rate, "get_limiter", lambda: unlimited):
+                results = {
+                    "sync": self._run_sync(chats, latency, opts["threads"]),
+                    "async": asyncio.run(self._run_async(chats, latency)),
+                }
+        finally:
+            self._cleanup()
+
+        if opts["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{chats} concurrent chats, telegram latency {latency * 1000:.0f} ms, "
+                          f"sync threads {opts['threads']}")
+        for mode, r in results.items():
+            self.stdout.write(
+                f"{mode:<6} {r['elapsed_sec']:>7.3f}s {r['requests_per_sec']:>8.1f} req/s  "
+                f"p50 {r['p50_ms']:>7.1f} ms  p95 {r['p95_ms']:>7.1f} ms  errors {r['errors']}"
+            )
+
+    def _setup(self, chats: int) -> None:
+        self._cleanup()
+        # игроки и активные игры уже есть: меряем чтение из БД и ожидание Telegram, а не вставки в sqlite
+        players = Player.objects.bulk_create(
+            Player(email=f"bench_start_{n}@example.local", telegram_id=BENCH_TG_BASE - n) for n in range(chats)
+        )
+        Game.objects.bulk_create(Game(player=p, game_type="bench") for p in players)
+
+    def _cleanup(self) -> None:
+        Player.objects.filter(telegram_id__lte=BENCH_TG_BASE, email__startswith="bench_start_").delete()
+
+    @staticmethod
+    def _body(n: int) -> str:
+        return json.dumps({"chat_id": BENCH_TG_BASE - n})
+
+    @staticmethod
+    def _summary(elapsed: float, latencies: list, errors: int) -> dict:
+        latencies = sorted(latencies) or [0.0]
+        return {
+            "elapsed_sec": round(elapsed, 3),
+            "requests_per_sec": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(statistics.median(latencies) * 1000, 1),
+            "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+            "errors": errors,
+        }
+
+    def _run_sync(self, chats: int, latency: float, threads: int) -> dict:
+        def fake_post(url, timeout=None, **kw):
+            time.sleep(latency)
+            return mock.Mock(status_code=200, json=lambda: {"ok": True, "result": {"dice": {"value": 3}}})
+
+        factory = RequestFactory()
+        latencies, errors = [], []
+
+        def one(n: int):
+            try:
+                request = factory.post("/api/start-game/", self._body(n), content_type="application/json")
+                if api_start.start_game_endpoint_sync(request).status_code != 200:
+                    errors.append(n)
+            finally:
+                latencies.append(time.perf_counter() - started)
+                close_old_connections()
+
+        # задержка — от начала всплеска: все чаты прислали запрос разом, ожидание свободного потока тоже считаем
+        started = time.perf_counter()
+        with mock.patch.object(telegram_client.get_session(), "post", fake_post), ThreadPoolExecutor(threads) as pool:
+            list(pool.map(one, range(chats)))
+        return self._summary(time.perf_counter() - started, latencies, len(errors))
+
+    async def _run_async(self, chats: int, latency: float) -> dict:
+        async def fake_telegram(request: httpx.Request) -> httpx.Response:
+            await asyncio.sleep(latency)
+            return httpx.Response(200, json={"ok": True, "result": {"dice": {"value": 3}}})
+
+        # общий клиент этого loop ходит в подменённый Telegram
+        tg_async._clients[asyncio.get_running_loop()] = httpx.AsyncClient(transport=httpx.MockTransport(fake_telegram))
+        factory = AsyncRequestFactory()
+        latencies, errors = [], []
+
+        async def one(n: int):
+            request = factory.post("/api/start-game/", self._body(n), content_type="application/json")
+            if (await api_start.start_game_endpoint(request)).status_code != 200:
+                errors.append(n)
+            latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(n) for n in range(chats)))
+        elapsed = time.perf_counter() - started
+        await tg_async.aclose_client()
+        await sync_to_async(close_old_connections)()
+        return self._summary(elapsed, latencies, len(errors))
@@ -0,0 +1,51 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from games.services import board
+
+
+def _legacy_get_cell(n: int):
+    """Старый путь get_cell(): stat + json (из кэша) + линейный проход по клеткам."""
+    st = board.DATA_PATH.stat().st_mtime
+    if _legacy_cache["data"] is None or _legacy_cache["mtime"] != st:
+        with board.DATA_PATH.open("r", encoding="utf-8") as f:
+            _legacy_cache["data"] = json.load(f)
+            _legacy_cache["mtime"] = st
+    data = _legacy_cache["data"]
+    cells = data["board"] if isinstance(data, dict) and "board" in data else data
+    return next((c for c in cells if int(c.get("n") or c.get("cell")) == n), None)
+
+
+_legacy_cache = {"data": None, "mtime": None}
+
+
+class Command(BaseCommand):
+    help = "Микробенчмарк поиска клеток: старый линейный get_cell() против скомпилированной доски."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rounds", type=int, default=2000, help="Сколько раз пройти по всем 72 клеткам")
+
+    def _rate(self, fn, rounds: int) -> float:
+        cells = range(1, board.BOARD_SIZE + 1)
+        t0 = time.perf_counter()
+        for _ in range(rounds):
+            for n in cells:
+                fn(n)
+        elapsed = time.perf_counter() - t0
+        return rounds * board.BOARD_SIZE / elapsed if elapsed else float("inf")
+
+    def handle(self, *args, **opts):
+        rounds = max(1, opts["rounds"])
+        board.get_compiled_board()  # прогрев
+
+        legacy = self._rate(_legacy_get_cell, rounds)
+        compiled = self._rate(board.get_cell, rounds)
+        jumps = self._rate(board.get_jump_target, rounds)
+        images = self._rate(board.get_cell_image_name, rounds)
+
+        self.stdout.write(f"legacy get_cell:        {legacy:>14,.0f} lookups/s")
+        self.stdout.write(f"compiled get_cell:      {compiled:>14,.0f} lookups/s  (x{compiled / legacy:.1f})")
+        self.stdout.write(f"compiled jump target:   {jumps:>14,.0f} lookups/s")
+        self.stdout.write(f"compiled image name:    {images:>14,.0f} lookups/s")
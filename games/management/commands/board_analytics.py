@@ -0,0 +1,32 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from games.services.board_analytics import board_summary
+
+
+class Command(BaseCommand):
+    help = "Аналитика доски (цепь Маркова): ожидаемая длина партии, распределение бросков, посещаемость клеток."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--json", action="store_true", help="Вывести полную сводку в JSON")
+        parser.add_argument("--top", type=int, default=10, help="Сколько самых посещаемых клеток показать")
+
+    def handle(self, *args, **opts):
+        summary = board_summary()
+        if opts["json"]:
+            self.stdout.write(json.dumps(summary, ensure_ascii=False, indent=2))
+            return
+
+        pct = summary["rolls_percentiles"]
+        self.stdout.write(f"board version:     {summary['board_version']} ({summary['states']} states)")
+        self.stdout.write(f"expected rolls:    {summary['expected_rolls']:.2f} (std {summary['std_rolls']:.2f})")
+        self.stdout.write(f"rolls p50/p90/p99: {pct['p50']} / {pct['p90']} / {pct['p99']}")
+        self.stdout.write(f"expected cards:    {summary['expected_cards']:.2f}")
+
+        cells = sorted(summary["cells"], key=lambda c: c["visit_probability"], reverse=True)
+        self.stdout.write("most visited cells:")
+        for c in cells[: max(0, opts["top"])]:
+            self.stdout.write(
+                f"  {c['n']:>2}: P(visit)={c['visit_probability']:.3f}  E[cards]={c['expected_landings']:.3f}"
+            )
@@ -0,0 +1,55 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from games.services import board
+from games.services.board_artifact import load_artifact, walks_equal, write_artifact
+from games.services.game_utils import TransitionTable
+
+
+class Command(BaseCommand):
+    help = "Проверяет файлы досок (settings.BOARDS) и собирает бинарные артефакты (mmap) для воркеров."
+    # запускается при сборке образа (Dockerfile), где нет окружения рантайма (SITE_BASE_URL и т.п.)
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default=None,
+                            help="Путь артефакта для board.json (по умолчанию BOARD_ARTIFACT_PATH)")
+        parser.add_argument("--check", action="store_true", help="Только проверить файлы досок")
+
+    def handle(self, *args, **opts):
+        for source in board.registry.configured_paths():
+            self._build(source, opts)
+
+    def _build(self, source: Path, opts):
+        raw = source.read_bytes()
+        try:
+            data = json.loads(raw.decode("utf-8"))
+        except ValueError as e:
+            raise CommandError(f"{source.name}: невалидный JSON: {e}")
+
+        errors = board.validate_board(data)
+        if errors:
+            raise CommandError(f"{source.name} не прошёл проверку:\n  " + "\n  ".join(errors))
+        if opts["check"]:
+            self.stdout.write(self.style.SUCCESS(f"{source.name} ok"))
+            return
+
+        output = board.artifact_path_for(source)
+        if opts["output"] and source == board.DATA_PATH:
+            output = Path(opts["output"])
+        if not output:
+            raise CommandError("BOARD_ARTIFACT_PATH не задан, укажите --output")
+
+        compiled = board.compile_board(data)
+        if board.registry.get_by_path(source).version != compiled.version:
+            raise CommandError(f"{source.name} изменился во время сборки, повторите")
+        with board.use_board(compiled):
+            table = TransitionTable(compiled)
+
+        size = write_artifact(output, compiled, table.walks, raw, source=source)
+        mapped = load_artifact(output, source)
+        if mapped is None or mapped.version != compiled.version or not walks_equal(mapped, table.walks):
+            raise CommandError("артефакт не читается обратно")
+        self.stdout.write(self.style.SUCCESS(f"{source.name} {compiled.version} -> {output} ({size} bytes)"))
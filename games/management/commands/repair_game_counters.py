@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from games.models import Game
+from games.services.game_utils import COUNTER_FIELDS, counter_annotations
+
+
+class Command(BaseCommand):
+    help = ("Пересчитать счётчики игр (confirmed_moves, unanswered_moves, next_unanswered_move) по Move — "
+            "пачками, каждая пачка под блокировкой своих игр.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500)
+        parser.add_argument("--game-id", default=None, help="Только одна игра")
+        parser.add_argument("--dry-run", action="store_true", help="Только показать расхождения")
+
+    def handle(self, *args, **opts):
+        chunk_size = max(1, opts["chunk_size"])
+        # реальные значения под своими именами, чтобы сравнить с сохранёнными
+        real = {f"real_{name}": expr for name, expr in counter_annotations().items()}
+        base = Game.objects.order_by("pk")
+        if opts["game_id"]:
+            base = base.filter(pk=opts["game_id"])
+
+        checked = fixed = 0
+        last_pk = None
+        while True:
+            with transaction.atomic():
+                qs = base if last_pk is None else base.filter(pk__gt=last_pk)
+                ids = list(qs.values_list("pk", flat=True)[:chunk_size])
+                if not ids:
+                    break
+                last_pk = ids[-1]
+                games = list(Game.objects.select_for_update().filter(pk__in=ids).annotate(**real))
+
+                stale = []
+                for game in games:
+                    changed = False
+                    for name in COUNTER_FIELDS:
+                        attname = Game._meta.get_field(name).attname
+                        value = getattr(game, f"real_{name}")
+                        if getattr(game, attname) != value:
+                            setattr(game, attname, value)
+                            changed = True
+                    if changed:
+                        stale.append(game)
+                checked += len(games)
+                fixed += len(stale)
+                if stale and not opts["dry_run"]:
+                    Game.objects.bulk_update(stale, COUNTER_FIELDS)
+            self.stdout.write(f"checked {checked}, stale {fixed}")
+
+        verb = "would fix" if opts["dry_run"] else "fixed"
+        self.stdout.write(self.style.SUCCESS(f"done: checked {checked} games, {verb} {fixed}"))
@@ -0,0 +1,19 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from games.models import Game
+from games.services.replay import replay_game
+
+
+class Command(BaseCommand):
+    help = "Переиграть партию по логу бросков на той версии доски, на которой она шла."
+
+    def add_arguments(self, parser):
+        parser.add_argument("game_id")
+
+    def handle(self, *args, **opts):
+        game = Game.objects.filter(pk=opts["game_id"]).first()
+        if not game:
+            raise CommandError("game not found")
+        self.stdout.write(json.dumps(replay_game(game), ensure_ascii=False, indent=2))
@@ -0,0 +1,40 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from games.services.board_simulator import METRICS, simulate
+
+
+class Command(BaseCommand):
+    help = "Монте-Карло симуляция партий по текущей доске (NumPy, опционально в несколько процессов)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--games", type=int, default=1_000_000)
+        parser.add_argument("--batch-size", type=int, default=1_000_000)
+        parser.add_argument("--workers", type=int, default=1, help="Процессов для параллельных пачек")
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument("--max-rolls", type=int, default=5000, help="Обрезать партии длиннее N бросков")
+        parser.add_argument("--json", action="store_true", help="Вывести полный результат с гистограммами")
+
+    def handle(self, *args, **opts):
+        res = simulate(
+            max(1, opts["games"]),
+            batch_size=max(1, opts["batch_size"]),
+            workers=max(1, opts["workers"]),
+            seed=opts["seed"],
+            max_rolls=max(1, opts["max_rolls"]),
+        )
+        if opts["json"]:
+            self.stdout.write(json.dumps(res, ensure_ascii=False, indent=2))
+            return
+
+        self.stdout.write(
+            f"board {res['board_version']}: {res['games']:,} games in {res['elapsed_sec']}s "
+            f"({res['games_per_sec']:,.0f} games/s, truncated {res['truncated']})"
+        )
+        self.stdout.write(f"{'per game':<10}{'mean':>10}{'std':>10}{'p50':>6}{'p90':>6}{'p99':>6}{'max':>7}")
+        for m in METRICS:
+            d = res["metrics"][m]
+            self.stdout.write(
+                f"{m:<10}{d['mean']:>10.3f}{d['std']:>10.3f}{d['p50']:>6}{d['p90']:>6}{d['p99']:>6}{d['max']:>7}"
+            )
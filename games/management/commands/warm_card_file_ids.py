@@ -0,0 +1,66 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from games.services import board, tg_files, tg_send
+from games.services.images import image_url_from_board_name, normalize_image_relpath
+
+
+class Command(BaseCommand):
+    help = ("Загружает картинки всех карточек досок (settings.BOARDS) в служебный чат Telegram и запоминает "
+            "их file_id (TelegramFile): игрокам карточки уходят без upload. Уже загруженные версии файлов пропускает.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chat-id", default=getattr(settings, "TELEGRAM_STORAGE_CHAT_ID", None),
+                            help="Служебный чат для загрузки (по умолчанию TELEGRAM_STORAGE_CHAT_ID)")
+        parser.add_argument("--force", action="store_true", help="Загрузить заново, даже если file_id есть")
+        parser.add_argument("--dry-run", action="store_true", help="Только показать, что будет загружено")
+
+    def handle(self, *args, **opts):
+        token = getattr(settings, "TELEGRAM_BOT_TOKEN", None)
+        if not token:
+            raise CommandError("TELEGRAM_BOT_TOKEN is not set")
+        if not opts["chat_id"] and not opts["dry_run"]:
+            raise CommandError("--chat-id or TELEGRAM_STORAGE_CHAT_ID is required")
+
+        counts = {"cached": 0, "uploaded": 0, "missing": 0, "failed": 0}
+        for rel_img in self._card_images():
+            abs_path = tg_send._abs_path_from_rel(rel_img)
+            digest = tg_files.file_digest(abs_path) if abs_path else None
+            if not digest:
+                counts["missing"] += 1
+                self.stderr.write(f"missing file: {rel_img}")
+                continue
+            relpath = normalize_image_relpath(rel_img)
+            cached = tg_files.lookup(token, relpath, digest)
+            if cached and not opts["force"]:
+                counts["cached"] += 1
+                continue
+            if opts["dry_run"]:
+                counts["uploaded"] += 1
+                self.stdout.write(f"would upload {relpath}")
+                continue
+            if cached:
+                tg_files.forget(token, relpath, digest)
+            if tg_send.send_card_photo(token, opts["chat_id"], rel_img, relpath, disable_notification=True):
+                counts["uploaded"] += 1
+            else:
+                counts["failed"] += 1
+                self.stderr.write(f"upload failed: {relpath}")
+
+        self.stdout.write(json.dumps(counts))
+        if counts["failed"]:
+            raise CommandError(f"{counts['failed']} card image(s) were not uploaded")
+
+    def _card_images(self):
+        """Пути картинок клеток всех досок — в том виде, в каком их шлёт send_moves_sequentially."""
+        seen = []
+        for path in board.registry.configured_paths():
+            compiled = board.registry.get_by_path(path)
+            # у доски из артефакта (MappedBoard) нет списка cells — только доступ по номеру
+            for n in range(compiled.size):
+                rel_img = image_url_from_board_name(compiled.image_name(n))
+                if rel_img and rel_img not in seen:
+                    seen.append(rel_img)
+        return seen
@@ -0,0 +1,175 @@
+# Generated by Django 4.2.24 on 2026-10-16 22:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    """Изменения моделей, для которых раньше не было миграций (GameSettings, PendingQA, поля Game/Move)."""
+
+    dependencies = [
+        ('games', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameSettings',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payment_url', models.URLField(blank=True, help_text='Эту ссылку отправляем игроку, когда нужно оплатить игру.', verbose_name='Ссылка для оплаты')),
+                ('payment_message', models.TextField(blank=True, default='Щоб продовжити гру, потрібно оформити оплату за посиланням нижче 👇', help_text='Текст, который будет показан перед ссылкой на оплату.', verbose_name='Сообщение об оплате')),
+            ],
+            options={
+                'verbose_name': 'Настройки игры',
+                'verbose_name_plural': 'Настройки игры',
+            },
+        ),
+        migrations.CreateModel(
+            name='PendingQA',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_index', models.PositiveIntegerField(db_index=True)),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('card_sent', 'Карточка отправлена'), ('answered', 'Отвечено')], db_index=True, default='queued', max_length=16)),
+                ('card_text', models.TextField(blank=True, default='')),
+                ('question_text', models.TextField(blank=True, default='')),
+                ('answer_text', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='current_six_number',
+            field=models.IntegerField(default=0, verbose_name='Количество выпавших шестерок на данный момент'),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='interaction_state',
+            field=models.CharField(choices=[('idle', 'Свободно'), ('processing_queue', 'Раздаём очередь'), ('awaiting_answer', 'Ждём ответ')], db_index=True, default='idle', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='payment_status',
+            field=models.CharField(choices=[('not_paid', 'Не оплачено'), ('paid', 'Оплачено')], db_index=True, default='not_paid', max_length=16, verbose_name='Оплата'),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='user_game_intention',
+            field=models.TextField(blank=True, verbose_name='Игровое намерение пользователя'),
+        ),
+        migrations.AddField(
+            model_name='move',
+            name='answer_prompt_msg_id',
+            field=models.BigIntegerField(blank=True, db_index=True, help_text='message_id ForceReply-сообщения, на которое игрок должен ответить.', null=True, verbose_name='ID сообщения-запроса ответа'),
+        ),
+        migrations.AddField(
+            model_name='move',
+            name='image_url',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='move',
+            name='on_hold',
+            field=models.BooleanField(default=False, verbose_name='Остаться после 6'),
+        ),
+        migrations.AddField(
+            model_name='move',
+            name='player_answer',
+            field=models.TextField(blank=True, help_text='Текстовый ответ игрока на карточку хода.', null=True, verbose_name='Ответ игрока'),
+        ),
+        migrations.AddField(
+            model_name='move',
+            name='player_answer_at',
+            field=models.DateTimeField(blank=True, help_text='Когда игрок прислал ответ на карточку.', null=True, verbose_name='Время ответа'),
+        ),
+        migrations.AddField(
+            model_name='move',
+            name='qa_combo_id',
+            field=models.UUIDField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='move',
+            name='qa_sequence_in_combo',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='move',
+            name='qa_status',
+            field=models.CharField(choices=[('none', 'Нет'), ('queued', 'В очереди'), ('card_sent', 'Карточка отправлена'), ('answered', 'Отвечено')], db_index=True, default='none', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='move',
+            name='tg_from_id',
+            field=models.BigIntegerField(blank=True, db_index=True, null=True, verbose_name='Telegram From ID'),
+        ),
+        migrations.AddField(
+            model_name='move',
+            name='tg_message_date',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Дата сообщения (UTC)'),
+        ),
+        migrations.AddField(
+            model_name='move',
+            name='webhook_payload',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Webhook payload'),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='is_active',
+            field=models.BooleanField(db_index=True, default=True, verbose_name='Актуальная'),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='status',
+            field=models.CharField(choices=[('active', 'Активна'), ('paused', 'Пауза'), ('finished', 'Завершена'), ('inactive', 'Неактивна'), ('aborted', 'Прервана'), ('idle', 'Свободно'), ('processing_queue', 'Раздаём очередь'), ('awaiting_answer', 'Ждём ответ на карточку')], db_index=True, default='active', max_length=16, verbose_name='Статус'),
+        ),
+        migrations.AlterField(
+            model_name='move',
+            name='event_type',
+            field=models.CharField(choices=[('normal', 'Обычный ход'), ('snake', 'Змея'), ('ladder', 'Стрела/лестница'), ('bonus', 'Бонус'), ('penalty', 'Штраф'), ('long_move', 'Довгий хід (4+ шісток)'), ('none', 'None'), ('queued', 'Queued'), ('card_sent', 'Card Sent'), ('answered', 'Answered')], default='normal', max_length=16, verbose_name='Событие'),
+        ),
+        migrations.AlterField(
+            model_name='move',
+            name='note',
+            field=models.CharField(blank=True, help_text='Короткая заметка к ходу', max_length=120, null=True, verbose_name='Заметка'),
+        ),
+        migrations.AlterField(
+            model_name='move',
+            name='rolled',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['expires_at'], name='games_game_expires_eebfe9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='move',
+            index=models.Index(fields=['tg_from_id'], name='games_move_tg_from_604fc7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='move',
+            index=models.Index(fields=['tg_message_date'], name='games_move_tg_mess_cd14fc_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='game',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('player',), name='uniq_active_game_per_player'),
+        ),
+        migrations.AddField(
+            model_name='pendingqa',
+            name='game',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_qas', to='games.game'),
+        ),
+        migrations.AddField(
+            model_name='pendingqa',
+            name='move',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='qa_items', to='games.move'),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='awaiting_answer_item',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='games_waiting', to='games.pendingqa'),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0002_model_catch_up'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='board_version',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=12, verbose_name='Версия доски'),
+        ),
+    ]
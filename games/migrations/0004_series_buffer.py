@@ -0,0 +1,48 @@
+from django.db import migrations
+
+# Поля буфера серии — копия rules_engine.PlannedMove.ROW на момент миграции
+SERIES_FIELDS = ("move_number", "rolled", "from_cell", "to_cell", "event_type", "note", "applied_rules",
+                 "image_url", "qa_sequence_in_combo")
+
+
+def hold_rows_to_meta(apps, schema_editor):
+    """Незавершённые серии (Move.on_hold=True) переносим в буфер Game.meta["series"]."""
+    Game = apps.get_model("games", "Game")
+    Move = apps.get_model("games", "Move")
+    held = Move.objects.filter(on_hold=True).order_by("game_id", "move_number")
+    rows = {}
+    for mv in held.iterator():
+        rows.setdefault(mv.game_id, []).append([
+            mv.move_number, mv.rolled, mv.from_cell, mv.to_cell, mv.event_type, mv.note,
+            (mv.state_snapshot or {}).get("applied_rules", []), mv.image_url, mv.qa_sequence_in_combo,
+        ])
+    for game in Game.objects.filter(pk__in=list(rows)):
+        meta = dict(game.meta or {})
+        meta["series"] = rows[game.pk]
+        game.meta = meta
+        game.save(update_fields=["meta"])
+    held.delete()
+
+
+def meta_to_hold_rows(apps, schema_editor):
+    Game = apps.get_model("games", "Game")
+    Move = apps.get_model("games", "Move")
+    for game in Game.objects.filter(meta__has_key="series"):
+        meta = dict(game.meta or {})
+        for row in meta.pop("series") or []:
+            data = dict(zip(SERIES_FIELDS, row))
+            rules = data.pop("applied_rules") or []
+            Move.objects.create(game=game, on_hold=True, state_snapshot={"applied_rules": rules}, **data)
+        game.meta = meta
+        game.save(update_fields=["meta"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("games", "0003_game_board_version"),
+    ]
+
+    operations = [
+        migrations.RunPython(hold_rows_to_meta, meta_to_hold_rows),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.24 on 2026-10-16 23:00
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def fill_counters(apps, schema_editor):
+    """Первичное заполнение счётчиков одним UPDATE (то же считает manage.py repair_game_counters)."""
+    Game = apps.get_model("games", "Game")
+    Move = apps.get_model("games", "Move")
+    confirmed = Move.objects.filter(game=OuterRef("pk"), on_hold=False)
+    unanswered = confirmed.filter(player_answer__isnull=True)
+
+    def count(qs):
+        return Coalesce(Subquery(qs.order_by().values("game").annotate(n=Count("pk")).values("n")[:1],
+                                 output_field=IntegerField()), Value(0))
+
+    Game.objects.update(
+        confirmed_moves=count(confirmed),
+        unanswered_moves=count(unanswered),
+        next_unanswered_move=Subquery(unanswered.order_by("move_number").values("pk")[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0004_series_buffer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='confirmed_moves',
+            field=models.PositiveIntegerField(default=0, verbose_name='Подтверждённых ходов'),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='next_unanswered_move',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='games.move', verbose_name='Первый ход без ответа'),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='unanswered_moves',
+            field=models.PositiveIntegerField(default=0, verbose_name='Ходов без ответа'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
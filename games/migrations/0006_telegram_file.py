@@ -0,0 +1,33 @@
+# Generated by Django 4.2.24 on 2026-10-16 23:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0005_game_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelegramFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bot_id', models.CharField(max_length=32, verbose_name='Бот')),
+                ('relpath', models.CharField(max_length=255, verbose_name='Файл')),
+                ('sha256', models.CharField(max_length=64, verbose_name='SHA-256')),
+                ('file_id', models.CharField(max_length=255, verbose_name='file_id')),
+                ('file_unique_id', models.CharField(blank=True, default='', max_length=64, verbose_name='file_unique_id')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Файл в Telegram',
+                'verbose_name_plural': 'Файлы в Telegram',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='telegramfile',
+            constraint=models.UniqueConstraint(fields=('bot_id', 'relpath', 'sha256'), name='uniq_telegram_file'),
+        ),
+    ]
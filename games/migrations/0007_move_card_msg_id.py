@@ -0,0 +1,18 @@
+# Generated by Django 4.2.24 on 2026-10-16 23:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0006_telegram_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='move',
+            name='card_msg_id',
+            field=models.BigIntegerField(blank=True, help_text='message_id карточки хода в чате (записывает диспетчер исходящих сообщений).', null=True, verbose_name='ID сообщения с карточкой'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.24 on 2026-10-16 23:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0007_move_card_msg_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BoardSnapshot',
+            fields=[
+                ('version', models.CharField(max_length=12, primary_key=True, serialize=False, verbose_name='Версия')),
+                ('source', models.TextField(verbose_name='board.json')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Версия доски',
+                'verbose_name_plural': 'Версии доски',
+            },
+        ),
+    ]
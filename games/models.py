@@ -57,6 +57,8 @@ class Game(models.Model):
     )
 
     meta = models.JSONField('Метаданные', default=dict, blank=True)
+    # хэш board.json, на котором начата игра (ходы считаются по этой версии доски)
+    board_version = models.CharField('Версия доски', max_length=12, blank=True, default='', db_index=True)
 
     started_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -69,6 +71,18 @@ class Game(models.Model):
         db_index=True,
     )
 
+    # Счётчики ходов: ведут apply_roll (запись ходов) и game_utils.save_answer (ответы),
+    # пересчитываются командой repair_game_counters. Вебхук читает их вместо COUNT по Move.
+    confirmed_moves = models.PositiveIntegerField('Подтверждённых ходов', default=0)
+    unanswered_moves = models.PositiveIntegerField('Ходов без ответа', default=0)
+    next_unanswered_move = models.ForeignKey(
+        'Move',
+        null=True, blank=True,
+        on_delete=models.SET_NULL,
+        related_name='+',
+        verbose_name='Первый ход без ответа',
+    )
+
     # текущий элемент очереди, на который ждём ответ
     awaiting_answer_item = models.ForeignKey(
         'PendingQA',
@@ -129,6 +143,7 @@ class Game(models.Model):
 
     @classmethod
     def start_new(cls, player, game_type: str = '', game_name: str = '', meta: dict = None, ttl_days: int = 30):
+        from games.services.board import pin_board_version
         meta = meta or {}
         # деактивируем все прочие актуальные
         cls.objects.filter(player=player, is_active=True).update(is_active=False, status=cls.Status.INACTIVE)
@@ -137,6 +152,7 @@ class Game(models.Model):
             game_type=game_type,
             game_name=game_name,
             meta=meta,
+            board_version=pin_board_version(game_type, meta.get("locale")),
             status=cls.Status.ACTIVE,
             is_active=True,
             current_six_number=0,
@@ -153,7 +169,7 @@ class Game(models.Model):
             raise ValueError("Игра неактивна: срок действия истёк.")
         state_after = state_after or {}
         next_num = self.last_move_number + 1
-        Move.objects.create(
+        move = Move.objects.create(
             game=self,
             move_number=next_num,
             rolled=rolled,
@@ -165,7 +181,12 @@ class Game(models.Model):
         )
         self.last_move_number = next_num
         self.current_cell = to_cell
-        self.save(update_fields=['last_move_number', 'current_cell', 'updated_at'])
+        self.confirmed_moves += 1
+        self.unanswered_moves += 1
+        if self.next_unanswered_move_id is None:
+            self.next_unanswered_move = move
+        self.save(update_fields=['last_move_number', 'current_cell', 'confirmed_moves', 'unanswered_moves',
+                                 'next_unanswered_move', 'updated_at'])
 
     def pause(self):
         self.status = self.Status.PAUSED
@@ -227,6 +248,12 @@ class Move(models.Model):
         verbose_name="ID сообщения-запроса ответа",
         help_text="message_id ForceReply-сообщения, на которое игрок должен ответить."
     )
+    card_msg_id = models.BigIntegerField(
+        null=True,
+        blank=True,
+        verbose_name="ID сообщения с карточкой",
+        help_text="message_id карточки хода в чате (записывает диспетчер исходящих сообщений)."
+    )
 
     # Сырой вебхук (весь JSON как есть)
     webhook_payload = models.JSONField('Webhook payload', default=dict, blank=True)
@@ -291,4 +318,43 @@ class GameSettings(models.Model):
         verbose_name_plural = 'Настройки игры'
 
     def __str__(self):
-        return 'Настройки игры'
\ No newline at end of file
+        return 'Настройки игры'
+
+class TelegramFile(models.Model):
+    """
+    file_id картинки карточки в Telegram: после первой загрузки шлём photo=<file_id> без upload.
+    Ключ — бот, относительный путь и sha256 файла: поменялся файл — другой хэш, загружаем заново.
+    """
+    bot_id = models.CharField('Бот', max_length=32)            # числовая часть токена до ':'
+    relpath = models.CharField('Файл', max_length=255)
+    sha256 = models.CharField('SHA-256', max_length=64)
+    file_id = models.CharField('file_id', max_length=255)
+    file_unique_id = models.CharField('file_unique_id', max_length=64, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Файл в Telegram'
+        verbose_name_plural = 'Файлы в Telegram'
+        constraints = [
+            models.UniqueConstraint(fields=['bot_id', 'relpath', 'sha256'], name='uniq_telegram_file'),
+        ]
+
+    def __str__(self):
+        return f'{self.relpath} @ {self.bot_id}'
+
+
+class BoardSnapshot(models.Model):
+    """
+    Исходник доски (board.json) версии, за которой закреплены игры: после деплоя с новым board.json
+    старые игры доигрываются на своей версии, даже если её файла уже нет.
+    """
+    version = models.CharField('Версия', max_length=12, primary_key=True)  # board_version()
+    source = models.TextField('board.json')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Версия доски'
+        verbose_name_plural = 'Версии доски'
+
+    def __str__(self):
+        return self.version
@@ -1,10 +1,28 @@
+import hashlib
 import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
 from pathlib import Path
-from typing import Any, Dict, Optional, Tuple, List
+from typing import Any, Callable, Dict, Optional, Tuple, List
 
-DATA_PATH = Path(__file__).resolve().parent.parent / "data" / "board.json"
+log = logging.getLogger(__name__)
+
+DATA_PATH = (Path(__file__).resolve().parent.parent / "data" / "board.json").resolve()
 _cache = {"data": None, "mtime": None}
 
+# Клетки 1..72 (+ нулевой слот под старт), индекс кортежа == номер клетки
+BOARD_SIZE = 72
+# Как часто (сек) фоновый поток сверяет mtime файлов досок
+RELOAD_CHECK_INTERVAL = 2.0
+
+_IMAGE_KEYS = ("image", "image_url", "img", "image_file", "filename", "file", "path", "url")
+_JUMP_KEYS = ("to", "goto", "go_to", "target", "end", "next", "to_cell", "dest", "destination")
+
+
 def get_board():
     st = DATA_PATH.stat().st_mtime
     if _cache["data"] is None or _cache["mtime"] != st:
@@ -13,11 +31,6 @@ def get_board():
             _cache["mtime"] = st
     return _cache["data"]
 
-def get_cell(n: int):
-    board = get_board()
-    # board — либо массив объектов, либо { "board": [...] }
-    cells = board["board"] if isinstance(board, dict) and "board" in board else board
-    return next((c for c in cells if int(c.get("n") or c.get("cell")) == n), None)
 
 def _to_int(v: Any) -> Optional[int]:
     if isinstance(v, int):
@@ -26,79 +39,547 @@ def _to_int(v: Any) -> Optional[int]:
         return int(v.strip())
     return None
 
-def get_jump_target(n: int) -> Optional[int]:
+
+# ---------- Скомпилированная доска ----------
+
+class BoardCell:
+    """Одна клетка доски: исходный dict из board.json + заранее вычисленные поля."""
+    __slots__ = ("n", "data", "title", "image", "jump_to")
+
+    def __init__(self, n: int, data: Optional[dict], title: str, image: Optional[str], jump_to: Optional[int]):
+        self.n = n
+        self.data = data
+        self.title = title
+        self.image = image
+        self.jump_to = jump_to
+
+    def __repr__(self):
+        return f"BoardCell({self.n}, jump_to={self.jump_to})"
+
+
+class CompiledBoard:
     """
-    Возвращает конечную клетку перехода для клетки n, если на ней есть змея/лестница/стрелка.
-    Если перехода нет — возвращает None.
-    НИЧЕГО в формате board.json не меняет, использует get_cell()/get_board().
-    """
-    cell = get_cell(n)
-
-    # 1) Если структура клеток объектная — попробуем вытащить переход из самой клетки:
-    if isinstance(cell, dict):
-        # самые частые прямые ключи
-        for key in ("to", "goto", "go_to", "target", "end", "next", "to_cell", "dest", "destination"):
-            v = _to_int(cell.get(key))
-            if v is not None and v != n:
-                return v
-
-        # вложенные варианты: arrow/ladder/snake/portal/warp и т.п.
-        for nk in ("arrow", "ladder", "snake", "portal", "warp"):
-            sub = cell.get(nk)
-            if isinstance(sub, dict):
-                for k in ("to", "target", "end", "goto", "jump_to"):
-                    v = _to_int(sub.get(k))
-                    if v is not None and v != n:
-                        return v
-
-        # fallback: вдруг переход лежит во вложенном объекте под произвольным ключом
-        for v in cell.values():
-            if isinstance(v, dict):
-                cand = _to_int(v.get("to") or v.get("target") or v.get("end"))
-                if cand is not None and cand != n:
-                    return cand
-
-    # 2) Если борда — мапа {"16": 6} (или завернута {"board": {...}}) — прочитаем напрямую
-    board = get_board()
-    mapping = board.get("board") if isinstance(board, dict) and "board" in board else board
-    if isinstance(mapping, dict):
-        v = _to_int(mapping.get(str(n)))
+    Индекс доски: кортеж фиксированной длины, где cells[n] — клетка n (или None).
+    Все поиски — O(1) без обращения к файловой системе.
+    version — хэш содержимого board.json, по нему ключуются производные кэши.
+    """
+    __slots__ = ("cells", "mtime", "version")
+
+    def __init__(self, cells: Tuple[Optional[BoardCell], ...], mtime: Optional[float] = None, version: str = ""):
+        self.cells = cells
+        self.mtime = mtime
+        self.version = version
+
+    @property
+    def size(self) -> int:
+        return len(self.cells)
+
+    def cell(self, n: int) -> Optional[BoardCell]:
+        if n < 0:
+            return None
+        try:
+            return self.cells[n]
+        except IndexError:
+            return None
+
+    def jump_target(self, n: int) -> Optional[int]:
+        c = self.cell(n)
+        return c.jump_to if c is not None else None
+
+    def image_name(self, n: int) -> Optional[str]:
+        c = self.cell(n)
+        return c.image if c is not None else None
+
+    def title(self, n: int) -> str:
+        c = self.cell(n)
+        return c.title if c is not None else f"Клетка {n}"
+
+
+def _extract_jump_target(cell: Any, n: int) -> Optional[int]:
+    """Переход из самой клетки (объектный формат): прямые ключи, вложенные объекты, fallback."""
+    if not isinstance(cell, dict):
+        return None
+
+    # самые частые прямые ключи
+    for key in _JUMP_KEYS:
+        v = _to_int(cell.get(key))
         if v is not None and v != n:
             return v
 
+    # вложенные варианты: arrow/ladder/snake/portal/warp и т.п.
+    for nk in ("arrow", "ladder", "snake", "portal", "warp"):
+        sub = cell.get(nk)
+        if isinstance(sub, dict):
+            for k in ("to", "target", "end", "goto", "jump_to"):
+                v = _to_int(sub.get(k))
+                if v is not None and v != n:
+                    return v
+
+    # fallback: вдруг переход лежит во вложенном объекте под произвольным ключом
+    for v in cell.values():
+        if isinstance(v, dict):
+            cand = _to_int(v.get("to") or v.get("target") or v.get("end"))
+            if cand is not None and cand != n:
+                return cand
+    return None
+
+
+def _extract_image_name(cell: Any) -> Optional[str]:
+    if not isinstance(cell, dict):
+        return None
+    for k in _IMAGE_KEYS:
+        v = cell.get(k)
+        if isinstance(v, str) and v.strip():
+            return v.strip()
+    for nk in ("media", "asset", "picture", "card"):
+        sub = cell.get(nk)
+        if isinstance(sub, dict):
+            for k in _IMAGE_KEYS:
+                v = sub.get(k)
+                if isinstance(v, str) and v.strip():
+                    return v.strip()
     return None
 
+
+def compile_board(board: Any, mtime: Optional[float] = None) -> CompiledBoard:
+    """Собрать CompiledBoard из распарсенного board.json (массив клеток, {"board": [...]} или мапа {"16": 6})."""
+    raw = board["board"] if isinstance(board, dict) and "board" in board else board
+
+    by_n: Dict[int, dict] = {}
+    mapping: Dict[int, int] = {}
+    if isinstance(raw, list):
+        for c in raw:
+            if not isinstance(c, dict):
+                continue
+            n = _to_int(c.get("n") or c.get("cell"))
+            # как и раньше — побеждает первое вхождение номера
+            if n is not None and n >= 0 and n not in by_n:
+                by_n[n] = c
+    elif isinstance(raw, dict):
+        for k, v in raw.items():
+            n, to = _to_int(k), _to_int(v)
+            if n is not None and to is not None and to != n:
+                mapping[n] = to
+
+    size = max([BOARD_SIZE, *by_n.keys(), *mapping.keys()]) + 1
+    cells: List[Optional[BoardCell]] = [None] * size
+    for n in range(size):
+        data = by_n.get(n)
+        if data is None and n not in mapping:
+            continue
+        jump_to = _extract_jump_target(data, n)
+        if jump_to is None:
+            jump_to = mapping.get(n)
+        title = (data or {}).get("title") or (data or {}).get("name") or f"Клетка {n}"
+        cells[n] = BoardCell(n, data, title, _extract_image_name(data), jump_to)
+
+    return CompiledBoard(tuple(cells), mtime=mtime, version=board_version(board))
+
+
+def validate_board(board: Any) -> List[str]:
+    """Проверка board.json перед сборкой артефакта. Возвращает список ошибок (пустой — всё ок)."""
+    raw = board["board"] if isinstance(board, dict) and "board" in board else board
+    if not isinstance(raw, list):
+        return ["board.json: ожидается массив клеток или {\"board\": [...]}"]
+
+    errors: List[str] = []
+    seen = set()
+    for i, c in enumerate(raw):
+        if not isinstance(c, dict):
+            errors.append(f"#{i}: клетка должна быть объектом")
+            continue
+        n = _to_int(c.get("n") or c.get("cell"))
+        if n is None or not 1 <= n <= BOARD_SIZE:
+            errors.append(f"#{i}: номер клетки вне 1..{BOARD_SIZE}: {c.get('n')!r}")
+            continue
+        if n in seen:
+            errors.append(f"клетка {n}: дубликат")
+        seen.add(n)
+        if not str(c.get("title") or c.get("name") or "").strip():
+            errors.append(f"клетка {n}: пустой title")
+        ladder_to, snake_to = c.get("ladder_to"), c.get("snake_to")
+        for key, to in (("ladder_to", ladder_to), ("snake_to", snake_to)):
+            if to in (None, ""):
+                continue
+            to = _to_int(to)
+            if to is None or not 1 <= to <= BOARD_SIZE:
+                errors.append(f"клетка {n}: {key} вне 1..{BOARD_SIZE}")
+            elif key == "ladder_to" and to <= n:
+                errors.append(f"клетка {n}: ladder_to должен вести вверх")
+            elif key == "snake_to" and to >= n:
+                errors.append(f"клетка {n}: snake_to должен вести вниз")
+        if ladder_to not in (None, "") and snake_to not in (None, ""):
+            errors.append(f"клетка {n}: одновременно ladder_to и snake_to")
+
+    missing = sorted(set(range(1, BOARD_SIZE + 1)) - seen)
+    if missing:
+        errors.append(f"нет клеток: {missing}")
+    return errors
+
+
+def board_version(board: Any) -> str:
+    """Короткий хэш содержимого доски (не зависит от mtime и форматирования файла)."""
+    blob = json.dumps(board, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()[:12]
+
+
+# Версии досок в памяти (игры закреплены за версией, на которой начались) — LRU на BOARD_VERSIONS_CACHE;
+# версии, загруженные в реестр, не вытесняются. Вытесненную версию при надобности поднимет BoardSnapshot.
+_versions: "OrderedDict[str, Any]" = OrderedDict()
+# версия -> как прочитать её исходник (для BoardSnapshot)
+_version_sources: Dict[str, Callable[[], bytes]] = {}
+# кто держит производные кэши по версии (таблицы переходов, alt-правила, карточки) — чистим при вытеснении
+_evict_hooks: List[Callable[[str], None]] = []
+_lock = threading.Lock()
+_pinned: ContextVar = ContextVar("pinned_board", default=None)
+_watcher = {"thread": None}
+
+
+def _setting(name: str, default: Any = None) -> Any:
+    from django.conf import settings
+    return getattr(settings, name, default)
+
+
+def _setting_path(name: str) -> Optional[Path]:
+    path = _setting(name)
+    return Path(path) if path else None
+
+
+def _save_snapshot(version: str) -> None:
+    """
+    Исходник версии — в таблицу BoardSnapshot: по ней версию поднимет любой процесс, в том числе после деплоя,
+    когда файла этой версии уже нет. Без кэша «уже записано» в процессе: транзакция создания игры может
+    откатиться вместе со снапшотом — проверяем таблицу (один SELECT при создании игры).
+    """
+    read_source = _version_sources.get(version)
+    if read_source is None:
+        return
+    from games.models import BoardSnapshot
+    if not BoardSnapshot.objects.filter(version=version).exists():
+        text = read_source().decode("utf-8")
+        if board_version(json.loads(text)) != version:
+            # файл успели переписать — снапшот этой версии запишет процесс, который её ещё помнит
+            log.warning("board %s changed on disk, snapshot of %s skipped", version, version)
+            return
+        BoardSnapshot.objects.get_or_create(version=version, defaults={"source": text})
+
+
+def on_version_evicted(hook: Callable[[str], None]) -> Callable[[str], None]:
+    """Подписать кэш, ключованный версией доски, на вытеснение версии из памяти."""
+    _evict_hooks.append(hook)
+    return hook
+
+
+def _trim_versions() -> None:
+    """Сверх BOARD_VERSIONS_CACHE — вытесняем давно не нужные версии (кроме загруженных в реестр) и их кэши."""
+    limit = max(1, int(_setting("BOARD_VERSIONS_CACHE", 16)))
+    live = registry.loaded_versions()
+    evicted = []
+    with _lock:
+        for version in list(_versions):
+            if len(_versions) <= limit:
+                break
+            if version in live:
+                continue
+            del _versions[version]
+            _version_sources.pop(version, None)
+            evicted.append(version)
+    for version in evicted:
+        for hook in _evict_hooks:
+            hook(version)
+
+
+def _register(compiled, read_source: Callable[[], bytes]):
+    with _lock:
+        known = _versions.get(compiled.version)
+        if known is not None and known.mtime == compiled.mtime:
+            _versions.move_to_end(compiled.version)
+            return known
+        _versions[compiled.version] = compiled
+        _versions.move_to_end(compiled.version)
+        _version_sources[compiled.version] = read_source
+    _trim_versions()
+    return compiled
+
+
+def artifact_path_for(source: Path) -> Optional[Path]:
+    """Куда build_board кладёт артефакт для файла доски: BOARD_ARTIFACT_PATH для board.json, рядом — для остальных."""
+    base = _setting_path("BOARD_ARTIFACT_PATH")
+    if base is None:
+        return None
+    if Path(source).resolve() == DATA_PATH:
+        return base
+    return base.with_name(f"{base.stem}-{Path(source).stem}{base.suffix}")
+
+
+def _load_compiled(source: Path, mtime: float):
+    """
+    Собранный при деплое артефакт (mmap), если он соответствует файлу доски, — board.json тогда не читаем;
+    иначе — компиляция из JSON.
+    """
+    path = artifact_path_for(source)
+    if path is not None:
+        from games.services.board_artifact import load_artifact
+        mapped = load_artifact(path, source)
+        if mapped is not None:
+            mapped.mtime = mtime
+            return _register(mapped, source.read_bytes)
+    raw = source.read_bytes()
+    return _register(compile_board(json.loads(raw.decode("utf-8")), mtime=mtime), lambda: raw)
+
+
+class BoardSource:
+    """Один файл доски и его текущая скомпилированная версия."""
+    __slots__ = ("path", "board")
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.board = None
+
+    def reload_if_changed(self):
+        mtime = self.path.stat().st_mtime
+        if self.board is None or self.board.mtime != mtime:
+            self.board = _load_compiled(self.path, mtime)
+        return self.board
+
+
+def normalize_locale(locale: Optional[str]) -> str:
+    """'uk-UA' / 'uk_UA' / 'UK' -> 'uk'; пусто — BOARD_DEFAULT_LOCALE."""
+    loc = (locale or "").strip().lower().replace("_", "-").split("-")[0]
+    return loc or _setting("BOARD_DEFAULT_LOCALE", "uk")
+
+
+class BoardRegistry:
+    """
+    Доски по (game_type, locale) из settings.BOARDS и ограниченный LRU скомпилированных досок.
+    Поиск файла: (game_type, locale) -> ("", locale) -> (game_type, локаль по умолчанию) -> board.json.
+    """
+
+    def __init__(self):
+        self._sources: "OrderedDict[Path, BoardSource]" = OrderedDict()
+        self._resolved: Dict[Tuple[str, str], Path] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def resolve_path(self, game_type: str = "", locale: Optional[str] = None) -> Path:
+        key = (game_type or "", normalize_locale(locale))
+        path = self._resolved.get(key)
+        if path is not None:
+            return path
+        boards = _setting("BOARDS", {}) or {}
+        default_loc = normalize_locale(None)
+        name = None
+        for cand in (key, ("", key[1]), (key[0], default_loc), ("", default_loc)):
+            name = boards.get(cand)
+            if name:
+                break
+        path = (DATA_PATH.parent / name).resolve() if name else DATA_PATH
+        self._resolved[key] = path
+        return path
+
+    def configured_paths(self) -> List[Path]:
+        """Все файлы досок из settings.BOARDS (+ board.json по умолчанию)."""
+        paths = [DATA_PATH]
+        for name in (_setting("BOARDS", {}) or {}).values():
+            path = (DATA_PATH.parent / name).resolve()
+            if path not in paths:
+                paths.append(path)
+        return paths
+
+    def get(self, game_type: str = "", locale: Optional[str] = None):
+        return self.get_by_path(self.resolve_path(game_type, locale))
+
+    def get_by_path(self, path: Path):
+        with self._lock:
+            src = self._sources.get(path)
+            if src is not None and src.board is not None:
+                self._sources.move_to_end(path)
+                self.hits += 1
+                return src.board
+            self.misses += 1
+        self._start_watcher()
+
+        src = BoardSource(path)
+        board = src.reload_if_changed()
+        evicted = False
+        with self._lock:
+            self._sources[path] = src
+            self._sources.move_to_end(path)
+            while len(self._sources) > max(1, int(_setting("BOARD_REGISTRY_SIZE", 8))):
+                self._sources.popitem(last=False)
+                self.evictions += 1
+                evicted = True
+        if evicted and self is registry:
+            _trim_versions()  # версия вытесненной доски больше не защищена реестром
+        return board
+
+    def loaded_versions(self) -> set:
+        """Версии досок, загруженных в реестр сейчас (их из памяти не вытесняем)."""
+        with self._lock:
+            return {src.board.version for src in self._sources.values() if src.board is not None}
+
+    def refresh(self) -> None:
+        """Перечитать изменившиеся файлы загруженных досок."""
+        with self._lock:
+            sources = list(self._sources.values())
+        for src in sources:
+            try:
+                src.reload_if_changed()
+            except Exception:
+                pass  # битый файл посреди правки — остаёмся на прежней версии
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sources.clear()
+            self._resolved.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            loaded = [{"path": src.path.name, "version": src.board.version} for src in self._sources.values()
+                      if src.board is not None]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "loaded": loaded,
+            "versions": len(_versions),
+        }
+
+    def _start_watcher(self) -> None:
+        with _lock:
+            if _watcher["thread"] is None:
+                t = threading.Thread(target=_watch_boards, name="board-watcher", daemon=True)
+                _watcher["thread"] = t
+                t.start()
+
+
+registry = BoardRegistry()
+
+
+def _watch_boards() -> None:
+    """Фоновая проверка файлов досок: раз в RELOAD_CHECK_INTERVAL сверяем mtime и подменяем текущие версии."""
+    while True:
+        time.sleep(RELOAD_CHECK_INTERVAL)
+        registry.refresh()
+
+
+def get_compiled_board(game_type: str = "", locale: Optional[str] = None) -> CompiledBoard:
+    """
+    Доска для текущего контекста: закреплённая через use_board_version(), иначе — из реестра по game_type/locale.
+    На горячем пути нет обращений к ФС — файлы досок проверяет фоновый поток.
+    """
+    pinned = _pinned.get()
+    return pinned if pinned is not None else registry.get(game_type, locale)
+
+
+def current_board_version(game_type: str = "", locale: Optional[str] = None) -> str:
+    """Версия актуальной доски для game_type/locale."""
+    return registry.get(game_type, locale).version
+
+
+def pin_board_version(game_type: str = "", locale: Optional[str] = None) -> str:
+    """
+    Версия актуальной доски для новой игры (только при создании игры, не в броске); её исходник сохраняется
+    в BoardSnapshot, чтобы игра на ней доигралась.
+    """
+    version = current_board_version(game_type, locale)
+    _save_snapshot(version)
+    return version
+
+
+def _board_or_current(version: Optional[str], game_type: str = "", locale: Optional[str] = None):
+    """Доска версии version; пустая или неизвестная версия — актуальная доска game_type/locale."""
+    board = get_board_by_version(version) if version else None
+    return board if board is not None else registry.get(game_type, locale)
+
+
+def board_for_game(game) -> CompiledBoard:
+    """Доска, на которой идёт игра: её версия, а если версия не записана — по game_type/locale."""
+    return _board_or_current(getattr(game, "board_version", ""), getattr(game, "game_type", "") or "",
+                             (getattr(game, "meta", None) or {}).get("locale"))
+
+
+def get_board_by_version(version: str):
+    """Доска конкретной версии: из памяти, иначе из BoardSnapshot; None если неизвестна."""
+    with _lock:
+        board = _versions.get(version)
+        if board is not None:
+            _versions.move_to_end(version)
+    if board is not None:
+        return board
+    from games.models import BoardSnapshot
+    source = BoardSnapshot.objects.filter(version=version).values_list("source", flat=True).first()
+    if source is None:
+        log.warning("board version %s not found (no BoardSnapshot)", version)
+        return None
+    compiled = compile_board(json.loads(source))
+    if compiled.version != version:
+        log.error("BoardSnapshot %s does not match its content (%s)", version, compiled.version)
+        return None
+    with _lock:
+        board = _versions.setdefault(version, compiled)
+    _trim_versions()
+    return board
+
+
+@contextmanager
+def use_board_version(version: Optional[str], game_type: str = "", locale: Optional[str] = None):
+    """
+    Закрепить доску версии version на время блока (для хода в игре, начатой на старой доске).
+    Пустая или неизвестная версия — текущая доска game_type/locale (как в board_for_game).
+    """
+    board = _board_or_current(version, game_type, locale)
+    with use_board(board):
+        yield board
+
+
+@contextmanager
+def use_board(board):
+    """Закрепить конкретную доску (CompiledBoard / MappedBoard) на время блока."""
+    token = _pinned.set(board)
+    try:
+        yield board
+    finally:
+        _pinned.reset(token)
+
+
+def get_cell(n: int, board=None):
+    # board — либо массив объектов, либо { "board": [...] }; возвращаем исходный dict клетки
+    c = (board or get_compiled_board()).cell(int(n))
+    return c.data if c is not None else None
+
+
+def get_jump_target(n: int) -> Optional[int]:
+    """
+    Возвращает конечную клетку перехода для клетки n, если на ней есть змея/лестница/стрелка.
+    Если перехода нет — возвращает None.
+    Переходы предвычислены в compile_board(), формат board.json не меняется.
+    """
+    return get_compiled_board().jump_target(int(n))
+
+
 def resolve_chain(start: int, max_steps: int = 100) -> Tuple[int, List[Tuple[int, int]]]:
     """
     Пройти по цепочке переходов, начиная с клетки start.
     Возвращает (final_cell, [(from, to), ...]).
     """
+    board = get_compiled_board()
     cur = start
     via: List[Tuple[int, int]] = []
     for _ in range(max_steps):
-        nxt = get_jump_target(cur)
+        nxt = board.jump_target(cur)
         if nxt is None or nxt == cur:
             break
         via.append((cur, nxt))
         cur = nxt
     return cur, via
 
-from typing import Optional
 
-def get_cell_image_name(n: int) -> Optional[str]:
-    cell = get_cell(n)
-    if not isinstance(cell, dict):
-        return None
-    for k in ("image", "image_url", "img", "image_file", "filename", "file", "path", "url"):
-        v = cell.get(k)
-        if isinstance(v, str) and v.strip():
-            return v.strip()
-    for nk in ("media", "asset", "picture", "card"):
-        sub = cell.get(nk)
-        if isinstance(sub, dict):
-            for k in ("image", "image_url", "img", "image_file", "filename", "file", "path", "url"):
-                v = sub.get(k)
-                if isinstance(v, str) and v.strip():
-                    return v.strip()
-    return None
+def get_cell_image_name(n: int, board=None) -> Optional[str]:
+    return (board or get_compiled_board()).image_name(int(n))
+
 
+def get_cell_title(n: int, board=None) -> str:
+    return (board or get_compiled_board()).title(int(n))
@@ -0,0 +1,214 @@
+"""
+Аналитика доски как поглощающей цепи Маркова.
+
+Состояние — то, от чего зависит исход следующего броска в GameEntryManager.apply_roll:
+  ("start", k)         — ещё на старте, собрано k шестёрок;
+  ("play", c)          — стоим на клетке c, серии нет;
+  ("series", s, c, k)  — серия из k шестёрок, начатая с клетки s, сейчас на c.
+Шаг цепи — один бросок кубика (один апдейт вебхука), включая проигнорированные.
+"""
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from games.services.board import get_compiled_board
+from games.services.entry_step_result import EntryStepResult
+from games.services.rules_engine import GameState, PlannedMove, step
+
+ROLLS = (1, 2, 3, 4, 5, 6)
+P_ROLL = 1.0 / len(ROLLS)
+# Начиная с 12 шестёрок длинный ход (6k + X) всегда упирается в 72 — дальше k не различаем
+MAX_SIXES = EntryStepResult.BOARD_MAX // 6
+
+State = Tuple
+Hops = Tuple[Tuple[int, int], ...]
+# (следующее состояние или None если партия завершена, клетки на которые встали, сработавшие правила)
+Outcome = Tuple[Optional[State], Tuple[int, ...], Hops]
+
+
+def _landed(final_cell: int, chain) -> Tuple[int, ...]:
+    """Клетки, которые получают карточку: начало каждого правила + итоговая."""
+    cells = [int(a) for a, _ in chain]
+    cells.append(int(final_cell))
+    return tuple(cells)
+
+
+def _hops(chain) -> Hops:
+    return tuple((int(a), int(b)) for a, b in chain)
+
+
+def _to_game_state(state: State) -> GameState:
+    kind = state[0]
+    if kind == "start":
+        return GameState(cell=0, six_count=state[1], at_start=True)
+    if kind == "play":
+        return GameState(cell=state[1], at_start=False)
+    _, s, c, k = state
+    # для исхода серии важно только, откуда она началась
+    return GameState(cell=c, six_count=k, at_start=False, series=(PlannedMove(0, 6, s, c),))
+
+
+def _from_game_state(gs: GameState) -> Optional[State]:
+    if gs.finished:
+        return None
+    if gs.at_start:
+        return ("start", min(gs.six_count, MAX_SIXES))
+    if gs.six_count == 0:
+        return ("play", gs.cell)
+    return ("series", gs.series[0].from_cell, gs.cell, min(gs.six_count, MAX_SIXES))
+
+
+def transition(state: State, rolled: int) -> Outcome:
+    """Исход одного броска из состояния state — тем же движком, что и в игре (rules_engine.step)."""
+    out = step(_to_game_state(state), rolled)
+    if out.status == "ignored":
+        return state, (), ()
+    landed: List[int] = []
+    hops: List[Tuple[int, int]] = []
+    for event in out.events:
+        if event.kind == "walk":
+            landed.extend(_landed(event.final, event.chain))
+            hops.extend(_hops(event.chain))
+    return _from_game_state(out.state), tuple(landed), tuple(hops)
+
+
+class BoardChain:
+    """
+    Поглощающая цепь Маркова для текущей доски.
+      states      — достижимые из старта transient-состояния;
+      Q           — переходы между ними (n×n), R — вероятность завершить партию (n);
+      transitions — (i, j | -1, p, landed) для подсчёта карточек по клеткам.
+    """
+
+    def __init__(self):
+        self.version = get_compiled_board().version
+        self.start: State = ("start", 0)
+        self.states: List[State] = []
+        self.index: Dict[State, int] = {}
+        self.transitions: List[Tuple[int, int, float, Tuple[int, ...]]] = []
+
+        queue = [self.start]
+        self._add(self.start)
+        while queue:
+            state = queue.pop()
+            i = self.index[state]
+            for rolled in ROLLS:
+                nxt, landed, _ = transition(state, rolled)
+                if nxt is None:
+                    self.transitions.append((i, -1, P_ROLL, landed))
+                    continue
+                if nxt not in self.index:
+                    self._add(nxt)
+                    queue.append(nxt)
+                self.transitions.append((i, self.index[nxt], P_ROLL, landed))
+
+        n = len(self.states)
+        self.Q = np.zeros((n, n))
+        self.R = np.zeros(n)
+        for i, j, p, _ in self.transitions:
+            if j < 0:
+                self.R[i] += p
+            else:
+                self.Q[i, j] += p
+
+    def _add(self, state: State) -> None:
+        self.index[state] = len(self.states)
+        self.states.append(state)
+
+    # ---------- решения ----------
+
+    def expected_rolls(self) -> float:
+        """Мат. ожидание числа бросков до завершения партии."""
+        n = len(self.states)
+        t = np.linalg.solve(np.eye(n) - self.Q, np.ones(n))
+        return float(t[self.index[self.start]])
+
+    def rolls_distribution(self, max_rolls: int = 1000, tail: float = 1e-9) -> np.ndarray:
+        """P(партия завершилась ровно на t-м броске), t = 1..; обрезаем, когда остаток < tail."""
+        v = np.zeros(len(self.states))
+        v[self.index[self.start]] = 1.0
+        out: List[float] = []
+        for _ in range(max_rolls):
+            out.append(float(v @ self.R))
+            v = v @ self.Q
+            if v.sum() < tail:
+                break
+        return np.array(out)
+
+    def expected_visits(self) -> np.ndarray:
+        """Ожидаемое число бросков из каждого состояния (строка фундаментальной матрицы для старта)."""
+        n = len(self.states)
+        e = np.zeros(n)
+        e[self.index[self.start]] = 1.0
+        return np.linalg.solve((np.eye(n) - self.Q).T, e)
+
+    def expected_landings(self) -> np.ndarray:
+        """Ожидаемое число карточек по клеткам за партию (индекс == номер клетки)."""
+        visits = self.expected_visits()
+        out = np.zeros(EntryStepResult.BOARD_MAX + 1)
+        for i, _, p, landed in self.transitions:
+            for cell in landed:
+                out[cell] += visits[i] * p
+        return out
+
+    def visit_probabilities(self) -> np.ndarray:
+        """P(игрок хотя бы раз встанет на клетку) за партию, индекс == номер клетки."""
+        n = len(self.states)
+        size = EntryStepResult.BOARD_MAX + 1
+        src = np.array([t[0] for t in self.transitions])
+        dst = np.array([t[1] for t in self.transitions])
+        prob = np.array([t[2] for t in self.transitions])
+        lands = np.zeros((len(self.transitions), size), dtype=bool)
+        for row, t in enumerate(self.transitions):
+            lands[row, list(t[3])] = True
+
+        start = self.index[self.start]
+        out = np.zeros(size)
+        for cell in range(1, size):
+            hit = lands[:, cell]
+            if not hit.any():
+                continue
+            # клетка c становится поглощающей: считаем вероятность до неё дойти
+            a = np.zeros(n)
+            np.add.at(a, src[hit], prob[hit])
+            keep = ~hit & (dst >= 0)
+            q = np.zeros((n, n))
+            np.add.at(q, (src[keep], dst[keep]), prob[keep])
+            out[cell] = np.linalg.solve(np.eye(n) - q, a)[start]
+        return out
+
+    def summary(self) -> dict:
+        dist = self.rolls_distribution()
+        cdf = np.cumsum(dist)
+        ticks = np.arange(1, len(dist) + 1)
+        mean = float((ticks * dist).sum())
+
+        def pct(q: float) -> int:
+            return int(np.searchsorted(cdf, q) + 1)
+
+        landings = self.expected_landings()
+        visits = self.visit_probabilities()
+        return {
+            "board_version": self.version,
+            "states": len(self.states),
+            "expected_rolls": round(self.expected_rolls(), 4),
+            "std_rolls": round(float(np.sqrt(((ticks - mean) ** 2 * dist).sum())), 4),
+            "rolls_percentiles": {"p50": pct(0.5), "p90": pct(0.9), "p99": pct(0.99)},
+            "rolls_distribution": [round(float(p), 8) for p in dist],
+            "expected_cards": round(float(landings.sum()), 4),
+            "cells": [
+                {
+                    "n": cell,
+                    "visit_probability": round(float(visits[cell]), 6),
+                    "expected_landings": round(float(landings[cell]), 6),
+                }
+                for cell in range(1, EntryStepResult.BOARD_MAX + 1)
+            ],
+        }
+
+
+def board_summary() -> dict:
+    """Сводка по текущей доске (пересчитывается; кэширование — на стороне вызывающего)."""
+    return BoardChain().summary()
@@ -0,0 +1,260 @@
+"""
+Бинарный артефакт доски: собирается при сборке образа (manage.py build_board),
+воркеры отображают его через mmap только на чтение — страницы общие для всех процессов.
+Таблица ходов читается прямо из отображённого буфера при каждом обращении, процесс её не копирует;
+клетки (72 штуки) разбираются лениво, каждая один раз, при первом обращении. board.json при старте
+не читается и не парсится —
+актуальность артефакта проверяется по размеру и mtime исходника, записанным в заголовок
+(не совпали — сверяем sha1 содержимого с хэшем из заголовка).
+В артефакте только таблица ходов по правилам (walks); pure-таблица TransitionTable по-прежнему
+строится в каждом процессе.
+
+Формат (little-endian):
+  HEADER
+  CELLS  — size записей CELL: present, jump_to, (offset, length) для title / image / JSON клетки
+  WALKS  — size × (MAX_ROLL + 1) записей WALK: final, hit_exit, число правил, индекс в HOPS
+  HOPS   — пары (from, to) всех цепочек правил
+  STRINGS — пул UTF-8 строк
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import mmap
+import struct
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from games.services.board import BoardCell
+
+MAGIC = b"LEELABRD"
+FORMAT_VERSION = 2
+MAX_ROLL = 6
+
+# magic, format, size, max_roll, version (12 ascii), sha1(board.json), размер и mtime_ns board.json,
+# offsets/длины секций
+HEADER = struct.Struct("<8sHHH12s20sQqIIIII")
+CELL = struct.Struct("<bhIIIIII")
+WALK = struct.Struct("<hBBI")
+HOP = struct.Struct("<hh")
+
+
+class ArtifactError(ValueError):
+    pass
+
+
+def source_digest(raw: bytes) -> bytes:
+    return hashlib.sha1(raw).digest()
+
+
+def _source_stat(source: Path) -> Tuple[int, int]:
+    st = Path(source).stat()
+    return st.st_size, st.st_mtime_ns
+
+
+def write_artifact(path: Path, compiled, walks, raw_source: bytes, source: Optional[Path] = None) -> int:
+    """
+    Пишет артефакт для скомпилированной доски compiled и таблицы walks[start][steps].
+    raw_source — байты board.json: по их хэшу воркер понимает, что артефакт не устарел;
+    source — сам файл: его размер и mtime в заголовке позволяют воркеру не читать board.json.
+    Возвращает размер файла в байтах.
+    """
+    strings = bytearray()
+
+    def put(s: Optional[str]) -> Tuple[int, int]:
+        if not s:
+            return 0, 0
+        b = s.encode("utf-8")
+        off = len(strings)
+        strings.extend(b)
+        return off, len(b)
+
+    size = len(compiled.cells)
+    cells = bytearray()
+    for n in range(size):
+        c = compiled.cells[n]
+        if c is None:
+            cells += CELL.pack(0, -1, 0, 0, 0, 0, 0, 0)
+            continue
+        data = json.dumps(c.data, ensure_ascii=False, separators=(",", ":")) if c.data is not None else ""
+        cells += CELL.pack(1, -1 if c.jump_to is None else c.jump_to, *put(c.title), *put(c.image), *put(data))
+
+    walk_rows = bytearray()
+    hops: List[Tuple[int, int]] = []
+    for start in range(size):
+        for steps in range(MAX_ROLL + 1):
+            entry = walks[start][steps] if start < len(walks) else None
+            if entry is None:
+                walk_rows += WALK.pack(-1, 0, 0, 0)
+                continue
+            final, chain, hit_exit = entry
+            walk_rows += WALK.pack(final, int(hit_exit), len(chain), len(hops))
+            hops.extend(chain)
+    hop_rows = b"".join(HOP.pack(a, b) for a, b in hops)
+
+    off_cells = HEADER.size
+    off_walks = off_cells + len(cells)
+    off_hops = off_walks + len(walk_rows)
+    off_strings = off_hops + len(hop_rows)
+    header = HEADER.pack(
+        MAGIC, FORMAT_VERSION, size, MAX_ROLL,
+        compiled.version.encode("ascii")[:12].ljust(12, b"\0"),
+        source_digest(raw_source),
+        *(_source_stat(source) if source is not None else (0, 0)),
+        off_cells, off_walks, off_hops, off_strings, len(strings),
+    )
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with tmp.open("wb") as f:
+        f.write(header + cells + walk_rows + hop_rows + bytes(strings))
+    tmp.replace(path)  # атомарно: воркер никогда не увидит полузаписанный файл
+    return path.stat().st_size
+
+
+# клетка ещё не разобрана из mmap (None — клетки нет)
+_UNREAD = object()
+
+
+class MappedWalks:
+    """
+    walks[start][steps] — то же, что TransitionTable.walks, но без копии в памяти процесса:
+    каждая запись распаковывается из mmap при обращении (несколько struct.unpack_from).
+    """
+
+    __slots__ = ("_board",)
+
+    def __init__(self, board: "MappedBoard"):
+        self._board = board
+
+    def __len__(self):
+        return self._board.size
+
+    def __getitem__(self, start: int) -> "_WalkRow":
+        if not 0 <= start < self._board.size:
+            raise IndexError(start)
+        return _WalkRow(self._board, start)
+
+    def __iter__(self):
+        return (self[n] for n in range(len(self)))
+
+
+class _WalkRow:
+    __slots__ = ("_board", "_start")
+
+    def __init__(self, board: "MappedBoard", start: int):
+        self._board, self._start = board, start
+
+    def __len__(self):
+        return MAX_ROLL + 1
+
+    def __getitem__(self, steps: int):
+        if not 0 <= steps <= MAX_ROLL:
+            raise IndexError(steps)
+        return self._board.walk(self._start, steps)
+
+    def __iter__(self):
+        return (self[n] for n in range(MAX_ROLL + 1))
+
+
+class MappedBoard:
+    """
+    Доска, отображённая из артефакта. Интерфейс как у CompiledBoard (cell / jump_target / image_name / title),
+    плюс walks. Записи таблицы ходов распаковываются из mmap при каждом обращении; клетка — один раз,
+    при первом обращении к ней (BoardCell в _cells), дальше поиск O(1), как у CompiledBoard.
+    """
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, fmt, size, max_roll, version, digest, src_size, src_mtime_ns,
+             self._off_cells, self._off_walks, self._off_hops, self._off_strings, _) = HEADER.unpack_from(self._mm, 0)
+        except struct.error as e:
+            raise ArtifactError(f"broken board artifact: {e}")
+        if magic != MAGIC or fmt != FORMAT_VERSION or max_roll != MAX_ROLL:
+            raise ArtifactError("unsupported board artifact")
+        self.path = Path(path)
+        self.size = size
+        self.version = version.rstrip(b"\0").decode("ascii")
+        self.source_digest = digest
+        self.source_stat = (src_size, src_mtime_ns)
+        self.mtime: Optional[float] = None
+        self.walks = MappedWalks(self)
+        self._cells: List = [_UNREAD] * size
+
+    def _str(self, off: int, length: int) -> str:
+        start = self._off_strings + off
+        return self._mm[start:start + length].decode("utf-8")
+
+    def _cell_row(self, n: int):
+        if n < 0 or n >= self.size:
+            return None
+        row = CELL.unpack_from(self._mm, self._off_cells + n * CELL.size)
+        return row if row[0] else None
+
+    def _decode_cell(self, n: int) -> Optional[BoardCell]:
+        row = self._cell_row(n)
+        if row is None:
+            return None
+        _, jump_to, t_off, t_len, i_off, i_len, d_off, d_len = row
+        data = json.loads(self._str(d_off, d_len)) if d_len else None
+        image = self._str(i_off, i_len) if i_len else None
+        return BoardCell(n, data, self._str(t_off, t_len), image, None if jump_to < 0 else jump_to)
+
+    def cell(self, n: int) -> Optional[BoardCell]:
+        if n < 0 or n >= self.size:
+            return None
+        c = self._cells[n]
+        if c is _UNREAD:
+            # гонка потоков безвредна: оба разберут одну и ту же клетку
+            c = self._cells[n] = self._decode_cell(n)
+        return c
+
+    def jump_target(self, n: int) -> Optional[int]:
+        c = self.cell(n)
+        return c.jump_to if c is not None else None
+
+    def image_name(self, n: int) -> Optional[str]:
+        c = self.cell(n)
+        return c.image if c is not None else None
+
+    def title(self, n: int) -> str:
+        c = self.cell(n)
+        return c.title if c is not None else f"Клетка {n}"
+
+    def walk(self, start: int, steps: int):
+        """(final, ((a, b), ...), hit_exit) или None — запись таблицы ходов прямо из mmap."""
+        final, hit_exit, count, hop_idx = WALK.unpack_from(
+            self._mm, self._off_walks + (start * (MAX_ROLL + 1) + steps) * WALK.size
+        )
+        if final < 0:
+            return None
+        off = self._off_hops + hop_idx * HOP.size
+        return final, tuple(HOP.unpack_from(self._mm, off + k * HOP.size) for k in range(count)), bool(hit_exit)
+
+
+def load_artifact(path: Path, source: Path) -> Optional[MappedBoard]:
+    """
+    Отобразить артефакт, если он есть и собран именно из текущего source (board.json); иначе None.
+    Размер и mtime source совпали с заголовком — файл не читаем; иначе сверяем sha1 его содержимого.
+    """
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        mapped = MappedBoard(path)
+        if mapped.source_stat != _source_stat(source) and mapped.source_digest != source_digest(
+                Path(source).read_bytes()):
+            return None
+    except (OSError, ValueError):
+        return None
+    return mapped
+
+
+def walks_equal(mapped: MappedBoard, walks) -> bool:
+    """Совпадает ли таблица ходов артефакта с walks[start][steps] из TransitionTable (поэлементно)."""
+    return len(mapped.walks) >= len(walks) and all(
+        tuple(mapped.walks[start]) == tuple(row) for start, row in enumerate(walks)
+    )
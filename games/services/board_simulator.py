@@ -0,0 +1,172 @@
+"""
+Монте-Карло симулятор партий: миллионы игр шагают синхронно по таблицам переходов.
+
+Таблицы строятся один раз из board_analytics.transition (тот же rules_engine, что и в игре):
+для каждого достижимого состояния и броска 1..6 — следующее состояние и счётчики событий.
+Само ядро симуляции — чистый NumPy, без Django, поэтому его можно гонять в пуле процессов.
+"""
+from __future__ import annotations
+
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Счётчики, которые накапливаются по каждой партии
+METRICS = ("rolls", "cards", "series", "snakes", "ladders", "hops")
+
+
+class SimulationTables:
+    """
+    Таблицы переходов для симулятора (индекс состояния × бросок-1):
+      next_state — следующее состояние, finished (== len(states)) для завершённых партий;
+      events     — прирост счётчиков METRICS за этот переход, форма (states, 6, len(METRICS)).
+    """
+    __slots__ = ("version", "start", "finished", "next_state", "events")
+
+    def __init__(self, version: str, start: int, next_state: np.ndarray, events: np.ndarray):
+        self.version = version
+        self.start = start
+        self.finished = next_state.shape[0]
+        self.next_state = next_state
+        self.events = events
+
+
+def build_tables() -> SimulationTables:
+    """Обходим достижимые состояния от старта и сворачиваем исходы бросков в массивы."""
+    from games.services.board import get_compiled_board
+    from games.services.board_analytics import ROLLS, transition
+
+    start = ("start", 0)
+    index = {start: 0}
+    states = [start]
+    rows: List[list] = []
+    i = 0
+    while i < len(states):
+        state = states[i]
+        row = []
+        for rolled in ROLLS:
+            nxt, landed, hops = transition(state, rolled)
+            if nxt is not None and nxt not in index:
+                index[nxt] = len(states)
+                states.append(nxt)
+            row.append((nxt, landed, hops, state[0] != "series" and nxt is not None and nxt[0] == "series"))
+        rows.append(row)
+        i += 1
+
+    n = len(states)
+    shape = (n, len(ROLLS))
+    next_state = np.empty(shape, dtype=np.int32)
+    events = np.zeros(shape + (len(METRICS),), dtype=np.int32)
+    for i, row in enumerate(rows):
+        for r, (nxt, landed, hops, series_started) in enumerate(row):
+            next_state[i, r] = n if nxt is None else index[nxt]
+            events[i, r] = (
+                1,
+                len(landed),
+                int(series_started),
+                sum(1 for a, b in hops if b < a),
+                sum(1 for a, b in hops if b > a),
+                len(hops),
+            )
+
+    return SimulationTables(get_compiled_board().version, 0, next_state, events)
+
+
+def simulate_batch(tables: SimulationTables, games: int, seed=None, max_rolls: int = 5000) -> Dict[str, np.ndarray]:
+    """
+    Прогоняет games партий синхронно: на каждом шаге — один бросок всем ещё не закончившим.
+    Возвращает гистограммы (np.bincount) по каждому счётчику и число обрезанных по max_rolls партий.
+    """
+    rng = np.random.default_rng(seed)
+    # плоские таблицы: индекс перехода = состояние * 6 + (бросок - 1)
+    next_flat = tables.next_state.reshape(-1)
+    events_flat = tables.events.reshape(next_flat.size, len(METRICS))
+
+    # живые партии держим компактно: их состояние и накопленные счётчики
+    ids = np.arange(games)
+    cur = np.full(games, tables.start, dtype=np.int32)
+    acc = np.zeros((games, len(METRICS)), dtype=np.int32)
+    totals = np.zeros((games, len(METRICS)), dtype=np.int32)
+
+    for _ in range(max_rolls):
+        if ids.size == 0:
+            break
+        flat = cur * 6 + rng.integers(0, 6, size=ids.size, dtype=np.int32)
+        acc += events_flat[flat]
+        cur = next_flat[flat]
+        done = cur == tables.finished
+        if done.any():
+            totals[ids[done]] = acc[done]
+            keep = ~done
+            ids, cur, acc = ids[keep], cur[keep], acc[keep]
+
+    totals[ids] = acc  # обрезанные по max_rolls — с тем, что успели набрать
+    out = {m: np.bincount(totals[:, k]) for k, m in enumerate(METRICS)}
+    out["truncated"] = np.array([ids.size])
+    return out
+
+
+def _merge(acc: Optional[Dict[str, np.ndarray]], part: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    if acc is None:
+        return part
+    for key, hist in part.items():
+        if key == "truncated":
+            acc[key] = acc[key] + hist
+            continue
+        size = max(acc[key].size, hist.size)
+        acc[key] = np.pad(acc[key], (0, size - acc[key].size)) + np.pad(hist, (0, size - hist.size))
+    return acc
+
+
+def _describe(hist: np.ndarray) -> dict:
+    total = hist.sum()
+    values = np.arange(hist.size)
+    mean = float((values * hist).sum() / total)
+    cdf = np.cumsum(hist) / total
+    return {
+        "mean": round(mean, 4),
+        "std": round(float(np.sqrt(((values - mean) ** 2 * hist).sum() / total)), 4),
+        "min": int(values[hist > 0][0]),
+        "max": int(values[hist > 0][-1]),
+        "p50": int(np.searchsorted(cdf, 0.5)),
+        "p90": int(np.searchsorted(cdf, 0.9)),
+        "p99": int(np.searchsorted(cdf, 0.99)),
+        "histogram": [int(x) for x in hist],
+    }
+
+
+def simulate(games: int, *, batch_size: int = 1_000_000, workers: int = 1, seed: Optional[int] = None,
+             max_rolls: int = 5000) -> dict:
+    """
+    Симулирует games партий пачками по batch_size; при workers > 1 пачки раздаются по процессам.
+    Возвращает скорость (games/sec) и распределения счётчиков METRICS на партию.
+    """
+    tables = build_tables()
+    sizes = [batch_size] * (games // batch_size)
+    if games % batch_size:
+        sizes.append(games % batch_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    t0 = time.perf_counter()
+    acc = None
+    if workers > 1 and len(sizes) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(simulate_batch, tables, n, s, max_rolls) for n, s in zip(sizes, seeds)]
+            for f in futures:
+                acc = _merge(acc, f.result())
+    else:
+        for n, s in zip(sizes, seeds):
+            acc = _merge(acc, simulate_batch(tables, n, s, max_rolls))
+    elapsed = time.perf_counter() - t0
+
+    return {
+        "board_version": tables.version,
+        "games": games,
+        "states": int(tables.finished),
+        "elapsed_sec": round(elapsed, 3),
+        "games_per_sec": round(games / elapsed, 1) if elapsed else None,
+        "truncated": int(acc["truncated"][0]),
+        "metrics": {m: _describe(acc[m]) for m in METRICS},
+    }
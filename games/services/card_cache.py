@@ -0,0 +1,147 @@
+"""
+Кэш карточек ходов: подпись для Telegram, картинка и человекочитаемые строки.
+
+Карточка зависит только от доски и хода (from_cell, to_cell, цепочка правил, бросок),
+поэтому собираем её один раз на версию доски и дальше отдаём готовой —
+и в вебхуке, и в qa_queue, и в потоке ответов.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Optional, Tuple
+
+from games.services.board import get_board_by_version, get_compiled_board, on_version_evicted
+from games.services.images import image_url_from_board_name
+
+# Лимит подписи к фото в Telegram
+CAPTION_LIMIT = 1024
+
+Rules = Tuple[Tuple[int, int, str], ...]
+CardKey = Tuple[int, int, Rules, Optional[int]]
+
+
+class CardPayload:
+    """Готовая карточка хода; caption уже обрезан под CAPTION_LIMIT."""
+    __slots__ = ("text", "caption", "image_name", "image_url", "pre_rule_cell", "human_text_pre_rule")
+
+    def __init__(self, text: str, image_name: Optional[str], image_url: Optional[str],
+                 pre_rule_cell: int, human_text_pre_rule: str):
+        self.text = text
+        self.caption = truncate_caption(text)
+        self.image_name = image_name
+        self.image_url = image_url
+        self.pre_rule_cell = pre_rule_cell
+        self.human_text_pre_rule = human_text_pre_rule
+
+
+def truncate_caption(caption: Optional[str]) -> Optional[str]:
+    """Подрезаем подпись под лимит Telegram ~1024 символа."""
+    if caption and len(caption) > CAPTION_LIMIT:
+        return caption[:CAPTION_LIMIT - 3] + "..."
+    return caption
+
+
+def _rules_key(rules) -> Rules:
+    out = []
+    for r in rules or []:
+        try:
+            out.append((int(r.get("from")), int(r.get("to")), str(r.get("type") or "")))
+        except (TypeError, ValueError, AttributeError):
+            continue
+    return tuple(out)
+
+
+def _render_text(cell: dict, from_cell: int, to_cell: int, rules: Rules, rolled) -> str:
+    """Текст карточки (опираемся на поля board.json: title/name, meaning/text/desc)."""
+    title = cell.get("title") or cell.get("name") or f"Клетка {to_cell}"
+    meaning = cell.get("meaning") or cell.get("text") or cell.get("desc") or ""
+
+    lines = [
+        f"Бросок: {rolled}",
+        f"{from_cell} → {to_cell}",
+        title,
+    ]
+    if meaning:
+        lines.append(meaning)
+
+    # Клетка остановки ПЕРЕД правилом (то, что «пропадает» в Telegram)
+    if rules:
+        lines.append(f"Остановились на {rules[0][0]} — сработало правило.")
+        parts = []
+        for a, b, t in rules:
+            t = t.lower()
+            label = "лестница" if t == "ladder" else ("змея" if t == "snake" else "правило")
+            parts.append(f"{a} → {b} ({label})")
+        lines.append("Переходы: " + " ; ".join(parts))
+
+    return "\n".join(lines).strip()
+
+
+def _pretty_rules(rules: Rules) -> str:
+    parts = []
+    for a, b, t in rules:
+        if t == "ladder":
+            parts.append(f"{a} → {b} (лестница)")
+        elif t == "snake":
+            parts.append(f"{a} → {b} (змея)")
+        else:
+            parts.append(f"{a} → {b}")
+    return " ; ".join(parts)
+
+
+# version доски -> {(from_cell, to_cell, rules, rolled): CardPayload}
+_card_cache = {"cards": {}, "hits": 0, "misses": 0}
+
+
+@on_version_evicted
+def _drop_version(version: str) -> None:
+    """Версия доски вытеснена из памяти (board._trim_versions) — её карточки тоже."""
+    _card_cache["cards"].pop(version, None)
+
+
+def get_card(from_cell: int, to_cell: int, rules, rolled, board=None) -> CardPayload:
+    """Карточка хода с доски board (по умолчанию — закреплённой/текущей); строится один раз на версию."""
+    board = board or get_compiled_board()
+    rules_key = _rules_key(rules)
+    rolled = int(rolled) if rolled is not None else None
+    key: CardKey = (int(from_cell or 0), int(to_cell or 0), rules_key, rolled)
+
+    cards = _card_cache["cards"].get(board.version)
+    if cards is None:
+        cards = _card_cache["cards"].setdefault(board.version, {})
+    card = cards.get(key)
+    if card is not None:
+        _card_cache["hits"] += 1
+        return card
+    _card_cache["misses"] += 1
+
+    from_cell, to_cell = key[0], key[1]
+    cell = board.cell(to_cell)
+    image_name = board.image_name(to_cell)
+    pre_rule_cell = rules_key[0][0] if rules_key else to_cell
+    card = CardPayload(
+        text=_render_text((cell.data if cell is not None else None) or {}, from_cell, to_cell, rules_key, rolled),
+        image_name=image_name,
+        image_url=image_url_from_board_name(image_name),
+        pre_rule_cell=pre_rule_cell,
+        human_text_pre_rule=(
+            f"Бросок: {rolled}. Дошли до {pre_rule_cell} — сработало правило: {_pretty_rules(rules_key)}."
+            if rules_key else ""
+        ),
+    )
+    cards[key] = card
+    return card
+
+
+def card_for_move_dict(mv: Dict[str, Any]) -> CardPayload:
+    """Карточка по сериализованному ходу; доска — по mv["board_version"], если она известна."""
+    board = get_board_by_version(mv["board_version"]) if mv.get("board_version") else None
+    return get_card(mv.get("from_cell"), mv.get("to_cell"), mv.get("applied_rules"), mv.get("rolled"), board=board)
+
+
+def get_card_cache_stats() -> dict:
+    return {
+        "versions": len(_card_cache["cards"]),
+        "cards": sum(len(c) for c in _card_cache["cards"].values()),
+        "hits": _card_cache["hits"],
+        "misses": _card_cache["misses"],
+    }
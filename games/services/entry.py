@@ -2,8 +2,17 @@ from __future__ import annotations
 from typing import Optional
 from django.db import transaction
 from games.services.entry_step_result import EntryStepResult
-from games.models import Game, Move
+from games.models import Game
+from games.services.board import use_board_version
 import games.services.apply_roll as apply_roll
+import games.services.rules_engine as rules_engine
+import games.services.game_utils as utils
+import games.services.replay as replay
+
+
+# Поля игры, которые меняет бросок: сохраняем их одним UPDATE в конце apply_roll
+ROLL_UPDATE_FIELDS = ["current_cell", "current_six_number", "last_move_number", "meta",
+                      *utils.COUNTER_FIELDS]
 
 
 class GameEntryManager:
@@ -15,68 +24,25 @@ class GameEntryManager:
       - финиш: выход через 68 ИЛИ точный финиш на 72;
       - при переборе на верхнем ряду (69–71) — стоим и просим переброс;
       - верхний ряд (62–72), частные случаи — пошагово.
+    Сами правила — games.services.rules_engine, запись результата — games.services.apply_roll.
     """
 
     # ---------- main ----------
     @transaction.atomic
     def apply_roll(self, game: Game, rolled: int, player_id: Optional[int] = None) -> EntryStepResult:
         game = Game.objects.select_for_update().get(pk=game.pk)
-        current_cell = int(getattr(game, "current_cell", 0) or 0)
-        six_count = int(getattr(game, "current_six_number", 0) or 0)
-        has_moves_any = Move.objects.filter(game=game).exists()
-        has_non_hold = Move.objects.filter(game=game, on_hold=False).exists()
-
-        series_active = six_count > 0
-        # consider we're still at start as long as there are no non-hold moves
-        at_start = not has_non_hold
-
-        # --- НОВОЕ: строгая логика верхнего ряда (после 68) ---
-        # Если уже прошли 68 (т.е. стоим на 69..71),
-        # и бросок больше оставшегося количества клеток до 72 — стоим и просим переброс.
-        remaining = EntryStepResult.BOARD_MAX - current_cell  # 72 - позиция
-        if current_cell > EntryStepResult.EXIT_CELL or current_cell + rolled > EntryStepResult.BOARD_MAX:
-            if rolled > remaining:
-                return EntryStepResult(
-                    status="ignored",
-                    message=f"Випало {rolled}, але до фінішу лишилось лише {remaining}. Бросьте кубик ще раз 🎲",
-                    six_count=six_count,
-                    moves=[],
-                )
-
-        # --- START OF GAME: handle 6-combos exactly as in the rules ---
-        if at_start:
-            return apply_roll.at_first_start(rolled=rolled, game=Game, six_count=six_count, player_id=player_id)
-
-        # --- /START OF GAME --- (ниже — обычная логика, когда мы уже не в начальном состоянии)
-
-        # A) старт: нужна 6 (если всё ещё at_start, но без серии)
-        if at_start and not series_active:
-            return apply_roll.at_start_no_series_active(rolled=rolled, game=game, current_cell=current_cell,
-                                                        player_id=player_id)
-
-        # B) серия активна и снова 6 — копим
-        if series_active and rolled == 6:
-            return apply_roll.series_active_rolled_six(game=game, current_cell=current_cell, player_id=player_id,
-                                                       six_count=six_count, on_start=at_start)
-
-        # C) в игре выпала 6 — старт серии
-        if (not series_active) and (rolled == 6) and (has_non_hold or current_cell > 0 or has_moves_any):
-            return apply_roll.no_active_series_rolled_six(game=game, current_cell=current_cell, player_id=player_id)
-
-        # D) серия активна и НЕ 6 — финал серии: снимаем on_hold и отдаём все ходы
-        if series_active and rolled != 6:
-            return apply_roll.series_active_rolled_not_six(game=game, current_cell=current_cell, player_id=player_id,
-                                                       six_count=six_count, on_start=at_start, rolled=rolled)
-
-        # E) одиночный ход (без серии)
-        if (not series_active) and (rolled != 6):
-            return apply_roll.no_active_series_rolled_not_six(game=game, current_cell=current_cell, player_id=player_id,
-                                                              rolled=rolled)
-
-        # fallback
-        return EntryStepResult(
-            status="ignored",
-            message="Стан не потребує дій.",
-            six_count=int(getattr(game, "current_six_number", 0) or 0),
-            moves=[],
-        )
+        # ход считаем по той доске, на которой началась игра (версию закрепляет создание игры —
+        # Game.start_new / api_start); игра без версии — по актуальной доске своего game_type/locale
+        with use_board_version(game.board_version or None, game.game_type, (game.meta or {}).get("locale")):
+            res = self._apply_roll(game, rolled, player_id)
+            # лог бросков: по нему партию можно переиграть на той же версии доски (games.services.replay)
+            game.meta = replay.log_roll(game.meta, rolled)
+        game.save(update_fields=ROLL_UPDATE_FIELDS)
+        return res
+
+    def _apply_roll(self, game: Game, rolled: int, player_id: Optional[int]) -> EntryStepResult:
+        # правила считает движок (без БД), адаптер пишет результат; ходы серии — в буфере Game.meta,
+        # поэтому любой записанный Move — подтверждённый, и их число уже лежит в game.confirmed_moves
+        state = apply_roll.load_state(game, has_moves=game.confirmed_moves > 0)
+        outcome = rules_engine.step(state, rolled)
+        return apply_roll.persist_outcome(game, state, outcome, rolled, player_id)
@@ -14,9 +14,6 @@ class EntryStepResult:
     FINISH_CELL = 72  # явная финишная клетка
     EVENT_NORMAL = getattr(getattr(Move, "EventType", object), "NORMAL", "NORMAL")
 
-    # ленивый кэш для alt-правил
-    ALT_MAP: Optional[Dict[int, int]] = None
-
     # --- поддержка разных ключей в boards.json ---
     ALT_KEYS_PRIORITY = (
         ("snake_to", "ladder_to"),
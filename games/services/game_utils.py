@@ -1,14 +1,12 @@
-from games.services.board import resolve_chain, get_cell_image_name
-from games.services.images import normalize_image_relpath, image_url_from_board_name
+from games.services.board import resolve_chain, get_compiled_board, on_version_evicted
+from games.services.card_cache import get_card
 from django.utils import timezone
 import random
-from django.db.models import Max
+from django.db.models import Case, Count, F, IntegerField, Max, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
 from games.models import Game, Move
 from typing import List, Optional, Dict
 from games.services.entry_step_result import EntryStepResult
-from time import sleep
-from games.services.game_summary import collect_game_summary
-from games.services.openai_client import OpenAIClient
 
 def wait_six_msg(rolled: int) -> str:
     # Messages shown while we wait for the very first 6
@@ -35,7 +33,72 @@ def next_move_number(game: Game) -> int:
     return int(last_no) + 1
 
 
+class TransitionTable:
+    """
+    Предвычисленные результаты ходов для текущей доски:
+      walks[start][steps] — walk_n_steps(start, steps) для steps 1..6;
+      pure[start][steps]  — walk_pure_no_rules(start, steps) для steps 0..BOARD_MAX
+                            (больше BOARD_MAX — всё равно упираемся в 72).
+    Элемент: (final_cell, ((a, b), ...), hit_exit).
+    """
+    __slots__ = ("board", "walks", "pure")
+
+    MAX_ROLL = 6
+
+    def __init__(self, board):
+        self.board = board
+        last = EntryStepResult.BOARD_MAX
+        # доска из артефакта (build_board) приносит таблицу ходов готовой
+        prebuilt = getattr(board, "walks", None)
+        self.walks = prebuilt if prebuilt is not None else tuple(
+            tuple(
+                _freeze_walk(_walk_n_steps_uncached(start, steps)) if steps else None
+                for steps in range(self.MAX_ROLL + 1)
+            )
+            for start in range(last + 1)
+        )
+        self.pure = tuple(
+            tuple(_freeze_walk(_walk_pure_no_rules_uncached(start, steps)) for steps in range(last + 1))
+            for start in range(last + 1)
+        )
+
+
+def _freeze_walk(res):
+    final_pos, chain, hit_exit = res
+    return int(final_pos), tuple((int(a), int(b)) for a, b in chain), bool(hit_exit)
+
+
+def _thaw_walk(entry):
+    final_pos, chain, hit_exit = entry
+    return final_pos, [[a, b] for a, b in chain], hit_exit
+
+
+# version доски -> TransitionTable (старые версии нужны играм, закреплённым за ними)
+_transitions: Dict[str, TransitionTable] = {}
+
+
+def get_transition_table() -> TransitionTable:
+    """Таблица переходов доски текущего контекста; строится один раз на версию доски."""
+    board = get_compiled_board()
+    table = _transitions.get(board.version)
+    if table is None:
+        table = TransitionTable(board)
+        _transitions[board.version] = table
+    return table
+
+
 def walk_n_steps(start_cell: int, steps: int):
+    """
+    То же, что _walk_n_steps_uncached(), но для 0..72 и бросков 1..6 — готовый ответ из TransitionTable.
+    Возвращает: (final_cell, chain_list, hit_exit)
+    """
+    start_cell, steps = int(start_cell), int(steps)
+    if 0 <= start_cell <= EntryStepResult.BOARD_MAX and 1 <= steps <= TransitionTable.MAX_ROLL:
+        return _thaw_walk(get_transition_table().walks[start_cell][steps])
+    return _walk_n_steps_uncached(start_cell, steps)
+
+
+def _walk_n_steps_uncached(start_cell: int, steps: int):
     """
     Двигаемся на 'steps' клеток:
       - НЕ применяем змей/лестниц на промежуточных клетках (только считаем шаги).
@@ -70,127 +133,83 @@ def walk_n_steps(start_cell: int, steps: int):
     return int(final_pos), total_chain, hit_exit
 
 
-def create_moves_with_chain(
-        *,
-        game: Game,
-        start_move_no: int,
-        from_cell: int,
-        rolled: int,
-        final_cell: int,
-        chain: list[list[int]] | list[tuple[int, int]],
-        on_hold: bool,
-        at_start: bool,
-) -> tuple[int, list[Move]]:
+def save_moves(moves: list[Move]) -> list[Move]:
+    """Все ходы броска одним INSERT; pk проставляются (RETURNING), их можно сразу сериализовать."""
+    if moves:
+        Move.objects.bulk_create(moves)
+    return moves
+
+
+# --- счётчики игры (Game.confirmed_moves / unanswered_moves / next_unanswered_move) ---
+COUNTER_FIELDS = ["confirmed_moves", "unanswered_moves", "next_unanswered_move"]
+
+
+def count_saved_moves(game: Game, moves: list[Move]) -> None:
+    """Учесть только что записанные ходы в счётчиках game (в памяти; сохраняет вызывающий, под блокировкой игры)."""
+    if not moves:
+        return
+    unanswered = [mv for mv in moves if mv.player_answer is None]
+    game.confirmed_moves += len(moves)
+    game.unanswered_moves += len(unanswered)
+    if game.next_unanswered_move_id is None and unanswered:
+        game.next_unanswered_move = unanswered[0]
+
+
+def save_answer(mv: Move, text: str) -> Optional[Move]:
     """
-    Persists:
-      1) the STEP move: from_cell -> pre_rule_cell (rolled shown here)
-      2) each RULE hop as its own move: a -> b (rolled = None)
-    Returns: (last_move_no, list_of_created_moves)
+    Сохранить ответ игрока на ход и поправить счётчики игры одним UPDATE
+    (декремент unanswered_moves и сдвиг курсора, если отвечен именно он).
+    Возвращает следующий ход этой игры без ответа (или None).
     """
-    created: list[Move] = []
-    move_no = int(start_move_no)
-
-    # 1) STEP: go to the *first* rule start (or final_cell if no rules)
-    if chain:
-        pre_rule = int(chain[0][0])
-    else:
-        pre_rule = int(final_cell)
-
-    # only create the step move if it actually moves
-    if chain and int(from_cell) != int(pre_rule):
-        img_rel_step = normalize_image_relpath(get_cell_image_name(pre_rule))
-        created.append(
-            Move.objects.create(
-                game=game,
-                move_number=move_no,
-                rolled=int(rolled),
-                from_cell=int(from_cell),
-                to_cell=pre_rule,
-                event_type=EntryStepResult.EVENT_NORMAL,
-                note=(
-                    "entry: first six"
-                    if at_start and rolled == 6
-                    else "series: six"
-                    if rolled == 6
-                    else "single step"
-                    if not chain
-                    else "step to rule start"
-                ),
-                state_snapshot={"applied_rules": []},
-                image_url=img_rel_step,
-                on_hold=on_hold,
-            )
+    first_answer = mv.player_answer is None
+    mv.player_answer = text
+    mv.player_answer_at = timezone.now()
+    mv.answer_prompt_msg_id = None
+    mv.save(update_fields=["player_answer", "player_answer_at", "answer_prompt_msg_id"])
+
+    next_mv = (Move.objects
+               .filter(game_id=mv.game_id, on_hold=False, player_answer__isnull=True,
+                       move_number__gt=mv.move_number)
+               .order_by("move_number")
+               .first())
+    if first_answer:
+        Game.objects.filter(pk=mv.game_id).update(
+            unanswered_moves=Greatest(F("unanswered_moves") - 1, 0),
+            next_unanswered_move=Case(
+                When(next_unanswered_move=mv.pk, then=Value(next_mv.pk if next_mv else None)),
+                default=F("next_unanswered_move"),
+                output_field=IntegerField(),
+            ),
         )
-        move_no += 1
+    return next_mv
 
-    # 2) RULE HOPS: one Move per (a -> b)
-    for a, b in chain:
-        a, b = int(a), int(b)
-        img_rel_rule = normalize_image_relpath(get_cell_image_name(b))
-        created.append(
-            Move.objects.create(
-                game=game,
-                move_number=move_no,
-                rolled=rolled,
-                from_cell=a,
-                to_cell=b,
-                event_type=et("LADDER")
-                if b > a
-                else et("SNAKE")
-                if b < a
-                else EntryStepResult.EVENT_NORMAL,
-                note=f"auto rule: {a}->{b}",
-                state_snapshot={"applied_rules": rules_payload([[a, b]])},
-                image_url=img_rel_rule,
-                on_hold=on_hold,
-            )
-        )
-        move_no += 1
-
-    # 3) If no chain, ensure we still have a single move to final_cell
-    if not chain and int(from_cell) != int(final_cell):
-        img_rel_final = normalize_image_relpath(get_cell_image_name(final_cell))
-        created.append(
-            Move.objects.create(
-                game=game,
-                move_number=move_no,
-                rolled=int(rolled),
-                from_cell=int(from_cell),
-                to_cell=int(final_cell),
-                event_type=EntryStepResult.EVENT_NORMAL,
-                note="single move",
-                state_snapshot={"applied_rules": []},
-                image_url=img_rel_final,
-                on_hold=on_hold,
-            )
-        )
-        move_no += 1
-
-    # If nothing had to be created (edge case), create a no-op move once:
-    if not created:
-        img_rel_final = normalize_image_relpath(get_cell_image_name(final_cell))
-        created.append(
-            Move.objects.create(
-                game=game,
-                move_number=move_no,
-                rolled=int(rolled),
-                from_cell=int(from_cell),
-                to_cell=int(final_cell),
-                event_type=EntryStepResult.EVENT_NORMAL,
-                note="noop",
-                state_snapshot={"applied_rules": []},
-                image_url=img_rel_final,
-                on_hold=on_hold,
-            )
-        )
-        move_no += 1
 
-    return move_no - 1, created
+def counter_annotations() -> dict:
+    """Счётчики, посчитанные заново по Move, — для аннотации/UPDATE queryset'а Game (repair_game_counters)."""
+    confirmed = Move.objects.filter(game=OuterRef("pk"), on_hold=False)
+    unanswered = confirmed.filter(player_answer__isnull=True)
+
+    def count(qs):
+        return Coalesce(Subquery(qs.order_by().values("game").annotate(n=Count("pk")).values("n")[:1],
+                                 output_field=IntegerField()), Value(0))
 
-    # Ход без правил (обрезаем по BOARD_MAX, exit-флаг и для 68, и для 72)
+    return {
+        "confirmed_moves": count(confirmed),
+        "unanswered_moves": count(unanswered),
+        "next_unanswered_move": Subquery(unanswered.order_by("move_number").values("pk")[:1]),
+    }
 
 
+# Ход без правил (обрезаем по BOARD_MAX, exit-флаг и для 68, и для 72)
 def walk_pure_no_rules(start_cell: int, steps: int):
+    start_cell, steps = int(start_cell), int(steps)
+    if 0 <= start_cell <= EntryStepResult.BOARD_MAX and steps >= 0:
+        entry = get_transition_table().pure[start_cell][min(steps, EntryStepResult.BOARD_MAX)]
+        return _thaw_walk(entry)
+    return _walk_pure_no_rules_uncached(start_cell, steps)
+
+
+def _walk_pure_no_rules_uncached(start_cell: int, steps: int):
     final_pos = int(start_cell) + int(steps)
     if final_pos > EntryStepResult.BOARD_MAX:
         final_pos = EntryStepResult.BOARD_MAX
@@ -267,9 +286,10 @@ def mark_finished_nonactive(game: Game):
         game.save(update_fields=["current_six_number", "status"])
 
 
-def serialize_moves(moves: list[Move], player_id: Optional[int] = None) -> list[dict]:
+def serialize_moves(moves: list[Move], player_id: Optional[int] = None, board=None) -> list[dict]:
     """Сериализация списка ходов."""
-    return [serialize_move(mv, player_id=player_id) for mv in moves]
+    board = board or get_compiled_board()
+    return [serialize_move(mv, player_id=player_id, board=board) for mv in moves]
 
 
 # Сообщение о финише (без рекурсии и переменных вне области видимости)
@@ -312,40 +332,14 @@ def resolve_full(cell: int):
     return pos, applied
 
 
-def serialize_move(mv: Move, player_id: Optional[int] = None) -> dict:
-    img_name = get_cell_image_name(int(mv.to_cell or 0))
-    img_url = image_url_from_board_name(img_name, player_id=player_id, game_id=mv.game_id)
-
+def serialize_move(mv: Move, player_id: Optional[int] = None, board=None) -> dict:
+    """
+    Ход -> dict для отправки; подпись, картинка и строки про правила — из кэша карточек (card_cache).
+    board — доска игры (board_for_game); по умолчанию закреплённая/текущая.
+    """
+    board = board or get_compiled_board()
     applied_rules = (mv.state_snapshot or {}).get("applied_rules", []) or []
-
-    # 1) Клетка остановки ДО применения правила
-    pre_rule_cell = int(applied_rules[0]["from"]) if applied_rules else int(mv.to_cell or 0)
-
-    # 2) Читаемый текст про правила
-    def _pretty_rules(rules):
-        if not rules:
-            return ""
-        parts = []
-        for r in rules:
-            a, b = int(r["from"]), int(r["to"])
-            rtype = r.get("type")
-            if rtype == "ladder":
-                parts.append(f"{a} → {b} (лестница)")
-            elif rtype == "snake":
-                parts.append(f"{a} → {b} (змея)")
-            else:
-                parts.append(f"{a} → {b}")
-        return " ; ".join(parts)
-
-    rules_txt = _pretty_rules(applied_rules)
-
-    # 3) Готовые строки
-    human_pre_rule = (
-        f"Бросок: {mv.rolled}. Дошли до {pre_rule_cell} — сработало правило: {rules_txt}."
-        if applied_rules
-        else ""
-    )
-    human_final = f"Итог: {mv.from_cell} → {mv.to_cell}."
+    card = get_card(mv.from_cell, mv.to_cell, applied_rules, mv.rolled, board=board)
 
     return {
         "id": mv.id,
@@ -353,80 +347,65 @@ def serialize_move(mv: Move, player_id: Optional[int] = None) -> dict:
         "rolled": mv.rolled,
         "from_cell": mv.from_cell,
         "to_cell": mv.to_cell,
-        "pre_rule_cell": pre_rule_cell,
+        "pre_rule_cell": card.pre_rule_cell,
         "note": mv.note,
         "event_type": str(getattr(mv, "event_type", "")),
         "applied_rules": applied_rules,
         "chain_pairs": [[r["from"], r["to"]] for r in applied_rules],
-        "human_text_pre_rule": human_pre_rule,
-        "human_text_final": human_final,
-        "image_url": img_url,
+        "human_text_pre_rule": card.human_text_pre_rule,
+        "human_text_final": f"Итог: {mv.from_cell} → {mv.to_cell}.",
+        "image_url": card.image_url,
+        "caption": card.caption,
         "on_hold": getattr(mv, "on_hold", False),
+        "board_version": board.version,
     }
 
 
+# кэш alt-правил: version доски -> {cell: to_cell}
+_alt_map_cache = {"maps": {}, "hits": 0, "misses": 0}
+
+
+@on_version_evicted
+def _drop_version(version: str) -> None:
+    """Версия доски вытеснена из памяти (board._trim_versions) — её таблица переходов и alt-правила тоже."""
+    _transitions.pop(version, None)
+    _alt_map_cache["maps"].pop(version, None)
+
+
 def get_alt_map() -> Dict[int, int]:
-    """Строим {cell: to_cell} по snake*_to/ladder*_to (и синонимам) из boards.json, кэшируем."""
-    if EntryStepResult.ALT_MAP is not None:
-        return EntryStepResult.ALT_MAP
+    """Строим {cell: to_cell} по snake*_to/ladder*_to (и синонимам) из boards.json, кэшируем по версии доски."""
+    board = get_compiled_board()
+    cached = _alt_map_cache["maps"].get(board.version)
+    if cached is not None:
+        _alt_map_cache["hits"] += 1
+        return cached
 
     mapping: Dict[int, int] = {}
-    try:
-        import importlib
-        board_mod = importlib.import_module("games.services.board")
-
-        # 1) Функции доступа к клетке
-        getter = None
-        for name in ("get_cell", "get_cell_props", "get_cell_data", "cell"):
-            if hasattr(board_mod, name):
-                cand = getattr(board_mod, name)
-                if callable(cand):
-                    getter = cand
-                    break
-
-        if getter:
-            for i in range(1, EntryStepResult.BOARD_MAX + 1):
-                try:
-                    meta = getter(i) or {}
-                    to = extract_alt_to(meta)
-                    if to is not None:
-                        mapping[i] = int(to)
-                except Exception:
-                    continue
-
-        # 2) Прямые структуры
-        if not mapping:
-            for name in ("BOARD", "BOARD_CELLS", "CELLS", "BOARD_MAP"):
-                if not hasattr(board_mod, name):
-                    continue
-                raw = getattr(board_mod, name)
-                if isinstance(raw, dict):
-                    for k, v in raw.items():
-                        try:
-                            cell = int(k)
-                            to = extract_alt_to(v or {})
-                            if to is not None:
-                                mapping[cell] = int(to)
-                        except Exception:
-                            continue
-                elif isinstance(raw, list):
-                    for idx, v in enumerate(raw):
-                        cell = idx + 1  # 1-базная нумерация
-                        try:
-                            to = extract_alt_to(v or {})
-                            if to is not None:
-                                mapping[cell] = int(to)
-                        except Exception:
-                            continue
-                if mapping:
-                    break
-    except Exception:
-        mapping = {}
+    for i in range(1, EntryStepResult.BOARD_MAX + 1):
+        cell = board.cell(i)
+        if cell is None:
+            continue
+        try:
+            to = extract_alt_to(cell.data or {})
+            if to is not None:
+                mapping[i] = int(to)
+        except Exception:
+            continue
 
-    EntryStepResultALT_MAP = mapping
+    _alt_map_cache["misses"] += 1
+    _alt_map_cache["maps"][board.version] = mapping
     return mapping
 
 
+def get_alt_map_stats() -> dict:
+    """Счётчики кэша alt-правил (на процесс): misses должен расти только при смене board.json."""
+    return {
+        "versions": sorted(_alt_map_cache["maps"]),
+        "hits": _alt_map_cache["hits"],
+        "misses": _alt_map_cache["misses"],
+    }
+
+
 def rules_payload(chain: list[list[int]] | list[tuple[int, int]] | None):
     """Сериализация применённых правил в state_snapshot.applied_rules."""
     if not chain:
@@ -493,35 +472,8 @@ def extract_alt_to(meta: dict) -> Optional[int]:
     return None
 
 
-def finish_game_and_release(game: Game, player_id: Optional[int] = None) -> EntryStepResult:
-    qs = Move.objects.select_for_update().filter(game=game, on_hold=True).order_by("move_number")
-    released_list = list(qs)
-    qs.update(on_hold=False)
-
-    # Запишем завершение в БД (с полным списком финальных ходов)
-    reason = "exit_68" if int(game.current_cell) == EntryStepResult.EXIT_CELL else "finish_72"
-    persist_finished_record(game, moves=released_list, reason=reason, player_id=player_id)
-
-    mark_finished_nonactive(game)
-    try:
-        summary = collect_game_summary(game)
-        client = OpenAIClient()
-        analysis = client.send_summary_json(summary)
-        sleep(3.0)
-    except Exception:
-        analysis = ""
-
-    return EntryStepResult(
-        status="finished",
-        message=finish_message(game.current_cell, analysis),
-        six_count=0,
-        moves=serialize_moves(released_list, player_id=player_id),
-    )
-
-
 def six_continue_text(six_count: int) -> str:
     # синоним на русский вариант (чтобы не падало, если где-то зовётся по старому имени)
-    sleep(3.0)
     return six_continue_text_ru(six_count)
 
 
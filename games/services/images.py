@@ -32,7 +32,7 @@ def image_url_from_board_name(
 
     # абсолютный путь на сервере (для TG нужно дополнить доменом)
     if name.startswith("/"):
-        site = str(getattr(settings, "SITE_BASE_URL", "")).rstrip("/")
+        site = (getattr(settings, "SITE_BASE_URL", None) or "").rstrip("/")
         return f"{site}{name}" if site else name
 
 
@@ -77,4 +77,4 @@ def build_abs_image_url(rel_path: str | None) -> str | None:
     if not rel_path:
         return None
     rel = rel_path.lstrip('/')  # media/board_images/41-...
-    return urljoin(settings.SITE_BASE_URL.rstrip('/') + '/', 'cards/' + rel)
+    return urljoin((settings.SITE_BASE_URL or "").rstrip("/") + "/", "cards/" + rel)
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+from typing import Any, Dict
+
+from django.conf import settings
+
+from games.models import Game
+from games.services.board import use_board_version
+from games.services.board_analytics import transition
+
+# лог бросков в Game.meta и точка, с которой он начинается: {"rolls": свёрнуто бросков, "state": состояние}
+ROLLS_KEY = "rolls"
+CHECKPOINT_KEY = "replay_from"
+
+
+def log_roll(meta: Dict[str, Any], rolled: int) -> Dict[str, Any]:
+    """
+    Новая meta с броском в логе. Лог держим не длиннее GAME_ROLL_LOG: старшую половину сворачиваем
+    в CHECKPOINT_KEY (состояние после неё), чтобы meta, которую бросок пишет целиком, не росла с партией.
+    Вызывать на доске партии (внутри use_board_version).
+    """
+    meta = dict(meta or {})
+    rolls = [*(meta.get(ROLLS_KEY) or []), int(rolled)]
+    limit = max(2, int(getattr(settings, "GAME_ROLL_LOG", 256)))
+    if len(rolls) > limit:
+        fold, rolls = rolls[:len(rolls) - limit // 2], rolls[len(rolls) - limit // 2:]
+        folded, state = _checkpoint(meta)
+        for value in fold:
+            state = transition(state, int(value))[0] or state
+        meta[CHECKPOINT_KEY] = {"rolls": folded + len(fold), "state": list(state)}
+    meta[ROLLS_KEY] = rolls
+    return meta
+
+
+def _checkpoint(meta: Dict[str, Any]):
+    checkpoint = meta.get(CHECKPOINT_KEY) or {}
+    return int(checkpoint.get("rolls") or 0), tuple(checkpoint.get("state") or ("start", 0))
+
+
+def replay_game(game: Game) -> Dict[str, Any]:
+    """
+    Переигрываем партию по логу бросков (Game.meta["rolls"]) на той версии доски, на которой она шла,
+    начиная с сохранённой точки (CHECKPOINT_KEY), если начало лога свёрнуто.
+    Результат детерминирован: правила — board_analytics.transition, доска — снапшот game.board_version.
+    """
+    meta = game.meta or {}
+    rolls = list(meta.get(ROLLS_KEY) or [])
+    folded, state = _checkpoint(meta)
+    cells = []
+    finished = False
+    with use_board_version(game.board_version or None, game.game_type, meta.get("locale")) as board:
+        for rolled in rolls:
+            nxt, landed, _ = transition(state, int(rolled))
+            cells.extend(landed)
+            if nxt is None:
+                finished = True
+                break
+            state = nxt
+
+    if finished:
+        cell = cells[-1] if cells else 0
+    else:
+        cell = state[2] if state[0] == "series" else (state[1] if state[0] == "play" else 0)
+    return {
+        "game_id": str(game.id),
+        "board_version": board.version,
+        "pinned": bool(game.board_version) and board.version == game.board_version,
+        "rolls": folded + len(rolls),
+        "replayed_from": folded,
+        "cells": cells,
+        "final_cell": cell,
+        "finished": finished,
+        "matches": cell == int(game.current_cell or 0),
+    }
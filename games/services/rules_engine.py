@@ -0,0 +1,342 @@
+"""
+Движок правил Лилы без ORM: GameState + бросок -> новое состояние, события и ходы к записи.
+
+Ничего не читает и не пишет в БД — только таблицы переходов доски (game_utils.walk_*),
+поэтому бросок считается за микросекунды. Запись результата — games.services.apply_roll.persist_outcome;
+тем же движком пользуются вебхук Telegram, api roll_dice и аналитика/симулятор доски.
+"""
+from __future__ import annotations
+
+from typing import List, Optional, Tuple
+
+import games.services.game_utils as utils
+from games.services.entry_step_result import EntryStepResult
+
+EXIT_CELL = EntryStepResult.EXIT_CELL
+FINISH_CELL = EntryStepResult.FINISH_CELL
+BOARD_MAX = EntryStepResult.BOARD_MAX
+
+NORMAL, LADDER, SNAKE, LONG_MOVE = "normal", "ladder", "snake", "long_move"
+
+
+class PlannedMove:
+    """Ход, который будет записан в Move (или лежит в буфере серии)."""
+    __slots__ = ("move_number", "rolled", "from_cell", "to_cell", "event_type", "note", "applied_rules",
+                 "image_url", "qa_sequence_in_combo")
+
+    # порядок колонок строки буфера серии в Game.meta (см. миграцию games 0004_series_buffer)
+    ROW = __slots__
+
+    def __init__(self, move_number: int, rolled: Optional[int], from_cell: int, to_cell: int,
+                 event_type: str = NORMAL, note: str = "", applied_rules: Optional[list] = None,
+                 image_url: str = "", qa_sequence_in_combo: int = 0):
+        self.move_number = move_number
+        self.rolled = rolled
+        self.from_cell = from_cell
+        self.to_cell = to_cell
+        self.event_type = event_type
+        self.note = note
+        self.applied_rules = applied_rules or []
+        self.image_url = image_url
+        self.qa_sequence_in_combo = qa_sequence_in_combo
+
+    def to_row(self) -> list:
+        return [getattr(self, name) for name in self.ROW]
+
+    @classmethod
+    def from_row(cls, row) -> "PlannedMove":
+        return cls(*row)
+
+    def __repr__(self):
+        return f"PlannedMove(#{self.move_number} {self.event_type} {self.from_cell}->{self.to_cell})"
+
+
+class GameState:
+    """
+    Всё, от чего зависит исход броска:
+      cell, six_count, at_start (ещё нет подтверждённых ходов), last_move_number,
+      series — ходы текущей серии шестёрок (ещё не записаны), finished.
+    """
+    __slots__ = ("cell", "six_count", "at_start", "last_move_number", "series", "finished")
+
+    def __init__(self, cell: int = 0, six_count: int = 0, at_start: bool = True, last_move_number: int = 0,
+                 series: Tuple[PlannedMove, ...] = (), finished: bool = False):
+        self.cell = cell
+        self.six_count = six_count
+        self.at_start = at_start
+        self.last_move_number = last_move_number
+        self.series = series
+        self.finished = finished
+
+    def copy(self, **changes) -> "GameState":
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(changes)
+        return GameState(**values)
+
+    def __repr__(self):
+        return (f"GameState(cell={self.cell}, six_count={self.six_count}, at_start={self.at_start}, "
+                f"series={len(self.series)}, finished={self.finished})")
+
+
+class Event:
+    """
+    Событие броска:
+      walk      — ход по доске: from_cell, final, chain (сработавшие правила), steps, pure (без правил);
+      six       — ещё одна шестёрка (value — их число);
+      ignored   — бросок не меняет состояние (value — причина: wait_six / overshoot);
+      series    — серия разрешилась: value = "released" | "dropped";
+      finished  — партия завершена (value — причина).
+    """
+    __slots__ = ("kind", "value", "from_cell", "final", "chain", "steps", "pure")
+
+    def __init__(self, kind: str, value=None, from_cell: int = 0, final: int = 0,
+                 chain: Tuple[Tuple[int, int], ...] = (), steps: int = 0, pure: bool = False):
+        self.kind = kind
+        self.value = value
+        self.from_cell = from_cell
+        self.final = final
+        self.chain = chain
+        self.steps = steps
+        self.pure = pure
+
+    def __repr__(self):
+        if self.kind == "walk":
+            return f"Event(walk {self.from_cell}+{self.steps} -> {self.final}, chain={list(self.chain)})"
+        return f"Event({self.kind}, {self.value!r})"
+
+
+class Outcome:
+    """
+    Результат броска:
+      status — как в EntryStepResult ("ignored" | "continue" | "single" | "completed" | "finished");
+      moves  — ходы, которые нужно записать в Move (подтверждённые);
+      combo  — число шестёрок в применённой комбинации (для текста), finish_reason — причина финиша.
+    """
+    __slots__ = ("state", "status", "events", "moves", "combo", "finish_reason")
+
+    def __init__(self, state: GameState, status: str, events: List[Event], moves: List[PlannedMove] = None,
+                 combo: int = 0, finish_reason: str = ""):
+        self.state = state
+        self.status = status
+        self.events = events
+        self.moves = moves or []
+        self.combo = combo
+        self.finish_reason = finish_reason
+
+
+# ---------- планирование ходов ----------
+
+def plan_moves(*, start_move_no: int, from_cell: int, rolled: int, final_cell: int, chain,
+               at_start: bool) -> Tuple[int, List[PlannedMove]]:
+    """
+    Ходы одного перемещения (то же, что раньше писал create_moves_with_chain):
+      1) шаг from_cell -> начало первого правила (rolled показываем здесь);
+      2) каждое правило a -> b отдельным ходом;
+      3) без правил — один ход до final_cell; если двигаться некуда — noop.
+    Возвращает (номер последнего хода, ходы).
+    """
+    planned: List[PlannedMove] = []
+    move_no = int(start_move_no)
+    from_cell, final_cell = int(from_cell), int(final_cell)
+    pre_rule = int(chain[0][0]) if chain else final_cell
+
+    if chain and from_cell != pre_rule:
+        note = (
+            "entry: first six" if at_start and rolled == 6
+            else "series: six" if rolled == 6
+            else "step to rule start"
+        )
+        planned.append(PlannedMove(move_no, int(rolled), from_cell, pre_rule, NORMAL, note))
+        move_no += 1
+
+    for a, b in chain:
+        a, b = int(a), int(b)
+        event_type = LADDER if b > a else SNAKE if b < a else NORMAL
+        planned.append(PlannedMove(move_no, rolled, a, b, event_type, f"auto rule: {a}->{b}",
+                                   utils.rules_payload([[a, b]])))
+        move_no += 1
+
+    if not chain and from_cell != final_cell:
+        planned.append(PlannedMove(move_no, int(rolled), from_cell, final_cell, NORMAL, "single move"))
+        move_no += 1
+
+    if not planned:
+        planned.append(PlannedMove(move_no, int(rolled), from_cell, final_cell, NORMAL, "noop"))
+        move_no += 1
+
+    return move_no - 1, planned
+
+
+def _mark_long_move(moves: List[PlannedMove], note: str) -> None:
+    if moves:
+        moves[0].event_type = LONG_MOVE
+        moves[0].note = note
+
+
+def _is_exit(cell: int, hit_exit: bool) -> bool:
+    return hit_exit or cell in (EXIT_CELL, FINISH_CELL)
+
+
+def _walk(events: List[Event], from_cell: int, steps: int, pure: bool = False):
+    if pure:
+        final, chain, hit_exit = utils.walk_pure_no_rules(from_cell, steps)
+    else:
+        final, chain, hit_exit = utils.walk_n_steps(from_cell, steps)
+    events.append(Event("walk", from_cell=int(from_cell), final=int(final),
+                        chain=tuple((int(a), int(b)) for a, b in chain), steps=int(steps), pure=pure))
+    return int(final), chain, hit_exit
+
+
+def _finish(state: GameState, events: List[Event], moves: List[PlannedMove], reason: str, **extra) -> Outcome:
+    events.append(Event("finished", reason))
+    new = state.copy(six_count=0, series=(), finished=True, **extra)
+    return Outcome(new, "finished", events, moves, finish_reason=reason)
+
+
+def _exit_reason(cell: int) -> str:
+    return "exit_68" if cell == EXIT_CELL else "finish_72"
+
+
+# ---------- шаг ----------
+
+def step(state: GameState, rolled: int) -> Outcome:
+    """Один бросок по правилам Лилы. Никаких побочных эффектов: state не меняется."""
+    rolled = int(rolled)
+    events: List[Event] = []
+    cell = state.cell
+
+    # верхний ряд: бросок больше, чем осталось до 72 — стоим и просим переброс
+    remaining = BOARD_MAX - cell
+    if (cell > EXIT_CELL or cell + rolled > BOARD_MAX) and rolled > remaining:
+        events.append(Event("ignored", "overshoot"))
+        return Outcome(state, "ignored", events)
+
+    if state.at_start:
+        return _step_start(state, rolled, events)
+    if rolled == 6:
+        return _step_six(state, events)
+    if state.six_count > 0:
+        return _step_series_end(state, rolled, events)
+    return _step_single(state, rolled, events)
+
+
+def _step_start(state: GameState, rolled: int, events: List[Event]) -> Outcome:
+    """Старт: копим шестёрки, первая не-6 применяет комбинацию."""
+    if rolled == 6:
+        events.append(Event("six", state.six_count + 1))
+        return Outcome(state.copy(six_count=state.six_count + 1), "continue", events)
+
+    combo = state.six_count
+    if combo == 0:
+        events.append(Event("ignored", "wait_six"))
+        return Outcome(state, "ignored", events)
+
+    # 1×6 + X, 2×6 + X: 0→1→6→(6+X); 3×6 + X: 0→1→(1+X); 4+×6 + X: 0→1→(сумма всех бросков)
+    move_no = state.last_move_number + 1
+    moves: List[PlannedMove] = []
+    if combo >= 4:
+        total = combo * 6 + rolled
+        final_1, chain_1, _ = _walk(events, 0, 1)
+        last_no, m1 = plan_moves(start_move_no=move_no, from_cell=0, rolled=6, final_cell=final_1,
+                                 chain=chain_1, at_start=True)
+        moves.extend(m1)
+        final, chain, hit_exit = _walk(events, 1, total, pure=True)
+        last_no, m2 = plan_moves(start_move_no=last_no + 1, from_cell=1, rolled=total, final_cell=final,
+                                 chain=chain, at_start=True)
+        _mark_long_move(m2, f"Довгий хід: {combo}×6 + {rolled} = {total}")
+        moves.extend(m2)
+        if _is_exit(final, hit_exit):
+            return _finish(state, events, moves, "finish", cell=final, last_move_number=last_no, at_start=False)
+        new = state.copy(cell=final, six_count=0, last_move_number=last_no, at_start=False)
+        return Outcome(new, "single", events, moves, combo=combo)
+
+    targets = [1, 6, 6 + rolled] if combo in (1, 2) else [1, 1 + rolled]
+    prev = 0
+    last_no = move_no - 1
+    for tgt in targets:
+        final, chain, hit_exit = _walk(events, prev, int(tgt) - prev)
+        last_no, mvs = plan_moves(start_move_no=last_no + 1, from_cell=prev, rolled=rolled, final_cell=final,
+                                  chain=chain, at_start=True)
+        moves.extend(mvs)
+        prev = final
+        if _is_exit(final, hit_exit):
+            return _finish(state, events, moves, "finish", cell=final, last_move_number=last_no, at_start=False)
+
+    new = state.copy(cell=prev, six_count=0, last_move_number=last_no, at_start=False)
+    return Outcome(new, "single", events, moves, combo=combo)
+
+
+def _step_six(state: GameState, events: List[Event]) -> Outcome:
+    """Шестёрка в игре: ход копится в серии, пока не выпадет не-6."""
+    final, chain, hit_exit = _walk(events, state.cell, 6)
+    last_no, planned = plan_moves(start_move_no=state.last_move_number + 1, from_cell=state.cell, rolled=6,
+                                  final_cell=final, chain=chain, at_start=False)
+    if state.six_count > 0:
+        series = state.series + tuple(planned)
+    else:
+        # новая серия: qa_sequence_in_combo=0 на первом ходу
+        planned[0].qa_sequence_in_combo = 0
+        series = tuple(planned)
+    six_count = state.six_count + 1
+    events.append(Event("six", six_count))
+
+    if hit_exit:
+        # финиш посреди серии — отдаём всю серию
+        events.append(Event("series", "released"))
+        return _finish(state, events, list(series), _exit_reason(final), cell=final, last_move_number=last_no)
+
+    new = state.copy(cell=final, six_count=six_count, last_move_number=last_no, series=series)
+    return Outcome(new, "continue", events)
+
+
+def _step_series_end(state: GameState, rolled: int, events: List[Event]) -> Outcome:
+    """Серия завершилась не-6: комбо 3×6 / 4+×6 или обычный финал серии."""
+    held = list(state.series)
+    six_count = state.six_count
+
+    # буфер уже достиг 68 — завершаем немедленно
+    if any(mv.to_cell == EXIT_CELL for mv in held):
+        events.append(Event("series", "released"))
+        last_no = held[-1].move_number if held else state.last_move_number
+        return _finish(state, events, held, "exit_68", cell=EXIT_CELL, last_move_number=last_no)
+
+    move_no = state.last_move_number + 1
+
+    # 3 шестёрки → двигаемся только на X от начала серии; 4+ → длинный ход без правил
+    if six_count >= 3:
+        events.append(Event("series", "dropped"))
+        start_cell = int(held[0].from_cell) if held else state.cell
+        if six_count == 3:
+            shown_roll = rolled
+            final, chain, hit_exit = _walk(events, start_cell, rolled)
+        else:
+            shown_roll = six_count * 6 + rolled
+            final, chain, hit_exit = _walk(events, start_cell, shown_roll, pure=True)
+        last_no, planned = plan_moves(start_move_no=move_no, from_cell=start_cell, rolled=shown_roll,
+                                      final_cell=final, chain=chain, at_start=False)
+        _mark_long_move(planned, f"Довгий хід: {six_count}×6 + {rolled} = {shown_roll}")
+        if _is_exit(final, hit_exit):
+            return _finish(state, events, planned, "exit_68", cell=final, last_move_number=last_no)
+        new = state.copy(cell=final, six_count=0, last_move_number=last_no, series=())
+        return Outcome(new, "single", events, planned, combo=six_count)
+
+    # обычный финал серии: ходы серии + последний бросок
+    final, chain, hit_exit = _walk(events, state.cell, rolled)
+    last_no, planned = plan_moves(start_move_no=move_no, from_cell=state.cell, rolled=rolled,
+                                  final_cell=final, chain=chain, at_start=False)
+    events.append(Event("series", "released"))
+    released = held + planned
+    if _is_exit(final, hit_exit):
+        return _finish(state, events, released, _exit_reason(final), cell=final, last_move_number=last_no)
+    new = state.copy(cell=final, six_count=0, last_move_number=last_no, series=())
+    return Outcome(new, "completed", events, released)
+
+
+def _step_single(state: GameState, rolled: int, events: List[Event]) -> Outcome:
+    final, chain, hit_exit = _walk(events, state.cell, rolled)
+    last_no, planned = plan_moves(start_move_no=state.last_move_number + 1, from_cell=state.cell, rolled=rolled,
+                                  final_cell=final, chain=chain, at_start=False)
+    if _is_exit(final, hit_exit):
+        return _finish(state, events, planned, _exit_reason(final), cell=final, last_move_number=last_no)
+    new = state.copy(cell=final, last_move_number=last_no)
+    return Outcome(new, "single", events, planned)
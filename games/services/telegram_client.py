@@ -0,0 +1,270 @@
+"""
+Клиент Telegram Bot API для синхронного кода (воркер очереди, диспетчер outbox, команды).
+
+Одна requests.Session на процесс: пул keep-alive соединений к api.telegram.org, TLS-рукопожатие —
+один раз на соединение, а не на каждое сообщение. Для всех методов одинаково:
+  - таймауты TELEGRAM_CONNECT_TIMEOUT / TELEGRAM_READ_TIMEOUT (загрузка файлов — TELEGRAM_UPLOAD_TIMEOUT);
+  - лимитер tg_rate перед каждым send*; 429 — ждём parameters.retry_after и повторяем;
+    внутри tg_rate.deferring() не ждём ни то, ни другое: ответ — неуспех с retry_after, ожидание — в Deferred;
+  - повтор с экспоненциальной паузой и jitter только там, где это безопасно: соединение не установлено
+    (запрос до Telegram не дошёл) или 5xx у читающих методов (get*); send* после 5xx не повторяем —
+    сообщение могло уйти, повтор дал бы дубль;
+  - ответ — TelegramResult (ok, result, описание ошибки), сообщения — Message.
+"""
+from __future__ import annotations
+
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from games.services import tg_rate
+
+TG_API_BASE = "https://api.telegram.org"
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def api_url(token: str, method: str) -> str:
+    """URL метода; TELEGRAM_API_BASE — свой Bot API server или локальный фейк (нагрузочные прогоны)."""
+    return f"{_setting('TELEGRAM_API_BASE', TG_API_BASE).rstrip('/')}/bot{token}/{method}"
+
+
+class Message:
+    """Отправленное/полученное сообщение — только поля, которые нужны игре."""
+
+    __slots__ = ("message_id", "chat_id", "text", "dice_value", "photo_file_id", "photo_unique_id", "raw")
+
+    def __init__(self, raw: Dict[str, Any]):
+        self.raw = raw
+        self.message_id: Optional[int] = raw.get("message_id")
+        self.chat_id: Optional[int] = (raw.get("chat") or {}).get("id")
+        self.text: Optional[str] = raw.get("text")
+        self.dice_value: Optional[int] = (raw.get("dice") or {}).get("value")
+        # из размеров фото берём самый большой (последний)
+        photo = raw.get("photo") or []
+        self.photo_file_id: Optional[str] = photo[-1].get("file_id") if photo else None
+        self.photo_unique_id: str = (photo[-1].get("file_unique_id") or "") if photo else ""
+
+    def __repr__(self):
+        return f"Message({self.message_id}, chat={self.chat_id})"
+
+
+class TelegramResult:
+    """
+    Ответ Bot API. raw — прежний dict (JSON Telegram или {"ok": False, "error": ...} при сбое сети /
+    не-JSON ответе): его по-прежнему отдают функции tg_send и /api/start-game/.
+    """
+
+    __slots__ = ("ok", "result", "status_code", "error_code", "description", "retry_after", "raw")
+
+    def __init__(self, raw: Dict[str, Any], status_code: Optional[int] = None):
+        self.raw = raw
+        self.ok = bool(raw.get("ok"))
+        self.result = raw.get("result")
+        self.status_code = status_code
+        self.error_code = raw.get("error_code")
+        self.description = raw.get("description") or raw.get("detail") or raw.get("error")
+        self.retry_after = tg_rate.retry_after(raw)
+
+    @classmethod
+    def from_response(cls, r: requests.Response) -> "TelegramResult":
+        try:
+            data = r.json()
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            data = {"ok": False, "status_code": r.status_code, "text": r.text}
+        return cls(data, r.status_code)
+
+    @classmethod
+    def failure(cls, error: str, detail: str = "") -> "TelegramResult":
+        return cls({"ok": False, "error": error, "detail": detail})
+
+    @classmethod
+    def rate_limited(cls, wait: float) -> "TelegramResult":
+        """Запрос не отправлен: лимит исчерпан, повторить через wait секунд (внутри tg_rate.deferring())."""
+        return cls({"ok": False, "error": "rate_limited", "parameters": {"retry_after": wait}})
+
+    @property
+    def message(self) -> Optional[Message]:
+        return Message(self.result) if self.ok and isinstance(self.result, dict) else None
+
+    @property
+    def messages(self) -> List[Message]:
+        """sendMediaGroup: по сообщению на каждый элемент альбома."""
+        if not (self.ok and isinstance(self.result, list)):
+            return []
+        return [Message(m) for m in self.result if isinstance(m, dict)]
+
+    @property
+    def message_id(self) -> Optional[int]:
+        msg = self.message
+        return msg.message_id if msg is not None else None
+
+    def __bool__(self):
+        return self.ok
+
+    def __repr__(self):
+        return f"TelegramResult(ok={self.ok}, error_code={self.error_code}, description={self.description!r})"
+
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Общая на процесс сессия с пулом соединений (HTTPAdapter без своих повторов — повторяет клиент)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                size = _setting("TELEGRAM_POOL_SIZE", 16)
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=size, max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)  # локальный TELEGRAM_API_BASE
+                _session = session
+    return _session
+
+
+def _never_sent(exc: requests.RequestException) -> bool:
+    """Соединение не установилось — запрос до Telegram не дошёл, повтор ничего не задублирует."""
+    if isinstance(exc, requests.ConnectTimeout):
+        return True
+    reason = getattr(exc.args[0], "reason", None) if exc.args else None
+    return isinstance(exc, requests.ConnectionError) and isinstance(reason, NewConnectionError)
+
+
+class TelegramClient:
+    """Методы Bot API одного бота поверх общей сессии."""
+
+    def __init__(self, token: str, session: Optional[requests.Session] = None):
+        self.token = token
+        self._session = session
+        self.connect_timeout = _setting("TELEGRAM_CONNECT_TIMEOUT", 3.05)
+        self.read_timeout = _setting("TELEGRAM_READ_TIMEOUT", 10)
+        self.upload_timeout = _setting("TELEGRAM_UPLOAD_TIMEOUT", 30)
+        self.retries = _setting("TELEGRAM_RETRIES", 2)
+        self.backoff = _setting("TELEGRAM_RETRY_BACKOFF", 0.5)
+
+    @property
+    def session(self) -> requests.Session:
+        return self._session or get_session()
+
+    def call(self, method: str, payload: Optional[Dict[str, Any]] = None, *, files: Optional[dict] = None,
+             chat_id=None, timeout: Optional[float] = None) -> TelegramResult:
+        """
+        Вызов метода Bot API. С files payload уходит полями multipart (вложенные структуры —
+        уже сериализованными строками), без files — JSON. chat_id — для лимитера по чату.
+        """
+        payload = payload or {}
+        if chat_id is None:
+            chat_id = payload.get("chat_id")
+        read = timeout if timeout is not None else (self.upload_timeout if files else self.read_timeout)
+        kwargs = {"data": payload, "files": files} if files else {"json": payload}
+        idempotent = method.startswith("get")
+        limiter, deferred = tg_rate.get_limiter(), tg_rate.current_deferred()
+        url = api_url(self.token, method)
+
+        attempt = 0
+        while True:
+            if files:
+                for f in files.values():
+                    f.seek(0)
+            if not idempotent:  # get* — не сообщения, лимиты Telegram на них не распространяются
+                if deferred is None:
+                    limiter.acquire(chat_id)
+                elif (wait := limiter.reserve(chat_id)) > 0:
+                    deferred.defer(wait)
+                    return TelegramResult.rate_limited(wait)
+            try:
+                r = self.session.post(url, timeout=(self.connect_timeout, read), **kwargs)
+            except requests.RequestException as e:
+                if attempt < self.retries and (idempotent or _never_sent(e)):
+                    attempt += 1
+                    self._pause(attempt)
+                    continue
+                return TelegramResult.failure("request_exception", str(e))
+
+            res = TelegramResult.from_response(r)
+            if r.status_code == 429 and (attempt < self.retries or deferred is not None):
+                # Telegram запрос не выполнил — повтор безопасен для любого метода
+                wait = res.retry_after if res.retry_after is not None else 1.0
+                limiter.backoff(chat_id, wait)
+                if deferred is not None:
+                    deferred.defer(wait)
+                    return res
+                attempt += 1
+                continue
+            if r.status_code >= 500 and idempotent and attempt < self.retries:
+                attempt += 1
+                self._pause(attempt)
+                continue
+            return res
+
+    def _pause(self, attempt: int) -> None:
+        # экспоненциальная пауза с full jitter: повторы разных потоков не бьют в Telegram одновременно
+        time.sleep(random.uniform(0, self.backoff * 2 ** (attempt - 1)))
+
+    # --- методы, которыми пользуется игра ---
+
+    def send_message(self, chat_id, text: str, **extra) -> TelegramResult:
+        return self.call("sendMessage", {"chat_id": chat_id, "text": text, **extra})
+
+    def send_dice(self, chat_id, emoji: str = "🎲", **extra) -> TelegramResult:
+        return self.call("sendDice", {"chat_id": chat_id, "emoji": emoji, **extra})
+
+    def send_photo(self, chat_id, photo, caption: str = "", **extra) -> TelegramResult:
+        """photo — file_id/URL (строка) или открытый файл (загрузка multipart)."""
+        payload = {"chat_id": chat_id, "caption": caption, **extra}
+        if isinstance(photo, str):
+            return self.call("sendPhoto", {**payload, "photo": photo})
+        return self.call("sendPhoto", payload, files={"photo": photo})
+
+    def send_media_group(self, chat_id, media: List[dict], files: Optional[dict] = None,
+                         **extra) -> TelegramResult:
+        payload = {"chat_id": chat_id, **extra}
+        if files:
+            return self.call("sendMediaGroup", {**payload, "media": json.dumps(media, ensure_ascii=False)},
+                             files=files)
+        return self.call("sendMediaGroup", {**payload, "media": media})
+
+    def get_me(self) -> TelegramResult:
+        return self.call("getMe")
+
+    def get_updates(self, offset: Optional[int] = None, limit: int = 100, timeout: int = 25,
+                    allowed_updates: Optional[List[str]] = None) -> TelegramResult:
+        """Long-polling: Telegram держит запрос до timeout секунд, пока нет апдейтов, — читаем дольше."""
+        payload: Dict[str, Any] = {"limit": limit, "timeout": timeout}
+        if offset is not None:
+            payload["offset"] = offset
+        if allowed_updates is not None:
+            payload["allowed_updates"] = allowed_updates
+        return self.call("getUpdates", payload, timeout=timeout + self.read_timeout)
+
+    def delete_webhook(self, drop_pending_updates: bool = False) -> TelegramResult:
+        return self.call("deleteWebhook", {"drop_pending_updates": drop_pending_updates})
+
+
+_clients: Dict[str, TelegramClient] = {}
+
+
+def get_client(token: Optional[str] = None) -> Optional[TelegramClient]:
+    """Клиент бота (по умолчанию TELEGRAM_BOT_TOKEN); None — токен не задан."""
+    token = token or _setting("TELEGRAM_BOT_TOKEN", None) or os.getenv("TELEGRAM_BOT_TOKEN")
+    if not token:
+        return None
+    client = _clients.get(token)
+    if client is None:
+        client = _clients.setdefault(token, TelegramClient(token))
+    return client
@@ -0,0 +1,127 @@
+"""
+Асинхронный клиент Telegram Bot API для async-вьюх (ASGI, uvicorn).
+
+Один httpx.AsyncClient на event loop: keep-alive соединения к api.telegram.org переиспользуются
+между запросами, HTTP/2 — если установлен пакет h2. Пока запрос ждёт Telegram, воркер
+обслуживает другие чаты, а не держит поток. Клиент закрывается вместе со своим loop: под WSGI
+(async_to_sync) и asyncio.run loop живёт один вызов — соединения не копятся.
+
+Ответы — тот же dict, что у синхронных функций из tg_send (JSON Telegram или {"ok": False, ...}).
+"""
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import os
+import weakref
+from typing import Any, Dict, Optional
+
+import httpx
+from django.conf import settings
+
+from games.services import tg_rate
+from games.services.telegram_client import api_url
+from games.services.tg_send import ALLOWED_DICE_EMOJIS, DEFAULT_TIMEOUT
+
+HTTP2 = importlib.util.find_spec("h2") is not None
+
+# клиент привязан к своему loop: под uvicorn loop один на воркер, под WSGI у каждого запроса свой
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+# клиент -> генератор-сторож, который закроет его при остановке loop
+_guards: Dict[httpx.AsyncClient, Any] = {}
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=getattr(settings, "TELEGRAM_ASYNC_MAX_CONNECTIONS", 100),
+        max_keepalive_connections=getattr(settings, "TELEGRAM_ASYNC_MAX_KEEPALIVE", 20),
+        keepalive_expiry=30.0,
+    )
+
+
+async def _close_with_loop(client: httpx.AsyncClient):
+    """
+    Сторож клиента: asyncio.run (им же запускает корутины async_to_sync) перед закрытием loop
+    вызывает loop.shutdown_asyncgens(), тот закрывает незавершённые async-генераторы — и мы закрываем клиент.
+    """
+    try:
+        yield
+    finally:
+        _guards.pop(client, None)
+        loop = asyncio.get_running_loop()
+        if _clients.get(loop) is client:
+            del _clients[loop]
+        await client.aclose()
+
+
+async def get_client() -> httpx.AsyncClient:
+    """Общий AsyncClient текущего event loop (создаётся при первом запросе, закрывается вместе с loop)."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(http2=HTTP2, limits=_limits(), timeout=DEFAULT_TIMEOUT)
+        _clients[loop] = client
+        _guards[client] = guard = _close_with_loop(client)
+        await guard.asend(None)  # запущенный генератор loop закроет при shutdown_asyncgens()
+    return client
+
+
+async def aclose_client() -> None:
+    """Закрыть клиент текущего loop (shutdown воркера, тесты)."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    guard = _guards.pop(client, None) if client is not None else None
+    if guard is not None:
+        await guard.aclose()
+    elif client is not None:
+        await client.aclose()
+
+
+async def call(token: Optional[str], method: str, payload: Dict[str, Any], *,
+               timeout: float = DEFAULT_TIMEOUT) -> Dict[str, Any]:
+    """
+    POST метода Bot API через лимитер (tg_rate: ожидание — asyncio.sleep, поток не занят);
+    на 429 ждём retry_after и повторяем. Ошибки сети и не-JSON ответы — в dict, как в tg_send.
+    """
+    token = token or os.getenv("TELEGRAM_BOT_TOKEN")
+    if not token:
+        return {"ok": False, "error": "bot_token_not_set"}
+    limiter, chat_id = tg_rate.get_limiter(), payload.get("chat_id")
+    retries = getattr(settings, "TELEGRAM_RETRIES", 2)
+    for attempt in range(retries + 1):
+        await limiter.acquire_async(chat_id)
+        try:
+            client = await get_client()
+            r = await client.post(api_url(token, method), json=payload, timeout=timeout)
+        except httpx.HTTPError as e:
+            return {"ok": False, "error": "request_exception", "detail": str(e)}
+        try:
+            data = r.json()
+        except ValueError:
+            return {"ok": False, "status_code": r.status_code, "text": r.text}
+        if r.status_code != 429 or attempt == retries:
+            return data
+        wait = tg_rate.retry_after(data)
+        limiter.backoff(chat_id, wait if wait is not None else 1.0)
+    return data
+
+
+async def send_dice(token: Optional[str], chat_id: int | str, *, emoji: str = "🎲",
+                    timeout: float = DEFAULT_TIMEOUT) -> Dict[str, Any]:
+    if emoji not in ALLOWED_DICE_EMOJIS:
+        emoji = "🎲"
+    return await call(token, "sendDice", {"chat_id": chat_id, "emoji": emoji}, timeout=timeout)
+
+
+async def send_text_message(token: Optional[str], chat_id: int | str, text: str, *,
+                            timeout: float = DEFAULT_TIMEOUT) -> Dict[str, Any]:
+    return await call(token, "sendMessage", {"chat_id": chat_id, "text": text}, timeout=timeout)
+
+
+async def send_quiz(token: Optional[str], chat_id: int | str, *, prompt_text: str,
+                    timeout: float = DEFAULT_TIMEOUT) -> Dict[str, Any]:
+    payload = {
+        "chat_id": chat_id,
+        "text": prompt_text,
+        "reply_markup": {"force_reply": True, "input_field_placeholder": "Напишите ответ…"},
+    }
+    return await call(token, "sendMessage", payload, timeout=timeout)
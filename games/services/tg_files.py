@@ -0,0 +1,107 @@
+"""
+Кэш file_id картинок карточек в Telegram (модель TelegramFile).
+
+Первая отправка картинки — multipart upload, из ответа sendPhoto запоминаем file_id;
+дальше шлём photo=<file_id>, без чтения файла и загрузки. Ключ — (бот, relpath, sha256 файла):
+файл на диске заменили — хэш другой, промах, загружаем заново, старые записи пути удаляем.
+sha256 считаем один раз на (путь, mtime, размер), file_id держим и в памяти процесса.
+manage.py warm_card_file_ids заранее загружает все карточки доски в служебный чат.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+from games.models import TelegramFile
+
+# (путь, mtime_ns, размер) -> sha256
+_digests: Dict[Tuple[str, int, int], str] = {}
+# (бот, relpath, sha256) -> file_id
+_file_ids: Dict[Tuple[str, str, str], str] = {}
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "uploads": 0, "stale": 0}
+
+
+def bot_id(token: str) -> str:
+    """Числовой id бота из токена ('123456:ABC...' -> '123456'); сам токен не храним."""
+    return str(token).split(":", 1)[0]
+
+
+def file_digest(abs_path: str) -> Optional[str]:
+    """sha256 файла; пересчитываем только если поменялись mtime или размер."""
+    try:
+        st = os.stat(abs_path)
+    except OSError:
+        return None
+    key = (abs_path, st.st_mtime_ns, st.st_size)
+    digest = _digests.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(abs_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with _lock:
+            # прежние версии этого файла больше не нужны
+            for old in [k for k in _digests if k[0] == abs_path]:
+                _digests.pop(old, None)
+            _digests[key] = digest
+    return digest
+
+
+def lookup(token: str, relpath: str, digest: str) -> Optional[str]:
+    """file_id этой версии файла или None (нужно загружать)."""
+    key = (bot_id(token), relpath, digest)
+    file_id = _file_ids.get(key)
+    if file_id is None:
+        file_id = (TelegramFile.objects
+                   .filter(bot_id=key[0], relpath=relpath, sha256=digest)
+                   .values_list("file_id", flat=True).first())
+        if file_id:
+            _file_ids[key] = file_id
+    with _lock:
+        _stats["hits" if file_id else "misses"] += 1
+    return file_id
+
+
+def remember(token: str, relpath: str, digest: str, message) -> Optional[str]:
+    """Запомнить file_id из отправленного сообщения (telegram_client.Message); записи пути с другим хэшем удаляем."""
+    file_id = getattr(message, "photo_file_id", None)
+    if not file_id:
+        return None
+    unique_id = message.photo_unique_id
+    bot = bot_id(token)
+    TelegramFile.objects.filter(bot_id=bot, relpath=relpath).exclude(sha256=digest).delete()
+    TelegramFile.objects.update_or_create(
+        bot_id=bot, relpath=relpath, sha256=digest,
+        defaults={"file_id": file_id, "file_unique_id": unique_id},
+    )
+    with _lock:
+        for old in [k for k in _file_ids if k[0] == bot and k[1] == relpath]:
+            _file_ids.pop(old, None)
+        _file_ids[(bot, relpath, digest)] = file_id
+        _stats["uploads"] += 1
+    return file_id
+
+
+def forget(token: str, relpath: str, digest: str) -> None:
+    """Telegram не принял file_id (бот сменился, файл удалён) — следующая отправка загрузит заново."""
+    bot = bot_id(token)
+    TelegramFile.objects.filter(bot_id=bot, relpath=relpath, sha256=digest).delete()
+    with _lock:
+        _file_ids.pop((bot, relpath, digest), None)
+        _stats["stale"] += 1
+
+
+def clear() -> None:
+    """Сбросить кэши процесса (тесты)."""
+    with _lock:
+        _digests.clear()
+        _file_ids.clear()
+
+
+def file_cache_stats() -> dict:
+    with _lock:
+        return {**_stats, "cached": len(_file_ids)}
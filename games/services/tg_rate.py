@@ -0,0 +1,186 @@
+"""
+Лимитер исходящих сообщений в Telegram вместо фиксированных sleep(3.0).
+
+Два token bucket'а на каждое сообщение:
+  - общий на бота: TELEGRAM_GLOBAL_RATE сообщений/с (у Telegram ~30/с);
+  - на чат: TELEGRAM_CHAT_BURST сообщений подряд без ожидания, дальше TELEGRAM_CHAT_RATE/с
+    (группы — TELEGRAM_GROUP_RATE, у Telegram ~20 в минуту).
+Пока токены есть, сообщения уходят сразу: серия из 5 карточек — за время самих запросов.
+Ждём только когда лимит действительно исчерпан, и ровно столько, сколько осталось до токена.
+429 от Telegram: parameters.retry_after закрывает чат на это время (backoff).
+Диспетчер outbox не ждёт в потоках очередей чатов: отправляет внутри deferring(), и запрос, которому
+пришлось бы ждать токен или retry_after, не выполняется — ожидание возвращается диспетчеру,
+тот откладывает строку outbox (available_at) и занимает поток другими чатами.
+
+Бакеты — в форме GCRA: вместо счётчика токенов храним «теоретическое время прихода» (tat),
+поэтому не нужны фоновые пополнения, а reserve() сразу возвращает, сколько ждать.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+from django.conf import settings
+
+# сколько чатов держим в памяти, прежде чем выбросить простаивающие бакеты
+MAX_CHATS = 10_000
+
+
+class TokenBucket:
+    """rate токенов в секунду, burst подряд без ожидания (GCRA)."""
+
+    __slots__ = ("interval", "tolerance", "tat", "blocked_until")
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.interval = 1.0 / rate
+        self.tolerance = self.interval * (max(1, burst) - 1)
+        self.tat = 0.0
+        self.blocked_until = 0.0
+
+    def allowed_at(self, now: float) -> float:
+        """Когда можно взять следующий токен (now — если прямо сейчас)."""
+        return max(now, self.tat - self.tolerance, self.blocked_until)
+
+    def take(self, at: float) -> None:
+        """Забрать токен в момент at (at >= allowed_at)."""
+        self.tat = max(self.tat, at) + self.interval
+
+    def idle(self, now: float) -> bool:
+        return self.tat <= now and self.blocked_until <= now
+
+
+class RateLimiter:
+    """Общий бакет бота + бакет на каждый чат; потокобезопасный."""
+
+    def __init__(self, global_rate: float, global_burst: int, chat_rate: float, chat_burst: int,
+                 group_rate: float, clock: Callable[[], float] = time.monotonic):
+        self.chat_rate, self.chat_burst, self.group_rate = chat_rate, chat_burst, group_rate
+        self.clock = clock
+        self._global = TokenBucket(global_rate, global_burst)
+        self._chats: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self._stats = {"sent": 0, "delayed": 0, "waited_sec": 0.0, "retry_after": 0}
+
+    def _chat(self, chat_id, now: float) -> TokenBucket:
+        key = str(chat_id)
+        bucket = self._chats.get(key)
+        if bucket is None:
+            if len(self._chats) >= MAX_CHATS:
+                self._chats = {k: b for k, b in self._chats.items() if not b.idle(now)}
+            # id групп и каналов отрицательные
+            group = key.startswith("-")
+            bucket = TokenBucket(self.group_rate if group else self.chat_rate, self.chat_burst)
+            self._chats[key] = bucket
+        return bucket
+
+    def reserve(self, chat_id=None) -> float:
+        """
+        0 — токены бота и чата взяты, можно слать. Иначе ничего не занимаем и возвращаем,
+        сколько ждать до следующей попытки: отложенное сообщение одного чата не должно держать
+        общий бакет и задерживать остальные чаты.
+        """
+        with self._lock:
+            now = self.clock()
+            chat = self._chat(chat_id, now) if chat_id is not None else None
+            ready = self._global.allowed_at(chat.allowed_at(now) if chat is not None else now)
+            if ready > now:
+                return ready - now
+            if chat is not None:
+                chat.take(now)
+            self._global.take(now)
+            self._stats["sent"] += 1
+            return 0.0
+
+    def _waited(self, wait: float) -> None:
+        with self._lock:
+            self._stats["delayed"] += 1
+            self._stats["waited_sec"] += wait
+
+    def acquire(self, chat_id=None) -> None:
+        """Дождаться места под сообщение: ждём ровно до появления токена, без фиксированных пауз."""
+        while (wait := self.reserve(chat_id)) > 0:
+            self._waited(wait)
+            time.sleep(wait)
+
+    async def acquire_async(self, chat_id=None) -> None:
+        while (wait := self.reserve(chat_id)) > 0:
+            self._waited(wait)
+            await asyncio.sleep(wait)
+
+    def backoff(self, chat_id, retry_after: float) -> None:
+        """Telegram ответил 429: в этот чат ничего не шлём retry_after секунд."""
+        with self._lock:
+            now = self.clock()
+            bucket = self._chat(chat_id, now) if chat_id is not None else self._global
+            bucket.blocked_until = max(bucket.blocked_until, now + retry_after)
+            self._stats["retry_after"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "waited_sec": round(self._stats["waited_sec"], 3), "chats": len(self._chats)}
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter() -> RateLimiter:
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter(
+                    global_rate=getattr(settings, "TELEGRAM_GLOBAL_RATE", 30),
+                    global_burst=getattr(settings, "TELEGRAM_GLOBAL_BURST", 30),
+                    chat_rate=getattr(settings, "TELEGRAM_CHAT_RATE", 1.0),
+                    chat_burst=getattr(settings, "TELEGRAM_CHAT_BURST", 5),
+                    group_rate=getattr(settings, "TELEGRAM_GROUP_RATE", 20 / 60),
+                )
+    return _limiter
+
+
+class Deferred:
+    """Сколько ждать до повтора отправки, которую лимитер отложил внутри deferring()."""
+
+    __slots__ = ("wait",)
+
+    def __init__(self):
+        self.wait = 0.0
+
+    def defer(self, wait: float) -> None:
+        self.wait = max(self.wait, wait)
+
+
+_local = threading.local()
+
+
+@contextmanager
+def deferring() -> Iterator[Deferred]:
+    """В этом потоке отправки не ждут лимит, а откладываются: ожидание копится в Deferred."""
+    prev = getattr(_local, "deferred", None)
+    _local.deferred = deferred = Deferred()
+    try:
+        yield deferred
+    finally:
+        _local.deferred = prev
+
+
+def current_deferred() -> Optional[Deferred]:
+    """Deferred объемлющего deferring() или None — тогда отправка ждёт лимит сама (acquire)."""
+    return getattr(_local, "deferred", None)
+
+
+def retry_after(data) -> Optional[float]:
+    """retry_after из JSON-ответа 429 ({"ok": false, "parameters": {"retry_after": N}})."""
+    try:
+        value = (data.get("parameters") or {}).get("retry_after")
+        return float(value) if value is not None else None
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def rate_stats() -> dict:
+    return _limiter.stats() if _limiter is not None else {"sent": 0}
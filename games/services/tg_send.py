@@ -2,20 +2,21 @@ from __future__ import annotations
 
 from typing import Dict, Any, List, Optional
 from django.conf import settings
-from games.services.board import get_cell
+from games.services.card_cache import CAPTION_LIMIT, card_for_move_dict, truncate_caption
+from games.services import tg_files
+from games.services.images import normalize_image_relpath
+from games.services.telegram_client import TelegramResult, get_client
 import os
-from typing import Any, Dict, Optional
-import time
-import requests
 
-SITE_BASE_URL = getattr(settings, "SITE_BASE_URL", "").rstrip("/")
+SITE_BASE_URL = (getattr(settings, "SITE_BASE_URL", None) or "").rstrip("/")
 
 # Где лежат файлы картинок (относительные пути начнутся с "cards/...")
 MEDIA_ROOT = getattr(settings, "PROTECTED_MEDIA_ROOT", "")
-TG_API = "https://api.telegram.org/bot{token}/{method}"
 DEFAULT_TIMEOUT = 10
 # Официально поддерживаемые эмодзи для sendDice:
 ALLOWED_DICE_EMOJIS = {"🎲", "🎯", "🏀", "⚽", "🎳", "🎰"}
+# карточек в одном альбоме sendMediaGroup (ограничение Telegram)
+MEDIA_GROUP_LIMIT = 10
 
 
 # ---------- Утилиты ----------
@@ -29,24 +30,39 @@ def _abs_path_from_rel(rel_path: Optional[str]) -> Optional[str]:
     return os.path.join(MEDIA_ROOT, rel_norm)
 
 
-def _is_good_image_url(url: str, timeout: float = 8.0) -> bool:
-    """Быстрая проверка, что по URL действительно лежит картинка, и она не пустая."""
-    try:
-        r = requests.head(url, allow_redirects=True, timeout=timeout)
-        if r.status_code != 200:
-            return False
-        ct = (r.headers.get("Content-Type") or "").lower()
-        cl = int(r.headers.get("Content-Length") or 0)
-        return ct.startswith("image/") and cl > 0
-    except Exception:
-        return False
-
-
 def _truncate_caption(caption: Optional[str]) -> Optional[str]:
     """Подрезаем подпись под лимит Telegram ~1024 символа."""
-    if caption and len(caption) > 1024:
-        return caption[:1021] + "..."
-    return caption
+    return truncate_caption(caption)
+
+
+def send_card_photo(bot_token: str, chat_id, rel_img: str, caption: Optional[str], *,
+                    disable_notification: bool = False) -> Optional[TelegramResult]:
+    """
+    Картинка карточки с подписью: по file_id из кэша (без чтения файла), иначе загрузкой файла
+    с запоминанием file_id. Возвращает ответ Telegram при успехе, None — если картинку не отправили.
+    """
+    abs_path = _abs_path_from_rel(rel_img)
+    digest = tg_files.file_digest(abs_path) if abs_path else None
+    if not digest:
+        return None
+    client = get_client(bot_token)
+    relpath = normalize_image_relpath(rel_img)
+    extra = {"disable_notification": "true"} if disable_notification else {}  # в multipart — строкой
+
+    file_id = tg_files.lookup(bot_token, relpath, digest)
+    if file_id:
+        res = client.send_photo(chat_id, file_id, caption or "", **extra)
+        if res:
+            return res
+        if res.error_code == 400:
+            tg_files.forget(bot_token, relpath, digest)  # file_id чужого бота / удалён — загрузим заново
+
+    with open(abs_path, "rb") as f:
+        res = client.send_photo(chat_id, f, caption or "", **extra)
+    if not res:
+        return None
+    tg_files.remember(bot_token, relpath, digest, res.message)
+    return res
 
 
 # ---------- Рендер текста хода ----------
@@ -54,121 +70,146 @@ def _truncate_caption(caption: Optional[str]) -> Optional[str]:
 def render_move_text(mv: Dict[str, Any]) -> str:
     """
     Строим текст сообщения по одному ходу.
-    Опираться на возможные поля board.json: title/name, meaning/text/desc.
+    Текст берём из кэша карточек (card_cache) — с доски той версии, на которой сделан ход.
     """
-    to_cell = int(mv.get("to_cell") or 0)
-    from_cell = int(mv.get("from_cell") or 0)
-    rolled = mv.get("rolled")
-    cell = get_cell(to_cell) or {}
-
-    title = cell.get("title") or cell.get("name") or f"Клетка {to_cell}"
-    meaning = cell.get("meaning") or cell.get("text") or cell.get("desc") or ""
-
-    rules = mv.get("applied_rules") or []
-    # Клетка остановки ПЕРЕД правилом (то, что «пропадает» в Telegram):
-    pre_rule_cell = None
-    if rules:
-        try:
-            pre_rule_cell = int(rules[0].get("from"))
-        except Exception:
-            pre_rule_cell = None
-
-    # Красиво опишем цепочку правил
-    if rules:
-        parts = []
-        for r in rules:
-            a = r.get("from")
-            b = r.get("to")
-            t = (r.get("type") or "").lower()
-            label = "лестница" if t == "ladder" else ("змея" if t == "snake" else "правило")
-            parts.append(f"{a} → {b} ({label})")
-        rules_block = "Переходы: " + " ; ".join(parts)
-    else:
-        rules_block = ""
-
-    # Итоговый текст
-    lines = [
-        f"Бросок: {rolled}",
-        f"{from_cell} → {to_cell}",
-        title,
-    ]
-    if meaning:
-        lines.append(meaning)
-
-    # 👇 Вот та самая «промежуточная» клетка (начало стрелы/лестницы)
-    if pre_rule_cell is not None:
-        lines.append(f"Остановились на {pre_rule_cell} — сработало правило.")
-    if rules_block:
-        lines.append(rules_block)
-
-    return "\n".join(lines).strip()
+    return card_for_move_dict(mv).text
 
 
 # ---------- Основная функция ----------
 
+def _card_caption(mv: Dict[str, Any]) -> str:
+    # serialize_move кладёт готовую подпись; для прочих dict — из того же кэша карточек
+    return mv.get("caption") or card_for_move_dict(mv).caption or ""
+
+
+def _send_card(bot_token: str, chat_id, mv: Dict[str, Any]) -> Optional[int]:
+    """Одна карточка: картинка (file_id или загрузка), иначе текст. message_id или None."""
+    text = _truncate_caption(_card_caption(mv))
+    rel_img = mv.get("image_url") or mv.get("image")
+
+    try:
+        # --- 1) Картинка из приватного MEDIA_ROOT: file_id из кэша или загрузка файла ---
+        if rel_img:
+            res = send_card_photo(bot_token, chat_id, rel_img, text)
+            if res:
+                return res.message_id
+    except OSError:
+        pass  # файл не прочитался — хотя бы текст
+
+    # --- 2) Нет картинки или всё упало — шлём текст ---
+    return get_client(bot_token).send_message(chat_id, text).message_id
+
+
 def send_moves_sequentially(
         bot_token: str,
         chat_id: int,
         moves: List[Dict[str, Any]],
-        per_message_delay: float = 3.6,
 ) -> int:
     """
-    Отправляет ходы по очереди.
+    Отправляет ходы по очереди, темп задаёт лимитер (tg_rate), а не паузы.
     Если есть картинка:
-      1) пробуем отправить по URL (photo=<URL>) — только если URL реально отдает image/* и не пустой;
-      2) если URL не валиден или TG вернул ошибку, отправляем как файл (multipart) из MEDIA_ROOT;
-    Если картинки нет — отправляем текст.
+      1) файл из MEDIA_ROOT уже загружен в Telegram — шлём photo=<file_id> (tg_files), без upload;
+      2) иначе отправляем как файл (multipart) и запоминаем file_id из ответа;
+    Если картинки нет или Telegram её не принял — отправляем текст.
     """
-    sent = 0
-    base = f"https://api.telegram.org/bot{bot_token}"
+    return sum(1 for mv in moves if _send_card(bot_token, chat_id, mv) is not None)
 
-    for mv in moves:
 
-        caption = _truncate_caption(render_move_text(mv))
+def _album_item(bot_token: str, mv: Dict[str, Any]):
+    """
+    (media, путь к файлу для загрузки, (relpath, digest)) для карточки, которую можно положить в альбом,
+    или None: нет картинки/файла или подпись длиннее лимита — такую карточку шлём отдельно.
+    """
+    caption = _card_caption(mv)
+    rel_img = mv.get("image_url") or mv.get("image")
+    if not rel_img or len(caption) > CAPTION_LIMIT:
+        return None
+    abs_path = _abs_path_from_rel(rel_img)
+    digest = tg_files.file_digest(abs_path) if abs_path else None
+    if not digest:
+        return None
+    relpath = normalize_image_relpath(rel_img)
+    media = {"type": "photo", "caption": caption}
+    file_id = tg_files.lookup(bot_token, relpath, digest)
+    if file_id:
+        media["media"] = file_id
+        abs_path = None
+    return media, abs_path, (relpath, digest)
+
+
+def _send_album(bot_token: str, chat_id, items: list) -> Optional[List[Optional[int]]]:
+    """Один sendMediaGroup на 2..10 карточек; message_id по каждой или None, если Telegram не принял."""
+    media, files, opened = [], {}, []
+    try:
+        for n, (item, abs_path, _key) in enumerate(items):
+            item = dict(item)
+            if abs_path:
+                name = f"photo{n}"
+                f = open(abs_path, "rb")
+                opened.append(f)
+                files[name] = f
+                item["media"] = f"attach://{name}"
+            media.append(item)
+        res = get_client(bot_token).send_media_group(chat_id, media, files=files or None)
+    finally:
+        for f in opened:
+            f.close()
+
+    if not res:
+        if res.error_code == 400:
+            # среди file_id мог быть чужой/удалённый — отдельные отправки загрузят заново
+            for item, abs_path, (relpath, digest) in items:
+                if not abs_path:
+                    tg_files.forget(bot_token, relpath, digest)
+        return None
+    messages = res.messages
+    ids = []
+    for n, (item, abs_path, (relpath, digest)) in enumerate(items):
+        msg = messages[n] if n < len(messages) else None
+        if abs_path and msg is not None:
+            tg_files.remember(bot_token, relpath, digest, msg)
+        ids.append(msg.message_id if msg is not None else None)
+    return ids
 
-        rel_img = mv.get("image_url") or mv.get("image")
-        abs_path = _abs_path_from_rel(rel_img) if rel_img else None
 
-        time.sleep(3.0)
-        # ... внутри цикла по ходам ...
+def send_moves_batched(
+        bot_token: str,
+        chat_id: int,
+        moves: List[Dict[str, Any]],
+) -> List[Optional[int]]:
+    """
+    Карточки серии альбомами: подряд идущие карточки с картинкой — одним sendMediaGroup
+    (до MEDIA_GROUP_LIMIT штук, подпись у каждой своя). Карточки без картинки, с подписью
+    длиннее лимита, одиночки и альбомы, которые Telegram не принял, уходят по одной (_send_card).
+    Порядок карточек сохраняется. Возвращает message_id каждой карточки (None — не отправлена).
+    """
+    ids: List[Optional[int]] = []
+    run: list = []  # (индекс карточки, item альбома)
+
+    def flush():
+        if len(run) > 1:
+            album = _send_album(bot_token, chat_id, [item for _, item in run])
+            if album is not None:
+                ids.extend(album)
+                run.clear()
+                return
+        ids.extend(_send_card(bot_token, chat_id, moves[i]) for i, _ in run)
+        run.clear()
+
+    for i, mv in enumerate(moves):
         try:
-            # --- 2) Фолбэк: отправка как файла (из приватного MEDIA_ROOT) ---
-            if abs_path:
-                with open(abs_path, "rb") as f:
-                    r = requests.post(
-                        f"{base}/sendPhoto",
-                        data={"chat_id": chat_id, "caption": caption or ""},
-                        files={"photo": f},
-                        timeout=5
-                    )
-                if r.status_code == 200:
-                    sent += 1
-                    continue  # пауза будет в finally
-
-            # --- 3) Нет картинки или всё упало — шлём текст ---
-            r = requests.post(
-                f"{base}/sendMessage",
-                json={"chat_id": chat_id, "text": caption or ""},
-                timeout=8,
-            )
-            if r.status_code == 200:
-                sent += 1
-
+            item = _album_item(bot_token, mv)
         except Exception:
-            # Любая ошибка — хотя бы текст
-            try:
-                r = requests.post(
-                    f"{base}/sendMessage",
-                    json={"chat_id": chat_id, "text": caption or ""},
-                    timeout=8,
-                )
-                if r.status_code == 200:
-                    sent += 1
-            except Exception:
-                # совсем упало — пропускаем
-                pass
-
-    return sent
+            item = None
+        if item is None:
+            flush()
+            ids.append(_send_card(bot_token, chat_id, mv))
+            continue
+        run.append((i, item))
+        if len(run) == MEDIA_GROUP_LIMIT:
+            flush()
+    flush()
+    return ids
 
 
 def send_dice(
@@ -204,20 +245,8 @@ def send_dice(
     if message_thread_id is not None:
         payload["message_thread_id"] = message_thread_id
 
-    try:
-        r = requests.post(
-            TG_API.format(token=token, method="sendDice"),
-            json=payload,
-            timeout=timeout,
-        )
-        # Бывает, что Telegram вернёт HTML в ошибках — защитимся
-        try:
-            data = r.json()
-        except Exception:
-            return {"ok": False, "status_code": r.status_code, "text": r.text}
-        return data
-    except requests.RequestException as e:
-        return {"ok": False, "error": "request_exception", "detail": str(e)}
+    # сбой сети и не-JSON ответ (HTML в ошибках) клиент отдаёт dict'ом {"ok": False, ...}
+    return get_client(token).call("sendDice", payload, timeout=timeout).raw
 
 
 def extract_dice_value(resp: Dict[str, Any]) -> Optional[int]:
@@ -247,14 +276,7 @@ def send_quiz(
         "text": prompt_text,
         "reply_markup": {"force_reply": True, "input_field_placeholder": "Напишите ответ…"},
     }
-    try:
-        r = requests.post(TG_API.format(token=token, method="sendMessage"), json=payload, timeout=timeout)
-        try:
-            return r.json()
-        except Exception:
-            return {"ok": False, "status_code": r.status_code, "text": r.text}
-    except requests.RequestException as e:
-        return {"ok": False, "error": "request_exception", "detail": str(e)}
+    return get_client(token).call("sendMessage", payload, timeout=timeout).raw
 
 
 def send_text_message(
@@ -290,15 +312,4 @@ def send_text_message(
     if message_thread_id is not None:
         payload["message_thread_id"] = message_thread_id
 
-    try:
-        r = requests.post(
-            TG_API.format(token=token, method="sendMessage"),
-            json=payload,
-            timeout=timeout,
-        )
-        try:
-            return r.json()
-        except Exception:
-            return {"ok": False, "status_code": r.status_code, "text": r.text}
-    except requests.RequestException as e:
-        return {"ok": False, "error": "request_exception", "detail": str(e)}
+    return get_client(token).call("sendMessage", payload, timeout=timeout).raw
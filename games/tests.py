@@ -1,3 +1,636 @@
-from django.test import TestCase
+import io
+import json
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from games.services import game_utils as utils
+from games.services.entry_step_result import EntryStepResult
+
+
+class TransitionTableParityTests(SimpleTestCase):
+    """Таблица переходов должна давать ровно то же, что пошаговый обход."""
+
+    def test_walks_match_step_by_step(self):
+        for start in range(EntryStepResult.BOARD_MAX + 1):
+            for steps in range(1, utils.TransitionTable.MAX_ROLL + 1):
+                with self.subTest(start=start, steps=steps):
+                    self.assertEqual(
+                        utils.walk_n_steps(start, steps),
+                        utils._walk_n_steps_uncached(start, steps),
+                    )
+
+    def test_pure_moves_match(self):
+        for start in range(EntryStepResult.BOARD_MAX + 1):
+            for steps in range(0, EntryStepResult.BOARD_MAX * 2):
+                with self.subTest(start=start, steps=steps):
+                    self.assertEqual(
+                        utils.walk_pure_no_rules(start, steps),
+                        utils._walk_pure_no_rules_uncached(start, steps),
+                    )
+
+    def test_table_rebuilt_only_on_board_change(self):
+        table = utils.get_transition_table()
+        self.assertIs(utils.get_transition_table(), table)
+
+    def test_lookup_returns_fresh_chain(self):
+        _, chain, _ = utils.walk_n_steps(4, 6)  # 10 -> 23 (лестница)
+        self.assertEqual(chain, [[10, 23]])
+        chain.append([0, 0])
+        self.assertEqual(utils.walk_n_steps(4, 6)[1], [[10, 23]])
+
+
+class AltMapCacheTests(SimpleTestCase):
+    def test_alt_map_built_once_per_board_version(self):
+        utils.get_alt_map()
+        before = utils.get_alt_map_stats()
+        for cell in range(EntryStepResult.BOARD_MAX + 1):
+            utils.resolve_full(cell)
+        after = utils.get_alt_map_stats()
+        self.assertEqual(after["misses"], before["misses"])
+        self.assertGreater(after["hits"], before["hits"])
+        self.assertEqual(utils.get_alt_map()[10], 23)
+
+
+class BoardChainTests(SimpleTestCase):
+    def test_chain_is_absorbing_and_consistent(self):
+        from games.services.board_analytics import BoardChain
+
+        chain = BoardChain()
+        dist = chain.rolls_distribution()
+        self.assertAlmostEqual(dist.sum(), 1.0, places=6)
+        mean = sum((t + 1) * p for t, p in enumerate(dist))
+        self.assertAlmostEqual(mean, chain.expected_rolls(), places=3)
+        self.assertAlmostEqual(chain.visit_probabilities()[1], 1.0, places=9)
+
+
+class BoardSimulatorTests(SimpleTestCase):
+    def test_batch_agrees_with_markov_chain(self):
+        import numpy as np
+
+        from games.services.board_analytics import BoardChain
+        from games.services.board_simulator import build_tables, simulate_batch
+
+        games = 20000
+        out = simulate_batch(build_tables(), games, seed=1)
+        hist = out["rolls"]
+        self.assertEqual((int(hist.sum()), int(out["truncated"][0])), (games, 0))
+        values = np.arange(hist.size)
+        mean = (values * hist).sum() / games
+        std = np.sqrt(((values - mean) ** 2 * hist).sum() / games)
+        # среднее число бросков — в пределах 5 стандартных ошибок от точного ответа цепи Маркова
+        self.assertLess(abs(mean - BoardChain().expected_rolls()), 5 * std / np.sqrt(games))
+
+    def test_workers_merge_matches_serial_run(self):
+        from games.services.board_simulator import METRICS, simulate
+
+        serial = simulate(3000, batch_size=1000, seed=7)
+        parallel = simulate(3000, batch_size=1000, workers=2, seed=7)
+        # пачки получают те же seed'ы — слияние по процессам должно дать ровно те же гистограммы
+        self.assertEqual(parallel["metrics"], serial["metrics"])
+        for m in METRICS:
+            self.assertEqual(sum(parallel["metrics"][m]["histogram"]), 3000)
+
+
+class BoardArtifactTests(SimpleTestCase):
+    def test_artifact_roundtrip(self):
+        import tempfile
+        from pathlib import Path
+
+        from games.services import board
+        from games.services.board_artifact import load_artifact, walks_equal, write_artifact
+
+        compiled = board.compile_board(board.get_board())
+        table = utils.TransitionTable(compiled)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "board.bin"
+            write_artifact(path, compiled, table.walks, board.DATA_PATH.read_bytes(), source=board.DATA_PATH)
+            mapped = load_artifact(path, board.DATA_PATH)
+            self.assertIsNotNone(mapped)
+            self.assertEqual(mapped.version, compiled.version)
+            self.assertTrue(walks_equal(mapped, table.walks))
+            self.assertEqual(mapped.walks[5][3], table.walks[5][3])
+            self.assertIs(mapped.cell(5), mapped.cell(5))  # клетка разбирается один раз
+            for n in range(EntryStepResult.BOARD_MAX + 2):
+                a, b = compiled.cell(n), mapped.cell(n)
+                self.assertEqual(a is None, b is None)
+                self.assertEqual(compiled.jump_target(n), mapped.jump_target(n))
+                self.assertEqual(compiled.title(n), mapped.title(n))
+                self.assertEqual(compiled.image_name(n), mapped.image_name(n))
+                if a is not None:
+                    self.assertEqual((a.data, a.title, a.image, a.jump_to), (b.data, b.title, b.image, b.jump_to))
+
+            # board.json не менялся (размер и mtime как в заголовке) — артефакт принимается без чтения файла
+            with mock.patch.object(Path, "read_bytes", side_effect=AssertionError("board.json read")):
+                self.assertIsNotNone(load_artifact(path, board.DATA_PATH))
+
+            # артефакт от другого board.json не подхватывается
+            stale = Path(tmp) / "other.json"
+            stale.write_text("[]", encoding="utf-8")
+            self.assertIsNone(load_artifact(path, stale))
+
+
+class BoardVersionPinningTests(TestCase):
+    def test_game_keeps_its_board_version(self):
+        from games.models import BoardSnapshot
+        from games.services import board
+
+        data = json.loads(board.DATA_PATH.read_text(encoding="utf-8"))
+        data[9]["ladder_to"] = None  # клетка 10 без лестницы
+        old_version = board.board_version(data)
+
+        # версии нет в памяти процесса (другой воркер, рестарт после деплоя) — поднимаем из БД
+        BoardSnapshot.objects.create(version=old_version, source=json.dumps(data, ensure_ascii=False))
+        with mock.patch.dict(board._versions, clear=False):
+            board._versions.pop(old_version, None)
+            self.assertEqual(board.get_board_by_version(old_version).version, old_version)
+
+            with board.use_board_version(old_version):
+                self.assertEqual(utils.walk_n_steps(4, 6), (10, [], False))
+            self.assertEqual(utils.walk_n_steps(4, 6), (23, [[10, 23]], False))
+
+        self.assertIsNone(board.get_board_by_version("unknown"))
+        with board.use_board_version("unknown"):
+            self.assertEqual(board.get_compiled_board().version, board.current_board_version())
+
+    def test_unknown_version_falls_back_to_game_locale(self):
+        import tempfile
+        from pathlib import Path
+
+        from games.models import Game
+        from games.services import board
+
+        data = json.loads(board.DATA_PATH.read_text(encoding="utf-8"))
+        data[0]["title"] = "Народження (en)"
+        with tempfile.TemporaryDirectory() as tmp:
+            en = Path(tmp) / "board-en.json"
+            en.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+            boards = {("", "uk"): "board.json", ("", "en"): str(en)}
+            with override_settings(BOARDS=boards, BOARD_ARTIFACT_PATH=None), \
+                    mock.patch.object(board, "registry", board.BoardRegistry()):
+                game = Game(game_type="telegram_dice", board_version="unknown", meta={"locale": "en-US"})
+                with board.use_board_version(game.board_version, game.game_type, game.meta["locale"]) as b:
+                    self.assertEqual(b.title(1), "Народження (en)")
+                    self.assertIs(b, board.board_for_game(game))
+
+    def test_old_versions_and_their_caches_are_evicted(self):
+        from collections import OrderedDict
+
+        from games.models import BoardSnapshot
+        from games.services import board
+
+        current = board.get_compiled_board()
+        versions = []
+        for cell in (10, 17):
+            data = json.loads(board.DATA_PATH.read_text(encoding="utf-8"))
+            data[cell - 1]["ladder_to"] = None
+            versions.append(board.board_version(data))
+            BoardSnapshot.objects.create(version=versions[-1], source=json.dumps(data, ensure_ascii=False))
+        v1, v2 = versions
+
+        with override_settings(BOARD_VERSIONS_CACHE=2), \
+                mock.patch.object(board, "_versions", OrderedDict([(current.version, current)])):
+            with board.use_board_version(v1):
+                utils.walk_n_steps(4, 6)
+            self.assertIn(v1, utils._transitions)
+            with board.use_board_version(v2):
+                utils.walk_n_steps(4, 6)
+            # v1 вытеснена вместе с таблицей переходов; доска реестра остаётся
+            self.assertNotIn(v1, board._versions)
+            self.assertNotIn(v1, utils._transitions)
+            self.assertIn(current.version, board._versions)
+            # игра на v1 поднимет её снова из BoardSnapshot
+            self.assertEqual(board.get_board_by_version(v1).version, v1)
+            self.assertNotIn(v2, board._versions)
+
+    def test_pinning_stores_snapshot(self):
+        from games.models import BoardSnapshot
+        from games.services import board
+
+        version = board.pin_board_version()
+        with self.assertNumQueries(1):  # снапшот уже есть — только проверка
+            board.pin_board_version()
+        snap = BoardSnapshot.objects.get(version=version)
+        self.assertEqual(board.board_version(json.loads(snap.source)), version)
+
+
+class BoardRegistryTests(SimpleTestCase):
+    def test_locale_fallback_and_lru(self):
+        import json
+        import tempfile
+        from pathlib import Path
+
+        from django.test import override_settings
+
+        from games.services import board
+
+        data = json.loads(board.DATA_PATH.read_text(encoding="utf-8"))
+        data[0]["title"] = "Народження (en)"
+        with tempfile.TemporaryDirectory() as tmp:
+            en = Path(tmp) / "board-en.json"
+            en.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+            boards = {("", "uk"): "board.json", ("", "en"): str(en)}
+            with override_settings(BOARDS=boards, BOARD_REGISTRY_SIZE=1, BOARD_ARTIFACT_PATH=None):
+                reg = board.BoardRegistry()
+                self.assertEqual(reg.resolve_path("telegram_dice", "en-US"), en.resolve())
+                self.assertEqual(reg.resolve_path("telegram_dice", "de"), board.DATA_PATH)
+
+                self.assertEqual(reg.get(locale="en").title(1), "Народження (en)")
+                self.assertEqual(reg.get(locale="en").version, board.board_version(data))
+                reg.get(locale="uk")
+                self.assertEqual(reg.stats()["evictions"], 1)
+                self.assertEqual((reg.stats()["hits"], reg.stats()["misses"]), (1, 2))
+
+
+class CardCacheTests(SimpleTestCase):
+    def test_card_is_built_once_per_move_shape(self):
+        from games.services import card_cache
+        from games.services.tg_send import render_move_text
+
+        mv = {"from_cell": 4, "to_cell": 23, "rolled": 6,
+              "applied_rules": [{"from": 10, "to": 23, "type": "ladder"}]}
+        before = card_cache.get_card_cache_stats()
+        text = render_move_text(mv)
+        self.assertIs(card_cache.card_for_move_dict(dict(mv)), card_cache.card_for_move_dict(mv))
+        after = card_cache.get_card_cache_stats()
+        self.assertEqual(after["hits"] - before["hits"], 2)
+
+        self.assertTrue(text.startswith("Бросок: 6\n4 → 23\n"))
+        self.assertIn("Остановились на 10 — сработало правило.", text)
+        self.assertIn("Переходы: 10 → 23 (лестница)", text)
+
+    def test_caption_is_pre_truncated(self):
+        from games.services.card_cache import CAPTION_LIMIT, truncate_caption
+
+        self.assertEqual(len(truncate_caption("x" * 5000)), CAPTION_LIMIT)
+        self.assertEqual(truncate_caption("short"), "short")
+
+
+class TelegramRateLimiterTests(SimpleTestCase):
+    def setUp(self):
+        from games.services.tg_rate import RateLimiter
+
+        self.now = [100.0]
+        self.limiter = RateLimiter(global_rate=30, global_burst=30, chat_rate=1.0, chat_burst=5,
+                                   group_rate=20 / 60, clock=lambda: self.now[0])
+
+    def test_series_goes_out_without_waiting_then_chat_pace(self):
+        self.assertEqual([self.limiter.reserve(42) for _ in range(5)], [0.0] * 5)
+        self.assertAlmostEqual(self.limiter.reserve(42), 1.0)
+        self.assertAlmostEqual(self.limiter.reserve(42), 1.0)  # пока ждём — ничего не занято
+        self.assertEqual(self.limiter.reserve(43), 0.0)  # другой чат не ждёт
+        self.now[0] += 10
+        self.assertEqual(self.limiter.reserve(42), 0.0)
+
+    def test_global_rate_across_chats(self):
+        waits = [self.limiter.reserve(chat) for chat in range(31)]
+        self.assertEqual(waits[:30], [0.0] * 30)
+        self.assertAlmostEqual(waits[30], 1 / 30)
+
+    def test_429_retry_after_is_honoured(self):
+        from games.services import telegram_client, tg_rate, tg_send
+
+        slept = []
+
+        def fake_sleep(sec):
+            slept.append(sec)
+            self.now[0] += sec
+
+        limited = mock.Mock(status_code=429, json=lambda: {"ok": False, "parameters": {"retry_after": 7}})
+        ok = mock.Mock(status_code=200, json=lambda: {"ok": True, "result": {"message_id": 5}})
+        with mock.patch.object(tg_rate, "get_limiter", lambda: self.limiter), \
+                mock.patch.object(tg_rate.time, "sleep", fake_sleep), \
+                mock.patch.object(telegram_client.get_session(), "post", side_effect=[limited, ok]) as post:
+            resp = tg_send.send_text_message("t", 42, "hi")
+        self.assertEqual(resp["result"]["message_id"], 5)
+        self.assertEqual(post.call_count, 2)
+        self.assertEqual(slept, [7.0])
+        self.assertEqual(self.limiter.stats()["retry_after"], 1)
+
+
+class TelegramClientTests(SimpleTestCase):
+    def setUp(self):
+        import requests
+        from games.services.telegram_client import TelegramClient
+
+        self.requests = requests
+        self.session = mock.Mock()
+        self.client = TelegramClient("1:t", session=self.session)
+        patcher = mock.patch.object(TelegramClient, "_pause")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _ok(self, result):
+        return mock.Mock(status_code=200, json=lambda: {"ok": True, "result": result})
+
+    def test_send_retried_only_when_request_never_left(self):
+        self.session.post.side_effect = [self.requests.ConnectTimeout("connect"), self._ok(
+            {"message_id": 5, "chat": {"id": 9101}, "text": "hi"})]
+        res = self.client.send_message(9101, "hi")
+        self.assertEqual((res.ok, res.message_id, res.message.chat_id), (True, 5, 9101))
+
+        self.session.post.reset_mock(side_effect=True)
+        self.session.post.side_effect = self.requests.ReadTimeout("read")  # могло дойти — не дублируем
+        res = self.client.send_message(9101, "hi")
+        self.assertFalse(res)
+        self.assertEqual(res.raw["error"], "request_exception")
+        self.assertEqual(self.session.post.call_count, 1)
+
+    def test_reads_retry_5xx_and_errors_are_typed(self):
+        bad = mock.Mock(status_code=502, json=mock.Mock(side_effect=ValueError), text="<html>")
+        self.session.post.side_effect = [bad, self._ok({"id": 1, "is_bot": True})]
+        self.assertTrue(self.client.get_me())
+
+        self.session.post.reset_mock(side_effect=True)
+        self.session.post.side_effect = [mock.Mock(status_code=400, json=lambda: {
+            "ok": False, "error_code": 400, "description": "Bad Request: wrong file identifier"})]
+        res = self.client.send_photo(9102, "FILE")
+        self.assertEqual((res.ok, res.error_code, res.message), (False, 400, None))
+        self.assertEqual(self.session.post.call_count, 1)
+        _, kwargs = self.session.post.call_args
+        self.assertEqual(kwargs["timeout"], (self.client.connect_timeout, self.client.read_timeout))
+
+
+class TelegramFileCacheTests(TestCase):
+    def setUp(self):
+        import os
+        import tempfile
+        from games.services import tg_files, tg_send
+
+        tg_files.clear()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.card = f"{tmp.name}/cards/7.jpg"
+        os.makedirs(os.path.dirname(self.card))
+        with open(self.card, "wb") as f:
+            f.write(b"jpeg-v1")
+        patcher = mock.patch.object(tg_send, "MEDIA_ROOT", tmp.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _photo(self, file_id):
+        return mock.Mock(status_code=200, json=lambda: {"ok": True, "result": {"photo": [
+            {"file_id": "small"}, {"file_id": file_id, "file_unique_id": "u-" + file_id}]}})
+
+    def test_upload_once_then_file_id_and_reupload_when_file_changes(self):
+        from games.models import TelegramFile
+        from games.services import telegram_client, tg_send
+
+        with mock.patch.object(telegram_client.get_session(), "post",
+                               side_effect=[self._photo("F1"), self._photo("F1"), self._photo("F2")]) as post:
+            for _ in range(2):
+                self.assertTrue(tg_send.send_card_photo("123:abc", 9001, "cards/7.jpg", "cap"))
+            first, second = post.call_args_list
+            self.assertIn("files", first.kwargs)                       # первая отправка — загрузка файла
+            self.assertNotIn("files", second.kwargs)                   # дальше — по file_id
+            self.assertEqual(second.kwargs["json"]["photo"], "F1")
+
+            with open(self.card, "wb") as f:
+                f.write(b"jpeg-v2, new picture")
+            self.assertTrue(tg_send.send_card_photo("123:abc", 9001, "cards/7.jpg", "cap"))
+            self.assertIn("files", post.call_args.kwargs)              # файл поменялся — загружаем заново
+        row = TelegramFile.objects.get()
+        self.assertEqual((row.bot_id, row.relpath, row.file_id), ("123", "cards/7.jpg", "F2"))
+
+    def test_force_dry_run_keeps_cached_file_ids(self):
+        from django.core.management import call_command
+        from games.management.commands.warm_card_file_ids import Command
+        from games.services import telegram_client, tg_files, tg_send
+
+        with mock.patch.object(telegram_client.get_session(), "post", return_value=self._photo("F1")):
+            self.assertTrue(tg_send.send_card_photo("123:abc", 9001, "cards/7.jpg", "cap"))
+        out = io.StringIO()
+        with override_settings(TELEGRAM_BOT_TOKEN="123:abc"), \
+                mock.patch.object(Command, "_card_images", return_value=["cards/7.jpg"]):
+            call_command("warm_card_file_ids", "--force", "--dry-run", stdout=out)
+        self.assertIn("would upload cards/7.jpg", out.getvalue())
+        digest = tg_files.file_digest(self.card)
+        self.assertEqual(tg_files.lookup("123:abc", "cards/7.jpg", digest), "F1")
+
+
+    def test_series_goes_out_as_album_with_singles_for_text_cards(self):
+        import os
+        from games.services import telegram_client, tg_send
+
+        os.replace(self.card, self.card.replace("7.jpg", "8.jpg"))
+        with open(self.card, "wb") as f:
+            f.write(b"jpeg-7")
+        cards = [{"image_url": "cards/7.jpg", "caption": "a"}, {"image_url": "cards/8.jpg", "caption": "b"},
+                 {"caption": "text only"}, {"image_url": "cards/7.jpg", "caption": "x" * 2000}]
+        album = mock.Mock(status_code=200, json=lambda: {"ok": True, "result": [
+            {"message_id": 11, "photo": [{"file_id": "F7"}]}, {"message_id": 12, "photo": [{"file_id": "F8"}]}]})
+        text = mock.Mock(status_code=200, json=lambda: {"ok": True, "result": {"message_id": 13}})
+        photo = mock.Mock(status_code=200, json=lambda: {"ok": True, "result": {"message_id": 14, "photo": []}})
+        with mock.patch.object(telegram_client.get_session(), "post", side_effect=[album, text, photo]) as post:
+            ids = tg_send.send_moves_batched("123:abc", 9002, cards)
+        self.assertEqual(ids, [11, 12, 13, 14])
+        methods = [c.args[0].rsplit("/", 1)[1] for c in post.call_args_list]
+        self.assertEqual(methods, ["sendMediaGroup", "sendMessage", "sendPhoto"])
+        media = json.loads(post.call_args_list[0].kwargs["data"]["media"])
+        self.assertEqual([(m["media"], m["caption"]) for m in media], [("attach://photo0", "a"), ("attach://photo1", "b")])
+        self.assertEqual(post.call_args_list[2].kwargs["json"]["photo"], "F7")  # file_id из ответа альбома
+
+
+class AsyncStartGameTests(TestCase):
+    def test_async_endpoint_creates_game_and_awaits_telegram(self):
+        from games import api_start
+        from games.models import Game
+        from games.services import tg_async
+
+        send = mock.AsyncMock(return_value={"ok": True, "result": {"dice": {"value": 4}}})
+        with mock.patch.object(api_start, "BOT_TOKEN", "t"), mock.patch.object(tg_async, "send_dice", send):
+            resp = self.client.post("/api/start-game/", {"chat_id": 777, "email": "a@example.local"},
+                                    content_type="application/json")
+        self.assertEqual(resp.status_code, 200)
+        game = Game.objects.get(player__telegram_id=777, is_active=True)
+        self.assertEqual(resp.json()["game_id"], str(game.id))
+        send.assert_awaited_once_with("t", 777)
+
+
+class AsyncClientLifetimeTests(SimpleTestCase):
+    def test_client_is_closed_with_its_loop(self):
+        from asgiref.sync import async_to_sync
+
+        from games.services import tg_async
+
+        async def one_call():
+            client = await tg_async.get_client()
+            self.assertIs(await tg_async.get_client(), client)
+            return client
+
+        # под WSGI у каждого async_to_sync свой loop — клиент не должен пережить его
+        clients = [async_to_sync(one_call)() for _ in range(3)]
+        self.assertEqual(len({id(c) for c in clients}), 3)
+        self.assertTrue(all(c.is_closed for c in clients))
+        self.assertFalse(any(c in tg_async._guards for c in clients))
+
+
+class RollQueryCountTests(TestCase):
+    """Бросок = SELECT FOR UPDATE игры + один INSERT ходов (если серия разрешилась) + один UPDATE игры + savepoint."""
+
+    def setUp(self):
+        from games.models import Game
+        from players.models import Player
+
+        self.player = Player.objects.create(email="p@example.com", telegram_id=1)
+        self.game = Game.objects.create(player=self.player, current_cell=0, last_move_number=0)
+
+    def _play(self, cell: int, six_count: int = 0, held_from: int = 0):
+        """Игра уже в процессе: один подтверждённый ход и held_from.. — ходы серии в буфере."""
+        from games.models import Move
+        from games.services import apply_roll
+        from games.services.rules_engine import PlannedMove
+
+        first = Move.objects.create(game=self.game, move_number=1, from_cell=0, to_cell=held_from or cell)
+        self.game.confirmed_moves = self.game.unanswered_moves = 1
+        self.game.next_unanswered_move = first
+        self.game.meta = {apply_roll.SERIES_KEY: [
+            PlannedMove(2 + k, 6, held_from + 6 * k, held_from + 6 * (k + 1)).to_row() for k in range(six_count)
+        ]}
+        self.game.current_cell = cell
+        self.game.current_six_number = six_count
+        self.game.last_move_number = 1 + six_count
+        self.game.save()
+
+    def _roll(self, rolled: int, queries: int):
+        from games.services.entry import GameEntryManager
+
+        with self.assertNumQueries(queries):
+            return GameEntryManager().apply_roll(self.game, rolled)
+
+    def test_start_waiting_for_six(self):
+        self.assertEqual(self._roll(3, 4).status, "ignored")
+
+    def test_start_collecting_sixes(self):
+        self.assertEqual(self._roll(6, 4).status, "continue")
+
+    def test_start_combo(self):
+        self.game.current_six_number = 1
+        self.game.save()
+        res = self._roll(3, 5)
+        self.assertEqual(res.status, "single")
+        self.assertTrue(all(m["id"] for m in res.moves))
+
+    def test_start_long_move(self):
+        self.game.current_six_number = 4
+        self.game.save()
+        res = self._roll(3, 5)
+        self.assertEqual(res.moves[-1]["event_type"], "long_move")
+
+    def test_single_move(self):
+        self._play(20)
+        self.assertEqual(self._roll(1, 5).status, "single")
+
+    def test_series_start(self):
+        from games.models import Move
+        from games.services import apply_roll
+
+        self._play(20)
+        self.assertEqual(self._roll(6, 4).status, "continue")
+        self.assertEqual(Move.objects.filter(game=self.game).count(), 1)  # ход серии — только в буфере
+        self.game.refresh_from_db()
+        self.assertEqual(len(self.game.meta[apply_roll.SERIES_KEY]), 1)
+
+    def test_series_continue(self):
+        self._play(26, six_count=1, held_from=20)
+        self.assertEqual(self._roll(6, 4).status, "continue")
+
+    def test_series_end(self):
+        from games.services import apply_roll
+
+        self._play(26, six_count=1, held_from=20)
+        res = self._roll(1, 5)
+        self.assertEqual(res.status, "completed")
+        self.assertEqual([m["on_hold"] for m in res.moves], [False] * len(res.moves))
+        self.assertEqual(res.moves[0]["move_number"], 2)  # сначала ходы из буфера серии
+        self.game.refresh_from_db()
+        self.assertNotIn(apply_roll.SERIES_KEY, self.game.meta)
+
+    def test_series_combo(self):
+        self._play(38, six_count=3, held_from=20)
+        self.assertEqual(self._roll(1, 5).status, "single")
+
+    def test_counters_follow_moves_and_answers(self):
+        from django.core.management import call_command
+        from games.models import Game
+        from games.services.game_utils import save_answer
+
+        self.game.current_six_number = 1
+        self.game.save()
+        moves = self._roll(3, 5).moves
+        self.game.refresh_from_db()
+        self.assertEqual((self.game.confirmed_moves, self.game.unanswered_moves), (len(moves), len(moves)))
+        self.assertEqual(self.game.next_unanswered_move_id, moves[0]["id"])
+
+        first = self.game.next_unanswered_move
+        with self.assertNumQueries(3):
+            nxt = save_answer(first, "ok")
+        self.game.refresh_from_db()
+        self.assertEqual(self.game.unanswered_moves, len(moves) - 1)
+        self.assertEqual(self.game.next_unanswered_move_id, nxt.id if nxt else None)
+
+        Game.objects.filter(pk=self.game.pk).update(confirmed_moves=0, unanswered_moves=0, next_unanswered_move=None)
+        call_command("repair_game_counters", "--chunk-size", "1", stdout=io.StringIO())
+        self.game.refresh_from_db()
+        self.assertEqual((self.game.confirmed_moves, self.game.unanswered_moves), (len(moves), len(moves) - 1))
+        self.assertEqual(self.game.next_unanswered_move_id, nxt.id if nxt else None)
+
+    @override_settings(TELEGRAM_BOT_TOKEN="1:T")
+    def test_finish_analysis_runs_after_commit(self):
+        from games.services import apply_roll
+        from games.services.entry import GameEntryManager
+        from webhooks.models import OutboxMessage
+
+        self._play(66)
+        with mock.patch.object(apply_roll, "_finish_analysis", return_value="Розбір гри.") as analysis, \
+                self.captureOnCommitCallbacks() as callbacks:
+            res = GameEntryManager().apply_roll(self.game, 2)
+            analysis.assert_not_called()  # OpenAI не держит транзакцию броска
+        self.assertEqual(res.status, "finished")
+        self.assertEqual(res.message, "Вихід через 68. Гра завершена.")
+        with mock.patch.object(apply_roll, "_finish_analysis", return_value="Розбір гри."):
+            for callback in callbacks:
+                callback()
+        self.game.refresh_from_db()
+        self.assertEqual(self.game.meta[apply_roll.ANALYSIS_KEY], "Розбір гри.")
+        self.assertEqual(OutboxMessage.objects.get().payload["text"], "Вихід через 68. Гра завершена. Розбір гри.")
+
+    @override_settings(GAME_ROLL_LOG=4)
+    def test_roll_log_is_capped_and_replay_still_matches(self):
+        from games.services import replay
+        from games.services.entry import GameEntryManager
+
+        rolls = [3, 6, 6, 2, 4, 5, 1, 3, 2, 4, 5, 6, 1, 2]
+        for rolled in rolls:
+            GameEntryManager().apply_roll(self.game, rolled)
+        self.game.refresh_from_db()
+        log, checkpoint = self.game.meta[replay.ROLLS_KEY], self.game.meta[replay.CHECKPOINT_KEY]
+        self.assertLessEqual(len(log), 4)
+        self.assertEqual(checkpoint["rolls"] + len(log), len(rolls))
+        out = replay.replay_game(self.game)
+        self.assertEqual((out["rolls"], out["replayed_from"]), (len(rolls), checkpoint["rolls"]))
+        self.assertTrue(out["matches"])
+
+
+class RulesEngineTests(SimpleTestCase):
+    def test_step_is_pure(self):
+        from games.services.rules_engine import GameState, step
+
+        state = GameState(cell=20, six_count=3, at_start=False, last_move_number=7)
+        out = step(state, 6)
+        self.assertEqual((state.cell, state.six_count, state.series), (20, 3, ()))
+        self.assertEqual(out.status, "continue")
+        self.assertEqual(out.moves, [])  # ход серии — в out.state.series, не к записи
+        self.assertEqual(out.state.six_count, 4)
+
+    def test_series_combo_moves_from_series_start(self):
+        from games.services.rules_engine import GameState, step
+
+        state = GameState(cell=20, at_start=False, last_move_number=1)
+        for _ in range(3):
+            state = step(state, 6).state
+        out = step(state, 2)
+        self.assertEqual(out.status, "single")
+        self.assertEqual(out.moves[0].from_cell, 20)
+        self.assertEqual(out.moves[0].event_type, "long_move")
+        self.assertEqual([e.value for e in out.events if e.kind == "series"], ["dropped"])
@@ -1,13 +1,40 @@
+from time import monotonic
 from typing import Optional, Tuple
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+
 from .models import GameSettings
 
+# Настройки оплаты меняются из админки раз в сто лет, а читаются на каждом апдейте с paywall:
+# держим их в памяти процесса. Свой процесс сбрасывает кэш по сигналу, остальные воркеры — по TTL.
+PAYMENT_CONFIG_TTL = float(getattr(settings, "PAYMENT_CONFIG_TTL", 60.0))
+
+_payment_cache = {"value": None, "loaded_at": 0.0}
+
 
 def get_payment_config() -> Tuple[Optional[str], Optional[str]]:
     """
     Возвращает (payment_url, payment_message) из GameSettings.
     Если настроек нет или ссылка пустая — (None, None).
     """
+    now = monotonic()
+    if _payment_cache["value"] is not None and now - _payment_cache["loaded_at"] < PAYMENT_CONFIG_TTL:
+        return _payment_cache["value"]
+
     cfg = GameSettings.objects.first()
     if not cfg or not cfg.payment_url:
-        return None, None
-    return cfg.payment_url, (cfg.payment_message or "")
+        value = (None, None)
+    else:
+        value = (cfg.payment_url, (cfg.payment_message or ""))
+    _payment_cache["value"] = value
+    _payment_cache["loaded_at"] = now
+    return value
+
+
+def invalidate_payment_config(**kwargs) -> None:
+    _payment_cache["value"] = None
+
+
+post_save.connect(invalidate_payment_config, sender=GameSettings, dispatch_uid="games.payment_config.save")
+post_delete.connect(invalidate_payment_config, sender=GameSettings, dispatch_uid="games.payment_config.delete")
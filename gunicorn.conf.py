@@ -0,0 +1,14 @@
+# gunicorn читает этот файл из рабочей директории сам (Dockerfile: WORKDIR /app)
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+# async-вьюхи (leela.asgi): воркер uvicorn держит сотни запросов, ждущих Telegram, в одном процессе.
+# GUNICORN_WORKER_CLASS=sync и leela.wsgi:application — прежний режим
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "uvicorn.workers.UvicornWorker")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+# для sync-воркеров: потоков на процесс (uvicorn-воркер это не использует)
+threads = int(os.getenv("GUNICORN_THREADS", "1"))
+keepalive = 75  # Telegram держит соединение вебхука открытым
+timeout = 60
+# сколько ждать воркер при остановке: дообработать принятые запросы (в Telegram шлёт диспетчер outbox)
+graceful_timeout = 30
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'leela.settings')
 
 application = get_asgi_application()
+
+# доску поднимаем при старте воркера: артефакт build_board отображается через mmap без разбора JSON
+from games.services.board import get_compiled_board  # noqa: E402
+
+get_compiled_board()
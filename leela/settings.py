@@ -158,6 +158,57 @@ BOARD_CELL_IMAGE_ROOT = BASE_DIR / "games" / "data/cards"
 BOARD_CELL_IMAGE_URL  = "/media/board_images"   # или "/static/board", как у тебя принято
 SITE_BASE_URL=os.getenv("SITE_BASE_URL")
 TELEGRAM_BOT_TOKEN=os.getenv("TELEGRAM_BOT_TOKEN")
+# служебный чат, куда manage.py warm_card_file_ids заранее загружает картинки карточек (file_id)
+TELEGRAM_STORAGE_CHAT_ID = os.getenv("TELEGRAM_STORAGE_CHAT_ID")
 PROTECTED_CARDS_DIR = PROTECTED_MEDIA_ROOT / "cards"
+# Бинарный артефакт доски (manage.py build_board), воркеры читают его через mmap
+BOARD_ARTIFACT_PATH = BASE_DIR / "var" / "board.bin"
+# Доски по (game_type, locale), пути — относительно games/data; "" — любой game_type
+BOARDS = {
+    ("", "uk"): "board.json",
+}
+BOARD_DEFAULT_LOCALE = "uk"
+# Сколько скомпилированных досок держим в памяти воркера (LRU)
+BOARD_REGISTRY_SIZE = 8
+# Сколько версий досок (с их таблицами и карточками) держим в памяти; старые игры поднимут свою из BoardSnapshot
+BOARD_VERSIONS_CACHE = 16
+# Сколько последних бросков держим в Game.meta["rolls"]; более ранние сворачиваются в точку для replay
+GAME_ROLL_LOG = 256
 START_GAME_API_KEY=os.getenv("START_GAME_API_KEY")
-OPEN_AI_TOKEN=os.getenv("OPEN_AI_TOKEN")
\ No newline at end of file
+OPEN_AI_TOKEN=os.getenv("OPEN_AI_TOKEN")
+
+# Очередь апдейтов Telegram: вебхук только пишет UpdateJob, обрабатывает manage.py run_update_worker.
+# "0" — обрабатывать апдейт прямо в запросе вебхука (без воркера)
+TELEGRAM_UPDATE_QUEUE = os.getenv("TELEGRAM_UPDATE_QUEUE", "1") != "0"
+UPDATE_WORKER_CONCURRENCY = int(os.getenv("UPDATE_WORKER_CONCURRENCY", "4"))
+UPDATE_MAX_ATTEMPTS = 5
+# manage.py poll_updates --inline (getUpdates без вебхука): повторы апдейта в процессе
+POLLING_INLINE_ATTEMPTS = 3
+POLLING_INLINE_RETRY_PAUSE = 0.5
+
+# Outbox исходящих сообщений (webhooks.outbox): пишутся в транзакции хода/ответа,
+# отправляет manage.py run_outbox_dispatcher
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "4"))
+OUTBOX_BATCH = 50
+OUTBOX_MAX_ATTEMPTS = 5
+
+# Async-клиент Telegram (games.services.tg_async): общий httpx.AsyncClient на event loop воркера
+TELEGRAM_ASYNC_MAX_CONNECTIONS = 100
+TELEGRAM_ASYNC_MAX_KEEPALIVE = 20
+
+# Лимиты исходящих сообщений в Telegram (games.services.tg_rate) вместо фиксированных пауз
+TELEGRAM_GLOBAL_RATE = 30          # сообщений в секунду на бота
+TELEGRAM_GLOBAL_BURST = 30
+TELEGRAM_CHAT_RATE = 1.0           # в личный чат — после серии из TELEGRAM_CHAT_BURST подряд
+TELEGRAM_CHAT_BURST = 5
+TELEGRAM_GROUP_RATE = 20 / 60      # в группу — 20 в минуту
+
+# Клиент Bot API (games.services.telegram_client): общая сессия с пулом keep-alive соединений
+# свой Bot API server или локальный фейк для нагрузочных прогонов (poll_updates + run_outbox_dispatcher)
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org")
+TELEGRAM_POOL_SIZE = 16            # соединений к api.telegram.org на процесс
+TELEGRAM_CONNECT_TIMEOUT = 3.05
+TELEGRAM_READ_TIMEOUT = 10
+TELEGRAM_UPLOAD_TIMEOUT = 30       # sendPhoto/sendMediaGroup с файлами
+TELEGRAM_RETRIES = 2               # повторы: 429, несостоявшееся соединение, 5xx у get*
+TELEGRAM_RETRY_BACKOFF = 0.5       # база экспоненциальной паузы (с jitter), сек
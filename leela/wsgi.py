@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'leela.settings')
 
 application = get_wsgi_application()
+
+# доску поднимаем при старте воркера: артефакт build_board отображается через mmap без разбора JSON
+from games.services.board import get_compiled_board  # noqa: E402
+
+get_compiled_board()
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.24 on 2026-10-16 22:46
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def blank_duplicate_usernames(apps, schema_editor):
+    """
+    Перед уникальным ограничением: у повторяющегося telegram_username ник оставляем самому новому игроку
+    (наибольший id), остальным — пусто. Вебхук проставит актуальный ник при следующем апдейте игрока.
+    """
+    Player = apps.get_model('players', 'Player')
+    duplicates = (Player.objects.exclude(telegram_username='')
+                  .values('telegram_username').annotate(n=Count('id'), keep=Max('id')).filter(n__gt=1))
+    for row in duplicates:
+        (Player.objects.filter(telegram_username=row['telegram_username'])
+         .exclude(pk=row['keep']).update(telegram_username=''))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('players', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='player',
+            name='telegram_username',
+            field=models.CharField(blank=True, db_index=True, max_length=150, verbose_name='Никнейм в Telegram'),
+        ),
+        migrations.RunPython(blank_duplicate_usernames, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='player',
+            constraint=models.UniqueConstraint(condition=models.Q(('telegram_username', ''), _negated=True), fields=('telegram_username',), name='uniq_player_telegram_username_not_blank'),
+        ),
+    ]
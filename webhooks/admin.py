@@ -1,3 +1,20 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import OutboxMessage, UpdateJob
+
+
+@admin.register(UpdateJob)
+class UpdateJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "chat_id", "update_id", "status", "attempts", "created_at", "finished_at")
+    list_filter = ("status", "kind")
+    search_fields = ("chat_id", "update_id")
+    readonly_fields = ("created_at", "finished_at", "locked_by", "locked_at", "last_error", "result")
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "chat_id", "move", "status", "attempts", "created_at", "sent_at")
+    list_filter = ("status", "kind")
+    search_fields = ("chat_id",)
+    raw_id_fields = ("move",)
+    readonly_fields = ("created_at", "sent_at", "locked_by", "locked_at", "last_error", "message_ids")
@@ -0,0 +1,151 @@
+"""
+Контекст апдейта Telegram: игрок, активная игра, первый ход без ответа и число подтверждённых ходов —
+одним запросом (игра JOIN игрок JOIN ход-курсор; число ходов — счётчик Game.confirmed_moves),
+дальше вебхук ветвится по данным в памяти.
+
+Бюджет запросов на апдейт (без учёта самого хода — его считает RollQueryCountTests):
+  отметка update_id (webhooks.dedupe) .......... 1 INSERT; повтор — 0 (LRU) или 1 (INSERT с конфликтом)
+  известный игрок с активной игрой ............ 1
+  известный игрок без активной игры ............ 2  (игра, затем игрок)
+  новый игрок ................................... 2 + INSERT игрока (get_or_create в savepoint)
+  сменился username ............................. +1 UPDATE игрока
+  истёк срок игры ............................... +1 UPDATE игры
+Дальше в вебхуке:
+  ждём ответ, ForceReply уже отправлен .......... +0
+  ждём ответ, перезапрашиваем ForceReply ........ +1 SELECT (запрос уже в outbox?), +1 INSERT outbox
+  paywall ....................................... +1 INSERT outbox (настройки оплаты — кэш процесса,
+                                                  +1 раз в PAYMENT_CONFIG_TTL)
+  ответ на ForceReply ........................... +1 SELECT FOR UPDATE, +1 SELECT следующего хода,
+                                                  +2 UPDATE (ответ, счётчики игры — game_utils.save_answer),
+                                                  +1 INSERT outbox (сообщения — webhooks.outbox)
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+from django.db import transaction
+
+from games.models import Game
+from players.models import Player
+
+# сколько ходов даём без оплаты
+FREE_MOVES = 2
+
+
+class PendingMove:
+    """Первый ход игры без ответа игрока — ровно те поля, что нужны вебхуку."""
+    __slots__ = ("id", "move_number", "to_cell", "answer_prompt_msg_id")
+
+    def __init__(self, id: int, move_number: int, to_cell: int, answer_prompt_msg_id: Optional[int]):
+        self.id = id
+        self.move_number = move_number
+        self.to_cell = to_cell
+        self.answer_prompt_msg_id = answer_prompt_msg_id
+
+
+class WebhookContext:
+    __slots__ = ("player", "game", "moves_count", "pending")
+
+    def __init__(self, player: Player, game: Optional[Game] = None, moves_count: int = 0,
+                 pending: Optional[PendingMove] = None):
+        self.player = player
+        self.game = game
+        self.moves_count = moves_count
+        self.pending = pending
+
+    @property
+    def over_free_limit(self) -> bool:
+        """Игра не оплачена, а бесплатные ходы закончились."""
+        return bool(
+            self.game
+            and self.game.payment_status != Game.PaymentStatus.PAID
+            and self.moves_count > FREE_MOVES
+        )
+
+
+def _active_games():
+    """Активные игры с игроком и первым ходом без ответа (курсор Game.next_unanswered_move) — один JOIN."""
+    return (
+        Game.objects
+        .select_related("player", "next_unanswered_move")
+        .filter(is_active=True, status__in=[Game.Status.ACTIVE, Game.Status.PAUSED])
+        .order_by("-updated_at")
+    )
+
+
+def _from_game(game: Game) -> WebhookContext:
+    pending = None
+    mv = game.next_unanswered_move
+    if mv is not None:
+        pending = PendingMove(mv.id, mv.move_number, mv.to_cell, mv.answer_prompt_msg_id)
+    return WebhookContext(game.player, game, game.confirmed_moves, pending)
+
+
+def _touch_username(player: Player, tg_username: Optional[str]) -> None:
+    new_un = (tg_username or "").strip()
+    if new_un and player.telegram_username != new_un:
+        player.telegram_username = new_un
+        player.save(update_fields=["telegram_username"])
+
+
+def load_context(tg_id: Optional[int], tg_username: Optional[str]) -> WebhookContext:
+    """Контекст апдейта; при необходимости создаёт игрока. Бюджет запросов — в docstring модуля."""
+    if tg_id:
+        game = _active_games().filter(player__telegram_id=tg_id).first()
+        player = game.player if game is not None else upsert_player_from_telegram(tg_id, tg_username)
+    else:
+        player = upsert_player_from_telegram(tg_id, tg_username)
+        game = _active_games().filter(player=player).first()
+    if game is None:
+        return WebhookContext(player)
+
+    ctx = _from_game(game)
+    _touch_username(ctx.player, tg_username)
+    if game.expire_if_needed():
+        ctx.game, ctx.moves_count, ctx.pending = None, 0, None
+    return ctx
+
+
+def _player_defaults_from_meta(tg_id: int | None, tg_username: str | None) -> dict:
+    """Собираем безопасные defaults для Player.get_or_create."""
+    email_local = str(tg_id or tg_username or "unknown")
+    defaults = {
+        "email": f"tg_{email_local}@example.local",
+        "telegram_username": (tg_username or "").strip(),
+    }
+    # Если в модели есть choice-поля — подставим безопасные значения:
+    try:
+        if hasattr(Player, "MainStatus"):
+            defaults["main_status"] = Player.MainStatus.ACTIVE
+        if hasattr(Player, "PlayerType"):
+            defaults["player_type"] = Player.PlayerType.FREE
+        if hasattr(Player, "PaymentsStatus"):
+            defaults["payment_status"] = Player.PaymentsStatus.NONE
+    except Exception:
+        pass
+    return defaults
+
+
+def upsert_player_from_telegram(tg_id: int | None, tg_username: str | None) -> Player:
+    """Находит/создаёт Player по telegram_id или telegram_username, аккуратно обновляет username."""
+    defaults = _player_defaults_from_meta(tg_id, tg_username)
+    # 1) пробуем по telegram_id: обычно игрок уже есть — один SELECT без savepoint'ов get_or_create
+    if tg_id:
+        player = Player.objects.filter(telegram_id=tg_id).first()
+        if player is None:
+            with transaction.atomic():
+                player, _ = Player.objects.get_or_create(telegram_id=tg_id, defaults=defaults)
+        _touch_username(player, tg_username)
+        return player
+
+    with transaction.atomic():
+        # 2) иначе — по username (если он есть)
+        if tg_username:
+            player, _ = Player.objects.get_or_create(
+                telegram_username__iexact=tg_username.strip(),
+                defaults=defaults,
+            )
+            return player
+
+        # 3) крайний случай — ни id, ни username (технич. запись)
+        return Player.objects.create(**defaults)
@@ -0,0 +1,140 @@
+"""
+Идемпотентность по update_id: Telegram повторяет апдейт, если вебхук ответил не сразу или не 200,
+и один и тот же бросок применялся дважды (дубли ходов и сообщений).
+
+Перед игровой логикой: сначала LRU в памяти процесса (повтор обычно приходит в тот же воркер
+через секунды), затем INSERT в SeenUpdate с уникальным update_id — ловит повторы, пришедшие в другой процесс.
+Строки старше UPDATE_DEDUPE_TTL удаляет purge_expired (раз в несколько секунд — run_update_worker).
+"""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Iterable, Optional, Set
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from webhooks.models import SeenUpdate
+
+# Telegram хранит недоставленные апдейты до суток — держим update_id с запасом
+DEDUPE_TTL = float(getattr(settings, "UPDATE_DEDUPE_TTL", 2 * 24 * 3600))
+LRU_SIZE = int(getattr(settings, "UPDATE_DEDUPE_LRU_SIZE", 4096))
+
+_lock = threading.Lock()
+_recent: "OrderedDict[int, None]" = OrderedDict()
+_stats = {"accepted": 0, "duplicates_lru": 0, "duplicates_db": 0, "purged": 0}
+
+
+def _remember(update_id: int) -> None:
+    with _lock:
+        _recent[update_id] = None
+        _recent.move_to_end(update_id)
+        while len(_recent) > LRU_SIZE:
+            _recent.popitem(last=False)
+
+
+def first_seen(update_id: Optional[int]) -> bool:
+    """True — апдейт новый (и теперь записан как принятый), False — это повтор. Без update_id — всегда True."""
+    if not isinstance(update_id, int):
+        return True
+    with _lock:
+        if update_id in _recent:
+            _recent.move_to_end(update_id)
+            _stats["duplicates_lru"] += 1
+            return False
+    try:
+        with transaction.atomic():
+            SeenUpdate.objects.create(update_id=update_id)
+    except IntegrityError:
+        _remember(update_id)
+        with _lock:
+            _stats["duplicates_db"] += 1
+        return False
+    _remember(update_id)
+    with _lock:
+        _stats["accepted"] += 1
+    return True
+
+
+def first_seen_many(update_ids: Iterable[Optional[int]]) -> Set[int]:
+    """
+    Пачка апдейтов getUpdates (webhooks.polling): какие update_id новые — теперь записаны как принятые.
+    Два запроса на пачку (SELECT уже принятых, INSERT новых) вместо INSERT на каждый апдейт;
+    getUpdates у бота читает один процесс, так что гонки за один update_id между процессами нет.
+    Внутри транзакции отметки откатываются вместе с ней; LRU процесса пополняется только после коммита.
+    """
+    ids = list(dict.fromkeys(u for u in update_ids if isinstance(u, int)))
+    with _lock:
+        fresh = [u for u in ids if u not in _recent]
+        _stats["duplicates_lru"] += len(ids) - len(fresh)
+    if fresh:
+        seen = set(SeenUpdate.objects.filter(update_id__in=fresh).values_list("update_id", flat=True))
+        new = [u for u in fresh if u not in seen]
+        SeenUpdate.objects.bulk_create([SeenUpdate(update_id=u) for u in new], ignore_conflicts=True)
+    else:
+        seen, new = set(), []
+    transaction.on_commit(lambda: [_remember(u) for u in fresh])
+    with _lock:
+        _stats["duplicates_db"] += len(seen)
+        _stats["accepted"] += len(new)
+    return set(new)
+
+
+def seen_in_transaction(update_id: Optional[int]) -> bool:
+    """
+    Отметить update_id в транзакции его обработчика (webhooks.polling --inline): обработка откатилась
+    или процесс упал до коммита — откатилась и отметка, повтор от Telegram пройдёт.
+    True — апдейт новый, False — повтор. Без update_id — всегда True.
+    """
+    if not isinstance(update_id, int):
+        return True
+    with _lock:
+        if update_id in _recent:
+            _recent.move_to_end(update_id)
+            _stats["duplicates_lru"] += 1
+            return False
+    try:
+        with transaction.atomic():
+            SeenUpdate.objects.create(update_id=update_id)
+    except IntegrityError:
+        _remember(update_id)
+        with _lock:
+            _stats["duplicates_db"] += 1
+        return False
+
+    def committed():
+        _remember(update_id)
+        with _lock:
+            _stats["accepted"] += 1
+
+    transaction.on_commit(committed)
+    return True
+
+
+def forget(update_id: Optional[int]) -> None:
+    """Апдейт не обработан (упали до записи в очередь) — пусть повтор от Telegram пройдёт."""
+    if not isinstance(update_id, int):
+        return
+    with _lock:
+        _recent.pop(update_id, None)
+    SeenUpdate.objects.filter(update_id=update_id).delete()
+
+
+def purge_expired(ttl_seconds: float = DEDUPE_TTL) -> int:
+    deleted, _ = SeenUpdate.objects.filter(seen_at__lt=timezone.now() - timedelta(seconds=ttl_seconds)).delete()
+    with _lock:
+        _stats["purged"] += deleted
+    return deleted
+
+
+def dedupe_stats() -> dict:
+    with _lock:
+        return {**_stats, "absorbed": _stats["duplicates_lru"] + _stats["duplicates_db"], "lru": len(_recent)}
+
+
+def clear() -> None:
+    with _lock:
+        _recent.clear()
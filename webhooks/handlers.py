@@ -0,0 +1,320 @@
+"""
+Обработка апдейтов Telegram: вся игровая логика вебхуков (бросок кубика, ответы на ForceReply).
+
+Вызывается воркером очереди апдейтов (manage.py run_update_worker) или прямо из вьюхи,
+если очередь выключена (TELEGRAM_UPDATE_QUEUE=False). Возвращает dict — то, что раньше уходило в JsonResponse.
+
+Сообщения в Telegram обработчики не шлют сами: пишут их в outbox (webhooks.outbox) в той же транзакции,
+что ход или ответ, отправляет диспетчер (manage.py run_outbox_dispatcher).
+"""
+from games.services.entry import GameEntryManager
+from games.models import Move, Game
+from django.conf import settings
+from django.db import transaction
+from games.services.board import board_for_game
+from games.services.game_utils import save_answer, serialize_move
+from games.services.qa_queue import on_turn_finished_with_series
+from games.utils import get_payment_config
+from webhooks import outbox
+from webhooks.context import load_context
+
+def _quiz_prompt(move_dict: dict) -> str:
+    return (f"Ваша відповідь по ходу #{move_dict.get('move_number')} (кидок {move_dict.get('rolled')}, "
+            f"клітинка {move_dict.get('to_cell')}). Напишіть, що ви відчули/зрозуміли.")
+
+
+def _enqueue_move_and_quiz(chat_id: int | str, move_dict: dict):
+    """
+    ОДНА карточка хода, затем ForceReply по этому же ходу — в outbox (вызывать в транзакции хода/ответа).
+    answer_prompt_msg_id в Move запишет диспетчер, когда Telegram вернёт message_id.
+    """
+    outbox.enqueue_card_with_quiz(chat_id, move_dict, _quiz_prompt(move_dict))
+
+def _extract_telegram_meta(payload: dict):
+    d = payload.get("data") if isinstance(payload, dict) else None
+    root = payload
+    if isinstance(d, dict) and "message" in d:
+        root = d
+
+    message = (root or {}).get("message") or {}
+    frm = message.get("from") or {}
+    chat = message.get("chat") or {}
+
+    ts = message.get("date")
+    msg_dt = None
+    if isinstance(ts, (int, float)):
+        from datetime import datetime, timezone as dt_tz
+        msg_dt = datetime.fromtimestamp(ts, tz=dt_tz.utc)
+
+    dice_value = None
+    dice = message.get("dice")
+    if isinstance(dice, dict):
+        dice_value = dice.get("value")
+
+    reply_to = message.get("reply_to_message") or {}
+    text = message.get("text")
+
+    return {
+        "update_id": payload.get("update_id"),
+        "from_id": frm.get("id"),
+        "username": frm.get("username"),
+        "language_code": frm.get("language_code"),
+        "chat_id": chat.get("id"),
+        "message_date": msg_dt,
+        "dice_value": dice_value,
+        "message_id": message.get("message_id"),
+        "text": text if isinstance(text, str) else None,
+        "reply_to_message_id": reply_to.get("message_id"),
+    }
+
+
+def handle_dice_update(payload: dict) -> dict:
+    meta = _extract_telegram_meta(payload)
+    tg_from_id = meta["from_id"]
+    tg_username = meta["username"]
+    chat_id = meta.get("chat_id") or tg_from_id
+    dice_value = meta["dice_value"]
+    reply_to_msg_id = meta.get("reply_to_message_id")
+    reply_text = (meta.get("text") or "").strip()
+
+    # --- Игрок, активная игра, ход без ответа и число ходов — одним запросом (см. webhooks.context) ---
+    ctx = load_context(tg_from_id, tg_username)
+    player, game, pending = ctx.player, ctx.game, ctx.pending
+
+    # --- Paywall-флаг (будем использовать ниже, перед обработкой кубика) ---
+    payment_required = False
+
+    if ctx.over_free_limit:
+        payment_url, payment_msg = get_payment_config()
+
+        # Срабатываем ТОЛЬКО на бросок кубика, не на ответы / обычные сообщения
+        if payment_url and dice_value is not None:
+            bot_token = getattr(settings, "TELEGRAM_BOT_TOKEN", None)
+            if bot_token:
+                text = payment_msg or "Щоб продовжити гру, потрібно оформити оплату за посиланням нижче 👇"
+                text = f"{text}\n{payment_url}"
+                outbox.enqueue_text(chat_id, text)
+
+        payment_required = True
+
+
+    # === НОВОЕ: это ответ на наш ForceReply? -> сохраняем в Move ===
+    # === Ответ на наш ForceReply? -> сохраняем ответ и (если есть) шлём СЛЕДУЮЩУЮ карточку ===
+    if reply_to_msg_id and reply_text:
+        bot_token = getattr(settings, "TELEGRAM_BOT_TOKEN", None)
+
+        # ответ и следующие сообщения — одной транзакцией: outbox пишется вместе с ответом
+        with transaction.atomic():
+            mv = (Move.objects
+                  .select_for_update()
+                  .select_related("game")
+                  .filter(answer_prompt_msg_id=reply_to_msg_id)
+                  .first())
+            if not mv:
+                return {"ok": True, "ignored": True, "reason": "no_move_for_reply"}
+
+            # 1) сохраняем ответ по текущему ходу (и счётчики игры),
+            # 2) получаем следующий незакрытый ход в этой игре
+            next_mv = save_answer(mv, reply_text)
+
+            # 3) если есть следующий — сразу карточка + ForceReply
+            if next_mv and bot_token:
+                try:
+                    move_dict = serialize_move(next_mv, player_id=getattr(mv.game, "player_id", None),
+                                               board=board_for_game(mv.game))
+                except Exception:
+                    move_dict = None  # мягкий fallback: просто разрешаем бросать кубик
+                if move_dict:
+                    _enqueue_move_and_quiz(chat_id, move_dict)
+                    return {
+                        "ok": True,
+                        "saved": True,
+                        "move_id": mv.id,
+                        "next_move_id": next_mv.id,
+                        "status": "next_card_sent"
+                    }
+
+            # 4) если очереди больше нет — разрешаем бросать кубик
+            if bot_token:
+                outbox.enqueue_text(chat_id, "Дякуємо! Відповідь збережено. Можете кидати кубик 🎲")
+                outbox.enqueue_dice(chat_id)
+
+        return {"ok": True, "saved": True, "move_id": mv.id}
+
+    # === ДАЛЕЕ — ваша прежняя логика с кубиком ===
+
+    # Если активной игры нет — создаём новую и кидаем ПЕРВЫЙ кубик от бота
+    if not game:
+        bot_token = getattr(settings, "TELEGRAM_BOT_TOKEN", None)
+        with transaction.atomic():
+            game = Game.start_new(player=player, game_type="telegram_dice", game_name="Лила (TG)",
+                                  meta={"locale": meta.get("language_code") or ""})
+            if bot_token:
+                outbox.enqueue_dice(chat_id)
+        return {"ok": True, "status": "new_game_started", "game_id": str(game.id), "dice_sent": bool(bot_token)}
+
+    # Если это НЕ кубик и не реплай — проверим, не ждём ли ответ по прежнему ходу
+    if dice_value is None:
+        bot_token = getattr(settings, "TELEGRAM_BOT_TOKEN", None)
+
+        if pending and bot_token:
+            prompt = (f"Ваша відповідь по ходу  #{pending.move_number} (кидок {pending.move_number} клітинка {pending.to_cell}). Напишіть, що ви відчули/зрозуміли.")
+            with transaction.atomic():
+                # 1) Сообщение в чат, чтобы было понятно, почему бросок/сообщение не принимается
+                outbox.enqueue_text(
+                    chat_id,
+                    (f"Потрібно відповісти на попередню картку — хід #{pending.move_number} "
+                     f"(клітинка {pending.to_cell}). Напишіть, що ви відчули/зрозуміли."),
+                )
+                # 2) ForceReply-запрос (перезапросим даже если уже слали)
+                outbox.enqueue_quiz(chat_id, pending.id, prompt)
+
+            return {
+                "ok": True,
+                "status": "awaiting_answer",
+                "message": "Потрібна відповідь на попередній хід.",
+                "pending_move_id": pending.id,
+            }
+
+        # нет блокировок — просто зафиксируем апдейт
+        return {"ok": True, "captured": True, "dice_value": None}
+
+    # Блок: есть ли незакрытый ответ?
+    if pending:
+        bot_token = getattr(settings, "TELEGRAM_BOT_TOKEN", None)
+        # запрос ещё не отправлен и не стоит в outbox — ставим
+        if bot_token and not pending.answer_prompt_msg_id and not outbox.quiz_awaiting(pending.id):
+            prompt = (f"Потрібна відповідь по ходу #{pending.move_number} "
+                      f"(клетка {pending.to_cell}). Напишіть, що ви відчули/зрозуміли.")
+            outbox.enqueue_quiz(chat_id, pending.id, prompt)
+
+        return {
+            "ok": True, "status": "awaiting_answer",
+            "message": "Будь ласка, дайте відповідь на попередній хід перед наступним кидком.",
+            "pending_move_id": pending.id,
+        }
+
+    # Если требуется оплата — не даём обработать новый бросок кубика
+    if dice_value is not None and payment_required:
+        return {
+            "ok": True,
+            "status": "payment_required",
+            "message": "Для продовження гри потрібна оплата. Посилання надіслано в чат.",
+        }
+
+    # --- Пришёл кубик — играем ход ---
+    # ход и его сообщения (outbox) — одной транзакцией
+    with transaction.atomic():
+        manager = GameEntryManager()
+        res = manager.apply_roll(game, rolled=int(dice_value), player_id=player.id)
+
+        bot_token = getattr(settings, "TELEGRAM_BOT_TOKEN", None)
+
+        if res.status == "continue":
+            bot_token = getattr(settings, "TELEGRAM_BOT_TOKEN", None)
+            if bot_token:
+                outbox.enqueue_text(tg_from_id, f"{res.message} 🎲")
+
+            return {
+                "ok": True,
+                "status": "continue",
+                "message": res.message,
+                "six_count": res.six_count,
+            }
+
+        if res.status == "completed":
+            # серия шестерок закончилась -> отправляем только первую карточку серии
+            on_turn_finished_with_series(game, list(Move.objects.filter(id__in=[m["id"] for m in res.moves])))
+            return {
+                "ok": True,
+                "status": "completed",
+                "message": "Серія завершена, починаємо картки по черзі.",
+                "moves_count": len(res.moves),
+            }
+
+        if res.status == "single":
+            if bot_token and res.moves:
+                # одна карточка — сразу карточка + ForceReply
+                first = res.moves[0]
+                _enqueue_move_and_quiz(chat_id, first)
+            return {"ok": True, "status": "single", "message": res.message, "moves_count": len(res.moves)}
+
+        if res.status == "finished":
+            if bot_token and res.moves:
+                # финальные карточки — альбомами (sendMediaGroup), без ForceReply
+                outbox.enqueue_cards(chat_id, res.moves)
+            return {
+                "ok": True,
+                "status": "finished",
+                "message": res.message,
+                "moves_count": len(res.moves),
+            }
+
+
+        if res.status == "ignored":
+            return {"ok": True, "status": "ignored", "message": res.message, "six_count": res.six_count}
+
+        return {"ok": True, "status": res.status, "message": res.message, "six_count": res.six_count}
+
+
+def _extract_text_reply(payload: dict):
+    """
+    Возвращает {chat_id, from_id, text, reply_to_message_id} или None.
+    """
+    msg = (payload.get("message") or
+           (payload.get("data") or {}).get("message") or
+           {})
+    text = msg.get("text")
+    if not isinstance(text, str):
+        return None
+    reply = msg.get("reply_to_message") or {}
+    return {
+        "chat_id": (msg.get("chat") or {}).get("id"),
+        "from_id": (msg.get("from") or {}).get("id"),
+        "text": text.strip(),
+        "reply_to_message_id": reply.get("message_id"),
+    }
+
+
+def handle_answer_update(payload: dict) -> dict:
+    data = _extract_text_reply(payload)
+    if not data or not data.get("reply_to_message_id"):
+        # это не ответ на ForceReply — можете игнорить или вернуть ok
+        return {"ok": True, "ignored": True}
+
+    chat_id = data["chat_id"]
+    from_id = data["from_id"]
+    text = data["text"]
+    reply_msg_id = int(data["reply_to_message_id"])
+
+    # Находим ход по ответу на нашу подсказку
+    mv = Move.objects.filter(answer_prompt_msg_id=reply_msg_id).select_related("game").first()
+    if not mv:
+        return {"ok": True, "ignored": True, "reason": "no_move_for_reply"}
+
+    # защитимся: нет ли незакрытых ответов раньше этого хода (курсор игры стоит не на нём)
+    has_earlier_pending = mv.game.next_unanswered_move_id not in (None, mv.id)
+
+    bot_token = getattr(settings, "TELEGRAM_BOT_TOKEN", None)
+
+    # ответ и следующие сообщения — одной транзакцией: outbox пишется вместе с ответом
+    with transaction.atomic():
+        # Сохраняем ответ (и счётчики игры), получаем следующий ход без ответа
+        next_mv = save_answer(mv, text)
+
+        if next_mv and bot_token:
+            if not has_earlier_pending:
+                # карточка из общего кэша (та же, что в вебхуке кубика и qa_queue)
+                move_dict = serialize_move(next_mv, player_id=getattr(mv.game, "player_id", None),
+                                           board=board_for_game(mv.game))
+
+                # следующая карточка + ForceReply
+                _enqueue_move_and_quiz(chat_id, move_dict)
+
+                return {"ok": True, "saved": True, "move_id": mv.id, "next_move_id": next_mv.id}
+
+        # Ответ игроку — можно бросать кубик
+        if bot_token:
+            outbox.enqueue_text(chat_id, "Дякуємо! Можете кидати кубик ще раз 🎲")
+
+    return {"ok": True, "saved": True, "move_id": mv.id}
@@ -0,0 +1,105 @@
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections
+
+from games.models import Game
+from games.services import apply_roll
+from games.services.entry import GameEntryManager
+from players.models import Player
+from webhooks.scheduler import ChatScheduler
+
+# служебные игроки бенчмарка: telegram_id из этого диапазона, удаляются после прогона
+BENCH_TG_BASE = -9_000_000_000
+
+
+class Command(BaseCommand):
+    help = ("Бенчмарк всплеска бросков: пул потоков без привязки к чату (как параллельные воркеры gunicorn) "
+            "против ChatScheduler. Пишет в настроенную БД на служебных игроках и удаляет их после прогона.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chats", type=int, default=20)
+        parser.add_argument("--rolls", type=int, default=30, help="Бросков на чат во всплеске")
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--json", action="store_true")
+
+    def handle(self, *args, **opts):
+        rng = random.Random(opts["seed"])
+        burst = [(chat, rng.randint(1, 6)) for _ in range(opts["rolls"]) for chat in range(opts["chats"])]
+
+        results = {}
+        # без OpenAI: меряем только игру и БД
+        with mock.patch.object(apply_roll, "_finish_analysis", lambda game: ""):
+            for mode in ("thread_pool", "chat_scheduler"):
+                games = self._setup(opts["chats"])
+                try:
+                    results[mode] = self._run(mode, games, burst, opts["threads"])
+                finally:
+                    self._cleanup()
+
+        if opts["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"burst: {len(burst)} rolls from {opts['chats']} chats, {opts['threads']} threads")
+        for mode, r in results.items():
+            self.stdout.write(
+                f"{mode:<15} {r['elapsed_sec']:>7.3f}s {r['rolls_per_sec']:>8.1f} rolls/s  "
+                f"lock retries {r['lock_retries']:>5}  gave up {r['gave_up']:>3}  errors {r['errors']}"
+            )
+
+    def _setup(self, chats: int) -> dict:
+        self._cleanup()
+        games = {}
+        for chat in range(chats):
+            player = Player.objects.create(email=f"bench_{chat}@example.local", telegram_id=BENCH_TG_BASE - chat)
+            # партия уже идёт: первая шестёрка выпала, ходы есть
+            games[chat] = Game.objects.create(player=player, game_type="bench", current_cell=6, confirmed_moves=1,
+                                              last_move_number=1)
+        return games
+
+    def _cleanup(self) -> None:
+        Player.objects.filter(telegram_id__lte=BENCH_TG_BASE, email__startswith="bench_").delete()
+
+    def _run(self, mode: str, games: dict, burst: list, threads: int) -> dict:
+        counters = {"lock_retries": 0, "gave_up": 0, "errors": 0}
+
+        def roll(chat: int, rolled: int):
+            game = games[chat]
+            try:
+                for attempt in range(8):
+                    try:
+                        res = GameEntryManager().apply_roll(game, rolled)
+                        if res.status == "finished":
+                            Game.objects.filter(pk=game.pk).update(is_active=True, status=Game.Status.ACTIVE,
+                                                                   current_cell=6)
+                        return
+                    except OperationalError as e:
+                        if "locked" not in str(e):
+                            raise
+                        counters["lock_retries"] += 1
+                        time.sleep(0.005 * 2 ** attempt)
+                counters["gave_up"] += 1
+            except Exception:
+                # гонка двух бросков одного чата (например, дубль move_number) — бросок потерян
+                counters["errors"] += 1
+            finally:
+                close_old_connections()
+
+        started = time.perf_counter()
+        if mode == "thread_pool":
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                wait([pool.submit(roll, chat, rolled) for chat, rolled in burst])
+        else:
+            with ChatScheduler(threads, name="bench") as scheduler:
+                wait([scheduler.submit(chat, roll, chat, rolled) for chat, rolled in burst])
+        elapsed = time.perf_counter() - started
+        return {
+            "elapsed_sec": round(elapsed, 3),
+            "rolls_per_sec": round(len(burst) / elapsed, 1),
+            **counters,
+        }
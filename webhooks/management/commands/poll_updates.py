@@ -0,0 +1,82 @@
+import json
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from games.services.telegram_client import get_client
+from webhooks import polling
+from webhooks.scheduler import ChatScheduler
+
+
+class Command(BaseCommand):
+    help = ("Приём апдейтов long-polling'ом getUpdates вместо вебхука (бот без публичного входа): "
+            "до --limit апдейтов за вызов, дальше — как у вебхука: в очередь UpdateJob одной вставкой "
+            "или (--inline) сразу теми же обработчиками, сгруппированными по чатам.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=100, help="Апдейтов за один getUpdates (1..100)")
+        parser.add_argument("--timeout", type=int, default=25, help="Long-polling timeout getUpdates (сек)")
+        parser.add_argument("--inline", action="store_true",
+                            default=not getattr(settings, "TELEGRAM_UPDATE_QUEUE", True),
+                            help="Обрабатывать апдейты в этом процессе, а не ставить в очередь "
+                                 "(по умолчанию — при TELEGRAM_UPDATE_QUEUE=False, как у вебхука)")
+        parser.add_argument("--concurrency", type=int, default=getattr(settings, "UPDATE_WORKER_CONCURRENCY", 4),
+                            help="Сколько очередей чатов (потоков) при --inline")
+        parser.add_argument("--delete-webhook", action="store_true",
+                            help="Снять вебхук перед стартом (пока он установлен, getUpdates недоступен)")
+        parser.add_argument("--error-pause", type=float, default=3.0, help="Пауза после ошибки getUpdates (сек)")
+        parser.add_argument("--metrics-every", type=float, default=60.0, help="Печатать метрики раз в N секунд")
+        parser.add_argument("--once", action="store_true", help="Один вызов getUpdates (с подтверждением) и выход")
+
+    def handle(self, *args, **opts):
+        client = get_client()
+        if client is None:
+            raise CommandError("TELEGRAM_BOT_TOKEN is not set")
+        limit = min(max(1, opts["limit"]), 100)
+        timeout = 0 if opts["once"] else max(0, opts["timeout"])
+        stopping = []
+
+        def stop(signum, frame):
+            stopping.append(signum)
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        if opts["delete_webhook"]:
+            res = client.delete_webhook()
+            if not res:
+                raise CommandError(f"deleteWebhook failed: {res.description}")
+
+        mode = f"inline lanes={opts['concurrency']}" if opts["inline"] else "queue"
+        self.stdout.write(f"polling getUpdates: limit={limit} timeout={timeout}s mode={mode}")
+        offset = None
+        last_metrics = time.monotonic()
+        scheduler = ChatScheduler(max(1, opts["concurrency"]), name="poll") if opts["inline"] else None
+        try:
+            while not stopping:
+                res = client.get_updates(offset, limit=limit, timeout=timeout, allowed_updates=polling.ALLOWED_UPDATES)
+                if not res:
+                    if res.error_code == 409:
+                        raise CommandError(f"getUpdates conflict: {res.description} (use --delete-webhook)")
+                    self.stderr.write(f"getUpdates failed: {res.description}")
+                    time.sleep(res.retry_after or opts["error_pause"])
+                    continue
+                updates = [u for u in (res.result or []) if isinstance(u, dict)]
+                if updates:
+                    polling.admit(updates, scheduler)
+                    offset = polling.next_offset(updates, offset)
+                if opts["once"]:
+                    if offset is not None:
+                        client.get_updates(offset, limit=1, timeout=0)  # подтвердить пачку перед выходом
+                    break
+                if opts["metrics_every"] and time.monotonic() - last_metrics >= opts["metrics_every"]:
+                    self.stdout.write(json.dumps(polling.polling_stats()))
+                    last_metrics = time.monotonic()
+        finally:
+            if scheduler is not None:
+                scheduler.shutdown()
+            close_old_connections()
+        self.stdout.write(json.dumps(polling.polling_stats()))
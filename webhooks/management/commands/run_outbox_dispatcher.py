@@ -0,0 +1,98 @@
+import json
+import os
+import signal
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from games.services.tg_rate import rate_stats
+from webhooks import outbox
+from webhooks.scheduler import ChatScheduler
+
+
+class Command(BaseCommand):
+    help = ("Диспетчер outbox: забирает пачками OutboxMessage и отправляет в Telegram по очередям чатов "
+            "(ChatScheduler) — сообщения одного чата строго по порядку, разных чатов — параллельно; "
+            "message_id записывает в Move, упавшие повторяет; лимит Telegram не ждёт в потоке, "
+            "а откладывает сообщение.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=getattr(settings, "OUTBOX_CONCURRENCY", 4),
+                            help="Сколько очередей чатов (потоков) в процессе")
+        parser.add_argument("--batch", type=int, default=getattr(settings, "OUTBOX_BATCH", 50),
+                            help="Сколько сообщений забирать за один запрос к БД")
+        parser.add_argument("--poll-interval", type=float, default=0.2, help="Пауза, когда outbox пуст (сек)")
+        parser.add_argument("--max-attempts", type=int, default=outbox.MAX_ATTEMPTS)
+        parser.add_argument("--lease", type=float, default=120.0,
+                            help="Через сколько секунд сообщение в отправке считается брошенным")
+        parser.add_argument("--keep-sent", type=float, default=24 * 3600,
+                            help="Сколько секунд хранить отправленные сообщения")
+        parser.add_argument("--metrics-every", type=float, default=60.0, help="Печатать метрики раз в N секунд")
+        parser.add_argument("--once", action="store_true", help="Разобрать outbox и выйти")
+
+    def handle(self, *args, **opts):
+        token = getattr(settings, "TELEGRAM_BOT_TOKEN", None)
+        if not token:
+            raise CommandError("TELEGRAM_BOT_TOKEN is not set")
+        concurrency = max(1, opts["concurrency"])
+        batch = max(1, opts["batch"])
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        stopping = []
+
+        def stop(signum, frame):
+            stopping.append(signum)
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        # чат -> id сообщения, которое упало или отложено лимитом Telegram и ждёт повтора: более поздние
+        # сообщения чата из той же пачки возвращаем в БД, чтобы не обогнать повтор
+        retrying = {}
+        retrying_lock = threading.Lock()
+
+        def send(msg):
+            try:
+                with retrying_lock:
+                    blocked_by = retrying.get(msg.chat_id)
+                if blocked_by is not None and blocked_by != msg.id:
+                    outbox.release(msg)
+                    return
+                ok = outbox.process(msg, token, max_attempts=opts["max_attempts"])
+                with retrying_lock:
+                    if ok or msg.attempts >= opts["max_attempts"]:
+                        retrying.pop(msg.chat_id, None)
+                    else:
+                        retrying[msg.chat_id] = msg.id
+            finally:
+                close_old_connections()
+
+        self.stdout.write(f"outbox dispatcher {worker}: lanes={concurrency} batch={batch}")
+        inflight = set()
+        last_housekeeping = last_metrics = 0.0
+        with ChatScheduler(concurrency, name="outbox") as scheduler:
+            while not stopping:
+                now = time.monotonic()
+                if now - last_housekeeping >= max(opts["poll_interval"] * 50, 5.0):
+                    outbox.requeue_stale(opts["lease"])
+                    outbox.purge_sent(opts["keep_sent"])
+                    last_housekeeping = now
+                if opts["metrics_every"] and now - last_metrics >= opts["metrics_every"]:
+                    self.stdout.write(json.dumps({**outbox.outbox_metrics(), "scheduler": scheduler.stats(),
+                                                "telegram_rate": rate_stats()}))
+                    last_metrics = now
+
+                inflight = {f for f in inflight if not f.done()}
+                messages = outbox.claim(worker, min(batch, batch * 2 - len(inflight)))
+                for msg in messages:
+                    inflight.add(scheduler.submit(msg.chat_id, send, msg))
+                if not messages:
+                    if opts["once"] and not inflight:
+                        break
+                    time.sleep(opts["poll_interval"])
+            # по SIGTERM новые сообщения не берём, уже взятые доотправляем (выход из with ждёт очереди)
+        close_old_connections()
+        self.stdout.write(json.dumps(outbox.outbox_metrics()))
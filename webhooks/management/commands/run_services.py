@@ -0,0 +1,111 @@
+import json
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+MANAGE = str(Path(settings.BASE_DIR) / "manage.py")
+
+# Долгоживущие процессы контейнера. web — главный: завершился он — останавливаем остальные и выходим
+# с его кодом (контейнер перезапустит оркестратор); упавший воркер перезапускаем с нарастающей паузой.
+# Каждый можно поднять и отдельно — той же командой manage.py из SERVICES (или run_services --only <name>).
+SERVICES = {
+    "web": [sys.executable, "-m", "gunicorn", "leela.asgi:application"],
+    "update-worker": [sys.executable, MANAGE, "run_update_worker"],
+    "outbox-dispatcher": [sys.executable, MANAGE, "run_outbox_dispatcher"],
+}
+# Разовые задачи при старте: упали — в лог, не перезапускаем
+ONESHOT = {
+    "warm-card-file-ids": [sys.executable, MANAGE, "warm_card_file_ids"],
+}
+
+
+class Command(BaseCommand):
+    help = ("Запуск процессов контейнера под присмотром: gunicorn, воркер очереди апдейтов и диспетчер outbox "
+            "(SERVICES) — дочерними процессами, "
+            "упавший воркер перезапускается, SIGTERM передаётся всем и ждём их остановки.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--only", action="append", choices=sorted(SERVICES),
+                            help="Запустить только эти сервисы (можно повторять)")
+        parser.add_argument("--no-oneshot", action="store_true", help="Не запускать разовые задачи (ONESHOT)")
+        parser.add_argument("--grace", type=float, default=40.0,
+                            help="Сколько ждать остановки процессов после SIGTERM, потом SIGKILL (сек)")
+        parser.add_argument("--max-backoff", type=float, default=30.0,
+                            help="Максимальная пауза перед перезапуском упавшего сервиса (сек)")
+        parser.add_argument("--check-interval", type=float, default=0.5, help="Как часто проверять процессы (сек)")
+
+    def handle(self, *args, **opts):
+        names = opts["only"] or list(SERVICES)
+        stopping = []
+
+        def stop(signum, frame):
+            stopping.append(signum)
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        procs = {}
+        started = {}
+        next_start = dict.fromkeys(names, 0.0)
+        backoff = dict.fromkeys(names, 0.0)
+        restarts = dict.fromkeys(names, 0)
+        oneshots = [] if opts["no_oneshot"] else [(name, self._spawn(name, argv)) for name, argv in ONESHOT.items()]
+        exit_code = 0
+
+        while not stopping:
+            now = time.monotonic()
+            for name in names:
+                proc = procs.get(name)
+                if proc is None:
+                    if now >= next_start[name]:
+                        procs[name], started[name] = self._spawn(name, SERVICES[name]), now
+                    continue
+                code = proc.poll()
+                if code is None:
+                    continue
+                del procs[name]
+                if name == "web":
+                    self.stderr.write(f"web exited with {code}, stopping")
+                    exit_code = code
+                    stopping.append(name)
+                    break
+                # проработал минуту — падение случайное, перезапускаем сразу; иначе пауза удваивается
+                backoff[name] = 1.0 if now - started[name] >= 60 else min(opts["max_backoff"],
+                                                                          max(1.0, backoff[name] * 2))
+                next_start[name] = now + backoff[name]
+                restarts[name] += 1
+                self.stderr.write(f"{name} exited with {code}, restart in {backoff[name]:.0f}s")
+            for name, proc in list(oneshots):
+                if proc.poll() is not None:
+                    oneshots.remove((name, proc))
+                    if proc.returncode:
+                        self.stderr.write(f"{name} failed with {proc.returncode}")
+            if not stopping:
+                time.sleep(opts["check_interval"])
+
+        self._stop([*procs.values(), *(proc for _, proc in oneshots)], opts["grace"])
+        self.stdout.write(json.dumps({"restarts": restarts}))
+        if exit_code:
+            raise CommandError(f"web exited with {exit_code}", returncode=exit_code)
+
+    def _spawn(self, name, argv):
+        self.stdout.write(f"starting {name}: {' '.join(argv[1:])}")
+        return subprocess.Popen(argv)
+
+    def _stop(self, procs, grace):
+        """SIGTERM всем; кто не остановился за grace — SIGKILL."""
+        for proc in procs:
+            if proc.poll() is None:
+                proc.send_signal(signal.SIGTERM)
+        deadline = time.monotonic() + grace
+        for proc in procs:
+            try:
+                proc.wait(timeout=max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
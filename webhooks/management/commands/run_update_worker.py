@@ -0,0 +1,96 @@
+import json
+import os
+import signal
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from webhooks import dedupe, update_queue
+from webhooks.scheduler import ChatScheduler
+
+
+class Command(BaseCommand):
+    help = ("Воркер очереди апдейтов Telegram: забирает UpdateJob и раздаёт их по очередям чатов (ChatScheduler) — "
+            "апдейты одного чата строго по порядку, разных чатов — параллельно; упавшие повторяет.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=getattr(settings, "UPDATE_WORKER_CONCURRENCY", 4),
+                            help="Сколько очередей чатов (потоков) в процессе")
+        parser.add_argument("--prefetch", type=int, default=8, help="Сколько задач держать на одну очередь")
+        parser.add_argument("--shard", type=int, default=0, help="Номер этого процесса среди --shards")
+        parser.add_argument("--shards", type=int, default=1, help="Сколько процессов-воркеров делят чаты")
+        parser.add_argument("--poll-interval", type=float, default=0.5, help="Пауза, когда очередь пуста (сек)")
+        parser.add_argument("--max-attempts", type=int, default=update_queue.MAX_ATTEMPTS)
+        parser.add_argument("--lease", type=float, default=300.0,
+                            help="Через сколько секунд задача в работе считается брошенной и возвращается в очередь")
+        parser.add_argument("--keep-done", type=float, default=24 * 3600,
+                            help="Сколько секунд хранить выполненные задачи")
+        parser.add_argument("--metrics-every", type=float, default=60.0, help="Печатать метрики раз в N секунд")
+        parser.add_argument("--once", action="store_true", help="Разобрать очередь и выйти")
+
+    def handle(self, *args, **opts):
+        concurrency = max(1, opts["concurrency"])
+        shards = max(1, opts["shards"])
+        if not 0 <= opts["shard"] < shards:
+            raise CommandError("--shard must be in [0, --shards)")
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        capacity = concurrency * max(1, opts["prefetch"])
+        stopping = []
+
+        def stop(signum, frame):
+            stopping.append(signum)
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        # чат -> id задачи, которая упала и ждёт повтора: более поздние задачи чата, уже стоящие
+        # в очереди планировщика, возвращаем в БД, чтобы не обогнать повтор
+        retrying = {}
+        retrying_lock = threading.Lock()
+
+        def work(job):
+            try:
+                with retrying_lock:
+                    blocked_by = retrying.get(job.chat_id)
+                if blocked_by is not None and blocked_by != job.id:
+                    update_queue.release(job)
+                    return
+                ok = update_queue.process(job, max_attempts=opts["max_attempts"])
+                with retrying_lock:
+                    if ok or job.attempts >= opts["max_attempts"]:
+                        retrying.pop(job.chat_id, None)
+                    else:
+                        retrying[job.chat_id] = job.id
+            finally:
+                close_old_connections()
+
+        self.stdout.write(f"update worker {worker}: lanes={concurrency} shard={opts['shard']}/{shards}")
+        inflight = set()
+        last_housekeeping = last_metrics = 0.0
+        with ChatScheduler(concurrency, name="update-worker") as scheduler:
+            while not stopping:
+                now = time.monotonic()
+                if now - last_housekeeping >= opts["poll_interval"] * 20:
+                    update_queue.requeue_stale(opts["lease"])
+                    update_queue.purge_done(opts["keep_done"])
+                    dedupe.purge_expired()
+                    last_housekeeping = now
+                if opts["metrics_every"] and now - last_metrics >= opts["metrics_every"]:
+                    self.stdout.write(json.dumps({**update_queue.queue_metrics(), "scheduler": scheduler.stats()}))
+                    last_metrics = now
+
+                inflight = {f for f in inflight if not f.done()}
+                jobs = update_queue.claim(worker, capacity - len(inflight), shard=opts["shard"], shards=shards)
+                for job in jobs:
+                    inflight.add(scheduler.submit(job.chat_id, work, job))
+                if not jobs:
+                    if opts["once"] and not inflight:
+                        break
+                    time.sleep(opts["poll_interval"])
+            # по SIGTERM новые задачи не берём, уже розданные доделываем (выход из with ждёт очереди)
+        close_old_connections()
+        self.stdout.write(json.dumps(update_queue.queue_metrics()))
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.24 on 2026-10-16 23:03
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UpdateJob',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('dice', 'Кубик / сообщение'), ('answer', 'Ответ на ForceReply')], default='dice', max_length=16, verbose_name='Вебхук')),
+                ('update_id', models.BigIntegerField(blank=True, null=True, verbose_name='Telegram update_id')),
+                ('chat_id', models.BigIntegerField(blank=True, null=True, verbose_name='Чат')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='Апдейт')),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('processing', 'Обрабатывается'), ('done', 'Готово'), ('failed', 'Ошибка')], default='queued', max_length=16, verbose_name='Статус')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Попыток')),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Доступна с')),
+                ('locked_by', models.CharField(blank=True, default='', max_length=64, verbose_name='Воркер')),
+                ('locked_at', models.DateTimeField(blank=True, null=True, verbose_name='Взята в работу')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Последняя ошибка')),
+                ('result', models.JSONField(blank=True, default=dict, verbose_name='Ответ обработчика')),
+            ],
+            options={
+                'ordering': ('id',),
+                'indexes': [models.Index(fields=['status', 'available_at'], name='webhooks_up_status_fbd999_idx'), models.Index(fields=['chat_id', 'status'], name='webhooks_up_chat_id_8c4d2e_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.24 on 2026-10-16 23:07
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhooks', '0001_update_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeenUpdate',
+            fields=[
+                ('update_id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='Telegram update_id')),
+                ('seen_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Принят')),
+            ],
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.24 on 2026-10-16 23:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0007_move_card_msg_id'),
+        ('webhooks', '0002_seen_update'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxMessage',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('card', 'Карточка хода'), ('cards', 'Карточки серии (альбомами)'), ('quiz', 'ForceReply по ходу'), ('text', 'Текст'), ('dice', 'Кубик')], max_length=16, verbose_name='Тип')),
+                ('chat_id', models.BigIntegerField(verbose_name='Чат')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='Данные сообщения')),
+                ('status', models.CharField(choices=[('pending', 'Ждёт отправки'), ('sending', 'Отправляется'), ('sent', 'Отправлено'), ('failed', 'Ошибка')], default='pending', max_length=16, verbose_name='Статус')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Попыток')),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Доступно с')),
+                ('locked_by', models.CharField(blank=True, default='', max_length=64, verbose_name='Диспетчер')),
+                ('locked_at', models.DateTimeField(blank=True, null=True, verbose_name='Взято в работу')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('message_ids', models.JSONField(blank=True, default=list, verbose_name='message_id в Telegram')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Последняя ошибка')),
+                ('move', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='games.move')),
+            ],
+            options={
+                'ordering': ('id',),
+                'indexes': [models.Index(fields=['status', 'available_at'], name='webhooks_ou_status_f224bf_idx'), models.Index(fields=['chat_id', 'status'], name='webhooks_ou_chat_id_9195d9_idx')],
+            },
+        ),
+    ]
@@ -1,3 +1,105 @@
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+
+class UpdateJob(models.Model):
+    """
+    Апдейт Telegram в очереди: вебхук только пишет строку и сразу отвечает 200,
+    обрабатывает её воркер (manage.py run_update_worker), апдейты одного чата — строго по порядку id.
+    """
+
+    class Kind(models.TextChoices):
+        DICE = 'dice', 'Кубик / сообщение'
+        ANSWER = 'answer', 'Ответ на ForceReply'
+
+    class Status(models.TextChoices):
+        QUEUED = 'queued', 'В очереди'
+        PROCESSING = 'processing', 'Обрабатывается'
+        DONE = 'done', 'Готово'
+        FAILED = 'failed', 'Ошибка'
+
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField('Вебхук', max_length=16, choices=Kind.choices, default=Kind.DICE)
+    update_id = models.BigIntegerField('Telegram update_id', null=True, blank=True)
+    chat_id = models.BigIntegerField('Чат', null=True, blank=True)
+    payload = models.JSONField('Апдейт', default=dict, blank=True)
+
+    status = models.CharField('Статус', max_length=16, choices=Status.choices, default=Status.QUEUED)
+    attempts = models.PositiveIntegerField('Попыток', default=0)
+    # раньше этого времени не берём (отложенный повтор)
+    available_at = models.DateTimeField('Доступна с', default=timezone.now)
+    locked_by = models.CharField('Воркер', max_length=64, blank=True, default='')
+    locked_at = models.DateTimeField('Взята в работу', null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField('Последняя ошибка', blank=True, default='')
+    result = models.JSONField('Ответ обработчика', default=dict, blank=True)
+
+    class Meta:
+        ordering = ('id',)
+        indexes = [
+            models.Index(fields=['status', 'available_at']),
+            models.Index(fields=['chat_id', 'status']),  # порядок внутри чата
+        ]
+
+    def __str__(self):
+        return f'#{self.id} {self.kind} chat={self.chat_id} {self.status}'
+
+
+class SeenUpdate(models.Model):
+    """update_id уже принятых апдейтов: повтор от Telegram отбрасываем до игровой логики (webhooks.dedupe)."""
+    update_id = models.BigIntegerField('Telegram update_id', primary_key=True)
+    seen_at = models.DateTimeField('Принят', default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f'update {self.update_id}'
+
+
+class OutboxMessage(models.Model):
+    """
+    Исходящее сообщение в Telegram (transactional outbox): пишется в той же транзакции, что ход или ответ,
+    отправляет диспетчер (manage.py run_outbox_dispatcher) — сообщения одного чата строго по порядку id.
+    Рестарт пода или исключение после коммита больше не теряют карточки и ForceReply.
+    """
+
+    class Kind(models.TextChoices):
+        CARD = 'card', 'Карточка хода'
+        CARDS = 'cards', 'Карточки серии (альбомами)'
+        QUIZ = 'quiz', 'ForceReply по ходу'
+        TEXT = 'text', 'Текст'
+        DICE = 'dice', 'Кубик'
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Ждёт отправки'
+        SENDING = 'sending', 'Отправляется'
+        SENT = 'sent', 'Отправлено'
+        FAILED = 'failed', 'Ошибка'
+
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField('Тип', max_length=16, choices=Kind.choices)
+    chat_id = models.BigIntegerField('Чат')
+    payload = models.JSONField('Данные сообщения', default=dict, blank=True)
+    # ход, на который записываем message_id (card_msg_id / answer_prompt_msg_id)
+    move = models.ForeignKey('games.Move', null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+
+    status = models.CharField('Статус', max_length=16, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveIntegerField('Попыток', default=0)
+    available_at = models.DateTimeField('Доступно с', default=timezone.now)
+    locked_by = models.CharField('Диспетчер', max_length=64, blank=True, default='')
+    locked_at = models.DateTimeField('Взято в работу', null=True, blank=True)
+
+    created_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    message_ids = models.JSONField('message_id в Telegram', default=list, blank=True)
+    last_error = models.TextField('Последняя ошибка', blank=True, default='')
+
+    class Meta:
+        ordering = ('id',)
+        indexes = [
+            models.Index(fields=['status', 'available_at']),
+            models.Index(fields=['chat_id', 'status']),  # порядок внутри чата
+        ]
+
+    def __str__(self):
+        return f'#{self.id} {self.kind} chat={self.chat_id} {self.status}'
@@ -0,0 +1,278 @@
+"""
+Transactional outbox исходящих сообщений в Telegram (OutboxMessage).
+
+Обработчик апдейта пишет сообщения (карточки, ForceReply, текст, кубик) строками outbox в той же транзакции,
+что ход или ответ: ход без своих сообщений закоммитить нельзя, а рестарт пода после коммита их не теряет.
+Отправляет диспетчер (manage.py run_outbox_dispatcher): пачками, сообщения чата — строго по порядку id
+(как задачи UpdateJob в update_queue), message_id из ответа Telegram записывает обратно в Move
+(card_msg_id карточки, answer_prompt_msg_id ForceReply). Сбой — повтор с backoff; 400/403
+(чат недоступен, бот заблокирован) — сразу FAILED, следующие сообщения чата не ждут.
+"""
+from __future__ import annotations
+
+import logging
+import traceback
+from datetime import timedelta
+from typing import List, Optional
+
+from django.conf import settings
+from django.db.models import Count, Exists, F, Min, OuterRef, Q
+from django.utils import timezone
+
+from games.models import Move
+from games.services import tg_rate, tg_send
+from games.services.telegram_client import TelegramResult
+from webhooks.models import OutboxMessage
+
+log = logging.getLogger(__name__)
+
+PENDING, SENDING = OutboxMessage.Status.PENDING, OutboxMessage.Status.SENDING
+SENT, FAILED = OutboxMessage.Status.SENT, OutboxMessage.Status.FAILED
+Kind = OutboxMessage.Kind
+
+MAX_ATTEMPTS = int(getattr(settings, "OUTBOX_MAX_ATTEMPTS", 5))
+# повтор через RETRY_BASE * 2**(попытка-1) секунд, но не дольше RETRY_MAX
+RETRY_BASE = float(getattr(settings, "OUTBOX_RETRY_BASE", 1.0))
+RETRY_MAX = float(getattr(settings, "OUTBOX_RETRY_MAX", 120.0))
+# окно, по которому считаем задержку доставки в метриках
+LATENCY_WINDOW = float(getattr(settings, "OUTBOX_LATENCY_WINDOW", 300.0))
+
+# счётчики этого процесса (диспетчера)
+_stats = {"sent": 0, "failed": 0, "retried": 0, "requeued": 0, "deferred": 0}
+
+
+class OutboxError(Exception):
+    """Telegram не принял сообщение; permanent — повтор не поможет (400/403)."""
+
+    def __init__(self, message: str, permanent: bool = False):
+        super().__init__(message)
+        self.permanent = permanent
+
+
+# ---------- запись (внутри transaction.atomic() вместе с ходом/ответом) ----------
+
+def enqueue(chat_id: int, kind: str, payload: Optional[dict] = None,
+            move_id: Optional[int] = None) -> OutboxMessage:
+    return OutboxMessage.objects.create(chat_id=int(chat_id), kind=kind, payload=payload or {}, move_id=move_id)
+
+
+def enqueue_text(chat_id: int, text: str) -> OutboxMessage:
+    return enqueue(chat_id, Kind.TEXT, {"text": text})
+
+
+def enqueue_dice(chat_id: int, emoji: str = "🎲") -> OutboxMessage:
+    return enqueue(chat_id, Kind.DICE, {"emoji": emoji})
+
+
+def enqueue_quiz(chat_id: int, move_id: Optional[int], prompt: str) -> OutboxMessage:
+    return enqueue(chat_id, Kind.QUIZ, {"prompt": prompt}, move_id=move_id)
+
+
+def enqueue_card_with_quiz(chat_id: int, move_dict: dict, prompt: str) -> List[OutboxMessage]:
+    """Карточка хода и ForceReply по нему — двумя строками одним INSERT."""
+    move_id = move_dict.get("id")
+    return OutboxMessage.objects.bulk_create([
+        OutboxMessage(chat_id=int(chat_id), kind=Kind.CARD, payload={"move": move_dict}, move_id=move_id),
+        OutboxMessage(chat_id=int(chat_id), kind=Kind.QUIZ, payload={"prompt": prompt}, move_id=move_id),
+    ])
+
+
+def enqueue_cards(chat_id: int, moves: List[dict]) -> OutboxMessage:
+    """Карточки серии (альбомами, send_moves_batched)."""
+    return enqueue(chat_id, Kind.CARDS, {"moves": moves})
+
+
+def quiz_awaiting(move_id: int) -> bool:
+    """ForceReply по ходу уже ждёт отправки — второй не ставим."""
+    return OutboxMessage.objects.filter(move_id=move_id, kind=Kind.QUIZ, status__in=[PENDING, SENDING]).exists()
+
+
+# ---------- отправка ----------
+
+def _checked(raw: dict) -> int:
+    """message_id из ответа Telegram или OutboxError."""
+    res = TelegramResult(raw)
+    if res.message_id is not None:
+        return res.message_id
+    raise OutboxError(f"telegram: {res.description or 'no message_id'}", permanent=res.error_code in (400, 403))
+
+
+def deliver(msg: OutboxMessage, token: str) -> List[int]:
+    """Отправить сообщение и записать message_id в Move. Возвращает message_id отправленного."""
+    chat_id, payload = msg.chat_id, msg.payload or {}
+
+    if msg.kind == Kind.CARD:
+        message_id = tg_send._send_card(token, chat_id, payload.get("move") or {})
+        if message_id is None:
+            raise OutboxError("card not sent")
+        if msg.move_id:
+            Move.objects.filter(pk=msg.move_id).update(card_msg_id=message_id)
+        return [message_id]
+
+    if msg.kind == Kind.CARDS:
+        moves = payload.get("moves") or []
+        ids = tg_send.send_moves_batched(token, chat_id, moves)
+        sent = [(mv, mid) for mv, mid in zip(moves, ids) if mid is not None]
+        for mv, mid in sent:
+            if mv.get("id"):
+                Move.objects.filter(pk=mv["id"]).update(card_msg_id=mid)
+        if len(sent) < len(moves):
+            # отправленные не повторяем: в строке остаются только карточки, которые не ушли
+            left = [mv for mv, mid in zip(moves, ids) if mid is None]
+            OutboxMessage.objects.filter(pk=msg.pk).update(
+                payload={**payload, "moves": left}, message_ids=list(msg.message_ids) + [m for _, m in sent],
+            )
+            raise OutboxError(f"{len(left)} of {len(moves)} cards not sent")
+        return list(msg.message_ids) + [m for _, m in sent]
+
+    if msg.kind == Kind.QUIZ:
+        message_id = _checked(tg_send.send_quiz(token, chat_id, prompt_text=payload.get("prompt") or ""))
+        if msg.move_id:
+            # ответ уже получен (игрок ответил на прежний запрос) — новый запрос к ходу не привязываем
+            Move.objects.filter(pk=msg.move_id, player_answer__isnull=True).update(answer_prompt_msg_id=message_id)
+        return [message_id]
+
+    if msg.kind == Kind.TEXT:
+        return [_checked(tg_send.send_text_message(token, chat_id, payload.get("text") or ""))]
+
+    if msg.kind == Kind.DICE:
+        return [_checked(tg_send.send_dice(token, chat_id, emoji=payload.get("emoji") or "🎲"))]
+
+    raise OutboxError(f"unknown kind {msg.kind!r}", permanent=True)
+
+
+# ---------- диспетчер ----------
+
+def claim(worker: str, limit: int) -> List[OutboxMessage]:
+    """
+    Забрать до limit готовых сообщений по порядку id. Сообщение чата не берём, пока более раннее сообщение
+    этого чата ждёт повтора или отправляется другим диспетчером (тот же приём, что update_queue.claim).
+    """
+    if limit <= 0:
+        return []
+    now = timezone.now()
+    blocking = OutboxMessage.objects.filter(chat_id=OuterRef("chat_id"), id__lt=OuterRef("id")).filter(
+        Q(status=PENDING, available_at__gt=now) | (Q(status=SENDING) & ~Q(locked_by=worker))
+    )
+    candidates = list(
+        OutboxMessage.objects.filter(status=PENDING, available_at__lte=now).filter(~Exists(blocking))
+        .order_by("id").values_list("pk", "chat_id")[:limit]
+    )
+
+    claimed, lost_chats = [], set()
+    for pk, chat_id in candidates:
+        if chat_id in lost_chats:
+            continue
+        took = OutboxMessage.objects.filter(pk=pk, status=PENDING).update(
+            status=SENDING, locked_by=worker, locked_at=now, attempts=F("attempts") + 1,
+        )
+        if took:
+            claimed.append(pk)
+        else:
+            lost_chats.add(chat_id)
+    return list(OutboxMessage.objects.filter(pk__in=claimed).order_by("id"))
+
+
+def release(msg: OutboxMessage, wait: float = 0.0) -> None:
+    """
+    Вернуть взятое сообщение, не засчитывая попытку: более раннее сообщение чата ждёт повтора
+    или лимит Telegram не дал отправить — тогда берём снова не раньше чем через wait секунд.
+    """
+    msg.attempts -= 1
+    OutboxMessage.objects.filter(pk=msg.pk, status=SENDING).update(
+        status=PENDING, attempts=F("attempts") - 1, locked_by="", locked_at=None,
+        available_at=timezone.now() + timedelta(seconds=wait),
+    )
+
+
+def process(msg: OutboxMessage, token: str, max_attempts: int = MAX_ATTEMPTS) -> bool:
+    """
+    Отправить и записать итог; при ошибке — повтор с backoff или FAILED. True — отправлено.
+    Лимит Telegram (токен или retry_after после 429) поток не ждёт: сообщение откладывается на это время.
+    """
+    with tg_rate.deferring() as limited:
+        try:
+            message_ids = deliver(msg, token)
+        except Exception as e:
+            if limited.wait > 0:
+                _stats["deferred"] += 1
+                release(msg, limited.wait)
+            else:
+                fail(msg, e, max_attempts=max_attempts)
+            return False
+    _stats["sent"] += 1
+    OutboxMessage.objects.filter(pk=msg.pk).update(
+        status=SENT, sent_at=timezone.now(), message_ids=message_ids, last_error="",
+    )
+    return True
+
+
+def fail(msg: OutboxMessage, exc: BaseException, max_attempts: int = MAX_ATTEMPTS) -> None:
+    error = "".join(traceback.format_exception_only(type(exc), exc)).strip()
+    if msg.attempts < max_attempts and not getattr(exc, "permanent", False):
+        delay = min(RETRY_BASE * 2 ** max(msg.attempts - 1, 0), RETRY_MAX)
+        _stats["retried"] += 1
+        log.warning("outbox %s failed (attempt %s), retry in %.0fs: %s", msg.pk, msg.attempts, delay, error)
+        OutboxMessage.objects.filter(pk=msg.pk).update(
+            status=PENDING, available_at=timezone.now() + timedelta(seconds=delay), last_error=error,
+            locked_by="", locked_at=None,
+        )
+        return
+    _stats["failed"] += 1
+    log.error("outbox %s failed permanently after %s attempts: %s", msg.pk, msg.attempts, error)
+    OutboxMessage.objects.filter(pk=msg.pk).update(status=FAILED, last_error=error, locked_by="", locked_at=None)
+
+
+def requeue_stale(lease_seconds: float) -> int:
+    """Сообщения, зависшие в отправке дольше lease (диспетчер умер), возвращаем в очередь."""
+    cutoff = timezone.now() - timedelta(seconds=lease_seconds)
+    n = OutboxMessage.objects.filter(status=SENDING, locked_at__lt=cutoff).update(
+        status=PENDING, locked_by="", locked_at=None, available_at=timezone.now(),
+    )
+    _stats["requeued"] += n
+    return n
+
+
+def purge_sent(older_than_seconds: float) -> int:
+    cutoff = timezone.now() - timedelta(seconds=older_than_seconds)
+    deleted, _ = OutboxMessage.objects.filter(status=SENT, sent_at__lt=cutoff).delete()
+    return deleted
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))], 3)
+
+
+def outbox_metrics() -> dict:
+    """
+    Backlog (сколько ждёт, возраст самого старого) — одним запросом; задержка доставки
+    (создание строки -> ответ Telegram) по отправленным за LATENCY_WINDOW секунд; плюс счётчики процесса.
+    """
+    now = timezone.now()
+    agg = OutboxMessage.objects.aggregate(
+        pending=Count("pk", filter=Q(status=PENDING)),
+        ready=Count("pk", filter=Q(status=PENDING, available_at__lte=now)),
+        retrying=Count("pk", filter=Q(status=PENDING, attempts__gt=0)),
+        sending=Count("pk", filter=Q(status=SENDING)),
+        failed=Count("pk", filter=Q(status=FAILED)),
+        oldest=Min("created_at", filter=Q(status__in=[PENDING, SENDING])),
+    )
+    oldest = agg.pop("oldest")
+    recent = (OutboxMessage.objects
+              .filter(status=SENT, sent_at__gte=now - timedelta(seconds=LATENCY_WINDOW))
+              .order_by("-sent_at").values_list("created_at", "sent_at")[:1000])
+    latencies = [(sent - created).total_seconds() for created, sent in recent]
+    return {
+        **agg,
+        "lag_sec": round((now - oldest).total_seconds(), 3) if oldest else 0.0,
+        "delivery_sec": {
+            "count": len(latencies),
+            "p50": _percentile(latencies, 0.5),
+            "p95": _percentile(latencies, 0.95),
+            "max": round(max(latencies), 3) if latencies else 0.0,
+        },
+        "dispatcher": dict(_stats),
+    }
@@ -0,0 +1,134 @@
+"""
+Приём апдейтов long-polling'ом getUpdates вместо вебхука (manage.py poll_updates).
+
+Пачка до 100 апдейтов за вызов проходит тот же путь, что апдейт вебхука, одним из двух способов:
+  - в очередь UpdateJob (воркер): отметка update_id (dedupe — двумя запросами на пачку) и вставка пачки —
+    одной транзакцией;
+  - прямо в процессе (--inline) теми же обработчиками (handlers.handle_dice_update / handle_answer_update),
+    сгруппированными по чатам: апдейты чата — по порядку в одной очереди ChatScheduler, разные чаты —
+    параллельно; update_id отмечается в транзакции обработчика, только вместе с его результатом.
+offset следующего getUpdates подтверждает Telegram пачку только после того, как она записана/обработана:
+упали посередине — Telegram отдаст пачку снова; уже закоммиченные апдейты отсечёт dedupe,
+незавершённые (их отметка откатилась) обработаются заново.
+"""
+from __future__ import annotations
+
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from webhooks import dedupe, update_queue
+from webhooks.models import UpdateJob
+
+log = logging.getLogger(__name__)
+
+# нужны только сообщения: кубик, ответы на ForceReply
+ALLOWED_UPDATES = ["message"]
+# --inline: сколько раз пробовать апдейт (транзиентные ошибки — например, занятая sqlite) и пауза между
+INLINE_ATTEMPTS = int(getattr(settings, "POLLING_INLINE_ATTEMPTS", 3))
+INLINE_RETRY_PAUSE = float(getattr(settings, "POLLING_INLINE_RETRY_PAUSE", 0.5))
+
+_stats = {"polls": 0, "received": 0, "duplicates": 0, "ignored": 0, "queued": 0, "processed": 0, "failed": 0}
+
+
+def kind_of(payload: dict) -> str:
+    """Какой вебхук принял бы апдейт: текстовый ответ на сообщение — answer, остальное — dice."""
+    message = payload.get("message") or {}
+    if message.get("reply_to_message") and isinstance(message.get("text"), str):
+        return UpdateJob.Kind.ANSWER
+    return UpdateJob.Kind.DICE
+
+
+def next_offset(updates: List[dict], offset: Optional[int]) -> Optional[int]:
+    """offset для следующего getUpdates: подтверждаем всё полученное, включая отброшенное."""
+    ids = [u["update_id"] for u in updates if isinstance(u.get("update_id"), int)]
+    return max(ids) + 1 if ids else offset
+
+
+def _by_chat(updates: List[dict], fresh: Optional[set] = None) -> Dict[int, List[Tuple[str, dict]]]:
+    """
+    Апдейты из чатов, сгруппированные по chat_id; порядок внутри чата — как пришли.
+    fresh — новые update_id (dedupe.first_seen_many): остальные отбрасываем как повторы.
+    """
+    groups: Dict[int, List[Tuple[str, dict]]] = {}
+    for payload in updates:
+        update_id = payload.get("update_id")
+        if fresh is not None and isinstance(update_id, int) and update_id not in fresh:
+            _stats["duplicates"] += 1
+            continue
+        chat_id = update_queue.chat_of(payload)
+        if chat_id is None:
+            _stats["ignored"] += 1
+            continue
+        groups.setdefault(chat_id, []).append((kind_of(payload), payload))
+    return groups
+
+
+def _run_one(kind: str, payload: dict) -> str:
+    """
+    Обработать апдейт: отметка update_id и обработчик — одной транзакцией ("processed" / "duplicate").
+    Упал — повторить через паузу (у воркера очереди это делает update_queue.fail), следующие апдейты чата ждут.
+    Не вышло за INLINE_ATTEMPTS — в лог и дальше по чату ("failed"); отметка откатилась, повтор пройдёт.
+    """
+    for attempt in range(1, INLINE_ATTEMPTS + 1):
+        try:
+            with transaction.atomic():
+                if not dedupe.seen_in_transaction(payload.get("update_id")):
+                    return "duplicate"
+                update_queue.run(kind, payload)
+            return "processed"
+        except Exception:
+            if attempt == INLINE_ATTEMPTS:
+                log.exception("update %s failed after %s attempts", payload.get("update_id"), attempt)
+                return "failed"
+            close_old_connections()
+            time.sleep(INLINE_RETRY_PAUSE * attempt)
+    return "failed"
+
+
+def _run_chat(items: List[Tuple[str, dict]]) -> Dict[str, int]:
+    counts = {"processed": 0, "duplicate": 0, "failed": 0}
+    try:
+        for kind, payload in items:
+            counts[_run_one(kind, payload)] += 1
+    finally:
+        close_old_connections()
+    return counts
+
+
+def admit(updates: List[dict], scheduler=None) -> dict:
+    """
+    Пачка getUpdates: scheduler=None — в очередь UpdateJob одной вставкой (обработает run_update_worker),
+    иначе обработать здесь по очередям чатов планировщика и дождаться всей пачки.
+    """
+    _stats["polls"] += 1
+    _stats["received"] += len(updates)
+    if scheduler is None:
+        # отметки и задачи — одной транзакцией: пачка не записалась — не записались и отметки
+        with transaction.atomic():
+            groups = _by_chat(updates, dedupe.first_seen_many(u.get("update_id") for u in updates))
+            items = [(kind, payload, chat_id) for chat_id, chat_items in groups.items()
+                     for kind, payload in chat_items]
+            # в очередь — по порядку update_id: воркер держит порядок чата по id задачи
+            items.sort(key=lambda item: item[1].get("update_id") or 0)
+            jobs = update_queue.enqueue_many(items)
+        _stats["queued"] += len(jobs)
+        return {"chats": len(groups), "queued": len(jobs)}
+
+    groups = _by_chat(updates)
+    futures = [scheduler.submit(chat_id, _run_chat, chat_items) for chat_id, chat_items in groups.items()]
+    counts = {"processed": 0, "duplicate": 0, "failed": 0}
+    for f in futures:
+        for key, n in f.result().items():
+            counts[key] += n
+    _stats["processed"] += counts["processed"]
+    _stats["duplicates"] += counts["duplicate"]
+    _stats["failed"] += counts["failed"]
+    return {"chats": len(groups), "processed": counts["processed"], "failed": counts["failed"]}
+
+
+def polling_stats() -> dict:
+    return dict(_stats)
@@ -0,0 +1,91 @@
+"""
+Планировщик «актёров» по чатам: chat_id хэшируется в одну из N очередей, у каждой очереди — свой поток.
+
+Апдейты одного чата выполняются строго по порядку и никогда параллельно — им не за что бороться
+(select_for_update в apply_roll и в ответах, «database is locked» на SQLite), а разные чаты
+расходятся по очередям и идут параллельно. Между процессами чаты делятся так же: chat_id mod shards
+(см. run_update_worker --shard/--shards).
+"""
+from __future__ import annotations
+
+import queue
+import threading
+import zlib
+from concurrent.futures import Future
+from typing import Any, Callable, List
+
+
+def lane_of(key: Any, lanes: int) -> int:
+    """Номер очереди для ключа: у int — остаток (стабильно между процессами), у прочего — crc32 строки."""
+    if isinstance(key, int):
+        return key % lanes
+    return zlib.crc32(str(key).encode("utf-8")) % lanes
+
+
+class ChatScheduler:
+    """N последовательных исполнителей; submit(chat_id, fn, ...) -> Future."""
+
+    def __init__(self, lanes: int, name: str = "chat"):
+        self.lanes = max(1, int(lanes))
+        self._queues: List[queue.SimpleQueue] = [queue.SimpleQueue() for _ in range(self.lanes)]
+        self._pending = [0] * self.lanes
+        self._lock = threading.Lock()
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0}
+        self._closed = False
+        self._threads = [
+            threading.Thread(target=self._run, args=(i,), name=f"{name}-{i}", daemon=True)
+            for i in range(self.lanes)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, key: Any, fn: Callable, *args, **kwargs) -> Future:
+        if self._closed:
+            raise RuntimeError("scheduler is shut down")
+        lane = lane_of(key, self.lanes)
+        fut: Future = Future()
+        with self._lock:
+            self._pending[lane] += 1
+            self._stats["submitted"] += 1
+        self._queues[lane].put((fut, fn, args, kwargs))
+        return fut
+
+    def _run(self, lane: int) -> None:
+        q = self._queues[lane]
+        while True:
+            item = q.get()
+            if item is None:
+                return
+            fut, fn, args, kwargs = item
+            try:
+                if fut.set_running_or_notify_cancel():
+                    try:
+                        fut.set_result(fn(*args, **kwargs))
+                    except BaseException as e:
+                        fut.set_exception(e)
+                        with self._lock:
+                            self._stats["failed"] += 1
+            finally:
+                with self._lock:
+                    self._pending[lane] -= 1
+                    self._stats["completed"] += 1
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Новые задачи не принимаем; уже поставленные доделываем (wait=True — ждём)."""
+        self._closed = True
+        for q in self._queues:
+            q.put(None)
+        if wait:
+            for t in self._threads:
+                t.join()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"lanes": self.lanes, "queued": sum(self._pending), "per_lane": list(self._pending),
+                    **self._stats}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown(wait=True)
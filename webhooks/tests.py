@@ -1,3 +1,356 @@
-from django.test import TestCase
+import io
+import json
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from games.models import Game, Move
+from players.models import Player
+from webhooks import dedupe, handlers, outbox, polling, update_queue
+from webhooks.context import load_context
+from webhooks.models import OutboxMessage, UpdateJob
+
+# отметка update_id: SAVEPOINT, INSERT SeenUpdate, RELEASE
+DEDUPE_QUERIES = 3
+
+
+@override_settings(TELEGRAM_BOT_TOKEN=None, TELEGRAM_UPDATE_QUEUE=False)
+class WebhookContextQueryTests(TestCase):
+    """Бюджет запросов на апдейт — см. docstring webhooks.context."""
+
+    def setUp(self):
+        from games import utils
+
+        utils.invalidate_payment_config()
+        dedupe.clear()
+        self.update_id = 0
+        self.player = Player.objects.create(email="p@example.com", telegram_id=7, telegram_username="p")
+
+    def _update(self, **message):
+        self.update_id += 1
+        body = {"update_id": self.update_id, "message": {"message_id": 10, "from": {"id": 7, "username": "p"},
+                                            "chat": {"id": 7}, **message}}
+        return self.client.post("/webhooks/telegram/diceResult", data=json.dumps(body), content_type="application/json")
+
+    def test_context_in_one_query(self):
+        game = Game.objects.create(player=self.player)
+        Move.objects.create(game=game, move_number=1, to_cell=6, player_answer="ok")
+        pending = Move.objects.create(game=game, move_number=2, to_cell=10, answer_prompt_msg_id=55)
+        Game.objects.filter(pk=game.pk).update(confirmed_moves=2, unanswered_moves=1, next_unanswered_move=pending)
+
+        with self.assertNumQueries(1):
+            ctx = load_context(7, "p")
+        self.assertEqual(ctx.game, game)
+        self.assertEqual(ctx.moves_count, 2)
+        self.assertEqual((ctx.pending.move_number, ctx.pending.answer_prompt_msg_id), (2, 55))
+
+    def test_no_active_game(self):
+        with self.assertNumQueries(2):
+            ctx = load_context(7, "p")
+        self.assertEqual(ctx.player, self.player)
+        self.assertIsNone(ctx.game)
+
+    def test_awaiting_answer_is_one_query(self):
+        game = Game.objects.create(player=self.player)
+        pending = Move.objects.create(game=game, move_number=1, to_cell=6, answer_prompt_msg_id=55)
+        Game.objects.filter(pk=game.pk).update(confirmed_moves=1, unanswered_moves=1, next_unanswered_move=pending)
+
+        with self.assertNumQueries(DEDUPE_QUERIES + 1):
+            resp = self._update(dice={"value": 3})
+        self.assertEqual(resp.json()["status"], "awaiting_answer")
+
+    def test_paywall_settings_are_cached(self):
+        game = Game.objects.create(player=self.player)
+        for n in range(1, 4):
+            Move.objects.create(game=game, move_number=n, to_cell=n, player_answer="ok")
+        Game.objects.filter(pk=game.pk).update(confirmed_moves=3)
+
+        with self.assertNumQueries(DEDUPE_QUERIES + 2):
+            self.assertEqual(self._update(dice={"value": 3}).json()["status"], "payment_required")
+        with self.assertNumQueries(DEDUPE_QUERIES + 1):
+            self.assertEqual(self._update(dice={"value": 3}).json()["status"], "payment_required")
+
+
+def _dice(chat_id: int, update_id: int) -> dict:
+    return {"update_id": update_id, "message": {"message_id": update_id, "from": {"id": chat_id},
+                                                "chat": {"id": chat_id}, "dice": {"value": 6}}}
+
+
+@override_settings(TELEGRAM_UPDATE_QUEUE=True)
+class UpdateQueueTests(TestCase):
+    def test_webhook_only_enqueues(self):
+        with self.assertNumQueries(DEDUPE_QUERIES + 1):
+            resp = self.client.post("/webhooks/telegram/diceResult", data=json.dumps(_dice(7, 1)),
+                                    content_type="application/json")
+        job = UpdateJob.objects.get()
+        self.assertEqual(resp.json(), {"ok": True, "queued": True, "job_id": job.id})
+        self.assertEqual((job.chat_id, job.update_id, job.status), (7, 1, UpdateJob.Status.QUEUED))
+
+    def test_telegram_retry_is_absorbed(self):
+        dedupe.clear()
+        body = json.dumps(_dice(7, 42))
+        post = lambda: self.client.post("/webhooks/telegram/diceResult", data=body,
+                                        content_type="application/json").json()
+        self.assertTrue(post()["queued"])
+        with self.assertNumQueries(0):
+            self.assertTrue(post()["duplicate"])        # из LRU процесса
+        dedupe.clear()
+        self.assertTrue(post()["duplicate"])            # повтор пришёл в другой процесс — ловит таблица
+        self.assertEqual(UpdateJob.objects.count(), 1)
+
+    def test_chat_order_across_workers(self):
+        a1 = update_queue.enqueue(UpdateJob.Kind.DICE, _dice(1, 1), 1)
+        a2 = update_queue.enqueue(UpdateJob.Kind.DICE, _dice(1, 2), 1)
+        b1 = update_queue.enqueue(UpdateJob.Kind.DICE, _dice(2, 3), 2)
+
+        self.assertEqual([j.id for j in update_queue.claim("w1", 1)], [a1.id])
+        self.assertEqual([j.id for j in update_queue.claim("w2", 10)], [b1.id])  # a2 ждёт a1 у чужого воркера
+        self.assertEqual([j.id for j in update_queue.claim("w1", 10)], [a2.id])  # свой воркер — по порядку за a1
+
+    def test_shards_split_chats(self):
+        update_queue.enqueue(UpdateJob.Kind.DICE, _dice(3, 1), 3)
+        update_queue.enqueue(UpdateJob.Kind.DICE, _dice(-4, 2), -4)
+        self.assertEqual([j.chat_id for j in update_queue.claim("w", 10, shard=1, shards=2)], [3])
+        self.assertEqual([j.chat_id for j in update_queue.claim("w", 10, shard=0, shards=2)], [-4])
+
+    def test_failed_job_is_retried_then_failed(self):
+        job = update_queue.enqueue(UpdateJob.Kind.DICE, _dice(1, 1), 1)
+        later = update_queue.enqueue(UpdateJob.Kind.DICE, _dice(1, 2), 1)
+        with mock.patch.object(update_queue, "run", side_effect=RuntimeError("boom")):
+            update_queue.process(update_queue.claim("w", 1)[0], max_attempts=2)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (UpdateJob.Status.QUEUED, 1))
+            self.assertIn("boom", job.last_error)
+            self.assertEqual(update_queue.claim("w", 10), [])  # повтор отложен, later за ним не обгоняет
+
+            UpdateJob.objects.filter(pk=job.pk).update(available_at=job.created_at)
+            update_queue.process(update_queue.claim("w", 1)[0], max_attempts=2)
+        job.refresh_from_db()
+        self.assertEqual(job.status, UpdateJob.Status.FAILED)
+        self.assertEqual([j.id for j in update_queue.claim("w", 10)], [later.id])
+
+        metrics = update_queue.queue_metrics()
+        self.assertEqual((metrics["failed"], metrics["processing"]), (1, 1))
+
+    def test_metrics_endpoint_requires_staff(self):
+        from django.contrib.auth.models import User
+        from rest_framework.authtoken.models import Token
+
+        self.assertEqual(self.client.get("/webhooks/queue/metrics").status_code, 401)
+        token = Token.objects.create(user=User.objects.create(username="admin", is_staff=True))
+        resp = self.client.get("/webhooks/queue/metrics", HTTP_AUTHORIZATION=f"Token {token.key}")
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("outbox", resp.json())
+
+
+@override_settings(TELEGRAM_UPDATE_QUEUE=True)
+class ChatSchedulerTests(TestCase):
+    def test_same_chat_in_order_other_chats_in_parallel(self):
+        import threading
+        from webhooks.scheduler import ChatScheduler
+
+        seen, gate = [], threading.Event()
+        with ChatScheduler(2) as scheduler:
+            blocked = scheduler.submit(0, gate.wait, 5)               # очередь чата 0 занята
+            other = scheduler.submit(1, lambda: "free")               # чат 1 — в другой очереди
+            self.assertEqual(other.result(timeout=5), "free")
+            done = [scheduler.submit(0, seen.append, n) for n in range(5)]
+            gate.set()
+            for f in done:
+                f.result(timeout=5)
+        self.assertTrue(blocked.result())
+        self.assertEqual(seen, list(range(5)))
+        self.assertEqual(scheduler.stats()["completed"], 7)
+
+
+@override_settings(TELEGRAM_BOT_TOKEN="1:T")
+class OutboxTests(TestCase):
+    def setUp(self):
+        player = Player.objects.create(email="p@example.com", telegram_id=7)
+        self.game = Game.objects.create(player=player)
+        self.first = Move.objects.create(game=self.game, move_number=1, to_cell=6, answer_prompt_msg_id=55)
+        self.second = Move.objects.create(game=self.game, move_number=2, to_cell=10)
+        Game.objects.filter(pk=self.game.pk).update(confirmed_moves=2, unanswered_moves=2,
+                                                    next_unanswered_move=self.first)
+
+    def _answer(self):
+        return handlers.handle_answer_update({"message": {"chat": {"id": 7}, "from": {"id": 7}, "text": "ok",
+                                                          "reply_to_message": {"message_id": 55}}})
+
+    def test_messages_are_written_with_the_answer(self):
+        with mock.patch("games.services.telegram_client.get_session") as session:
+            self.assertEqual(self._answer()["next_move_id"], self.second.id)
+        session.assert_not_called()  # в Telegram обработчик ничего не шлёт
+        self.assertEqual([(m.kind, m.move_id) for m in OutboxMessage.objects.all()],
+                         [("card", self.second.id), ("quiz", self.second.id)])
+
+        # упали после записи outbox — откатываются и ответ, и сообщения
+        OutboxMessage.objects.all().delete()
+        Move.objects.filter(pk=self.first.pk).update(player_answer=None, answer_prompt_msg_id=55)
+        Game.objects.filter(pk=self.game.pk).update(next_unanswered_move=self.first)
+        with mock.patch.object(handlers, "_enqueue_move_and_quiz",
+                               side_effect=lambda *a: (outbox.enqueue_text(7, "x"), 1 / 0)):
+            with self.assertRaises(ZeroDivisionError):
+                self._answer()
+        self.assertFalse(OutboxMessage.objects.exists())
+        self.assertIsNone(Move.objects.get(pk=self.first.pk).player_answer)
+
+    def test_dispatcher_keeps_chat_order_and_records_message_ids(self):
+        outbox.enqueue_card_with_quiz(7, {"id": self.second.id}, "?")
+        other = outbox.enqueue_text(8, "hi")
+        quiz_reply = {"ok": True, "result": {"message_id": 102}}
+
+        with mock.patch("games.services.tg_send._send_card", return_value=None):
+            card = outbox.claim("d", 1)[0]
+            self.assertFalse(outbox.process(card, "1:T"))
+        self.assertEqual([m.id for m in outbox.claim("d", 10)], [other.id])  # ForceReply не обгоняет карточку
+
+        OutboxMessage.objects.filter(pk=card.pk).update(available_at=card.created_at)
+        with mock.patch("games.services.tg_send._send_card", return_value=101), \
+                mock.patch("games.services.tg_send.send_quiz", return_value=quiz_reply):
+            for msg in outbox.claim("d", 10):
+                self.assertTrue(outbox.process(msg, "1:T"))
+        self.second.refresh_from_db()
+        self.assertEqual((self.second.card_msg_id, self.second.answer_prompt_msg_id), (101, 102))
+
+        blocked = outbox.enqueue_text(9, "bye")
+        with mock.patch("games.services.tg_send.send_text_message",
+                        return_value={"ok": False, "error_code": 403, "description": "Forbidden"}):
+            self.assertFalse(outbox.process(outbox.claim("d", 1)[0], "1:T"))
+        blocked.refresh_from_db()
+        self.assertEqual((blocked.status, blocked.attempts), (OutboxMessage.Status.FAILED, 1))  # 403 не повторяем
+
+        metrics = outbox.outbox_metrics()
+        self.assertEqual((metrics["pending"], metrics["sending"], metrics["failed"]), (0, 1, 1))
+        self.assertEqual(metrics["delivery_sec"]["count"], 2)
+
+    def test_rate_limit_defers_the_row_instead_of_sleeping(self):
+        from games.services import telegram_client, tg_rate
+
+        now = [100.0]
+        limiter = tg_rate.RateLimiter(global_rate=30, global_burst=30, chat_rate=1.0, chat_burst=1,
+                                      group_rate=1.0, clock=lambda: now[0])
+        outbox.enqueue_text(7, "a")
+        second = outbox.enqueue_text(7, "b")
+        sent = mock.Mock(status_code=200, json=lambda: {"ok": True, "result": {"message_id": 5}})
+        limited = mock.Mock(status_code=429, json=lambda: {"ok": False, "parameters": {"retry_after": 7}})
+        with override_settings(TELEGRAM_BOT_TOKEN="1:T"), \
+                mock.patch.object(tg_rate, "get_limiter", lambda: limiter), \
+                mock.patch.object(tg_rate.time, "sleep", side_effect=AssertionError("slept in lane")), \
+                mock.patch.object(telegram_client.get_session(), "post", side_effect=[sent, limited]) as post:
+            msg_a, msg_b = outbox.claim("d", 10)
+            self.assertTrue(outbox.process(msg_a, "1:T"))
+            # токена чата нет — в Telegram не ходим, строка откладывается на секунду без попытки
+            self.assertFalse(outbox.process(msg_b, "1:T"))
+            self.assertEqual(post.call_count, 1)
+            second.refresh_from_db()
+            self.assertEqual((second.status, second.attempts), (OutboxMessage.Status.PENDING, 0))
+            self.assertAlmostEqual((second.available_at - msg_b.locked_at).total_seconds(), 1.0, delta=0.5)
+
+            # 429 — откладываем на retry_after, а не ждём его в потоке
+            now[0] += 1
+            OutboxMessage.objects.filter(pk=second.pk).update(available_at=second.created_at)
+            msg_b = outbox.claim("d", 1)[0]
+            self.assertFalse(outbox.process(msg_b, "1:T"))
+            self.assertEqual(post.call_count, 2)
+        second.refresh_from_db()
+        self.assertEqual((second.status, second.attempts), (OutboxMessage.Status.PENDING, 0))
+        self.assertAlmostEqual((second.available_at - msg_b.locked_at).total_seconds(), 7.0, delta=0.5)
+        self.assertEqual(limiter.stats()["retry_after"], 1)
+
+
+def _reply(chat_id: int, update_id: int) -> dict:
+    return {"update_id": update_id, "message": {"message_id": update_id, "from": {"id": chat_id},
+                                                "chat": {"id": chat_id}, "text": "ok",
+                                                "reply_to_message": {"message_id": 1}}}
+
+
+@override_settings(TELEGRAM_BOT_TOKEN="1:T", TELEGRAM_UPDATE_QUEUE=True)
+class PollingTests(TestCase):
+    def setUp(self):
+        dedupe.clear()
+
+    def test_get_updates_batch_is_queued_in_one_insert(self):
+        batch = [_dice(1, 10), _reply(2, 11), {"update_id": 12, "edited_message": {}}, _dice(1, 13)]
+        dedupe.first_seen(13)  # уже пришёл вебхуком
+        response = mock.Mock(status_code=200, json=lambda: {"ok": True, "result": batch})
+        with mock.patch("games.services.telegram_client.get_session") as session:
+            session.return_value.post.return_value = response
+            # одной транзакцией (здесь — savepoint): dedupe пачки (SELECT + INSERT) и одна вставка задач
+            with self.assertNumQueries(5):
+                call_command("poll_updates", "--once", stdout=io.StringIO())
+        acked = session.return_value.post.call_args.kwargs["json"]
+        self.assertEqual(acked["offset"], 14)  # пачка подтверждена, включая отброшенные
+        self.assertEqual([(j.update_id, j.kind, j.chat_id) for j in UpdateJob.objects.all()],
+                         [(10, "dice", 1), (11, "answer", 2)])
+
+    def test_inline_update_marked_seen_only_with_its_result(self):
+        from webhooks.models import SeenUpdate
+
+        with mock.patch.object(polling, "INLINE_ATTEMPTS", 1), \
+                mock.patch.object(update_queue, "run", side_effect=RuntimeError("boom")):
+            self.assertEqual(polling._run_one("dice", _dice(1, 30)), "failed")
+        # отметка откатилась вместе с обработкой — пачку, отданную Telegram повторно, обработаем
+        self.assertFalse(SeenUpdate.objects.filter(update_id=30).exists())
+        with mock.patch.object(update_queue, "run", return_value={"ok": True}) as run:
+            self.assertEqual(polling._run_one("dice", _dice(1, 30)), "processed")
+            self.assertEqual(polling._run_one("dice", _dice(1, 30)), "duplicate")
+        run.assert_called_once()
+
+
+class InlinePollingTests(TransactionTestCase):
+    """--inline: обработчики и отметки update_id — в потоках планировщика, их соединениях с БД."""
+
+    def setUp(self):
+        dedupe.clear()
+
+    def test_inline_batch_runs_handlers_grouped_by_chat(self):
+        from webhooks.scheduler import ChatScheduler
+
+        seen = []
+        with mock.patch.object(update_queue, "run", side_effect=lambda kind, p: seen.append(p["update_id"])), \
+                ChatScheduler(2, name="poll-test") as scheduler:
+            result = polling.admit([_dice(1, 20), _dice(2, 21), _dice(1, 22)], scheduler)
+        self.assertEqual(result, {"chats": 2, "processed": 3, "failed": 0})
+        self.assertLess(seen.index(20), seen.index(22))
+        self.assertFalse(UpdateJob.objects.exists())
+        polling._stats["duplicates"] = 0
+        with mock.patch.object(update_queue, "run") as run, ChatScheduler(2, name="poll-test") as scheduler:
+            # Telegram отдал ту же пачку повторно — всё уже обработано
+            polling.admit([_dice(1, 20), _dice(2, 21), _dice(1, 22)], scheduler)
+        run.assert_not_called()
+        self.assertEqual(polling.polling_stats()["duplicates"], 3)
+
+
+@override_settings(TELEGRAM_UPDATE_QUEUE=True)
+class UpdateWorkerTests(TransactionTestCase):
+    """Воркер обрабатывает задачи в своих потоках (и своих соединениях с БД) — нужны закоммиченные данные."""
+
+    def test_worker_drains_queue(self):
+        for n in range(3):
+            update_queue.enqueue(UpdateJob.Kind.DICE, _dice(n % 2, n), n % 2)
+        with mock.patch.object(update_queue, "run", return_value={"ok": True}):
+            call_command("run_update_worker", "--once", "--concurrency", "1", "--poll-interval", "0.01",
+                         stdout=io.StringIO())
+        self.assertEqual(UpdateJob.objects.filter(status=UpdateJob.Status.DONE).count(), 3)
+
+
+class RunServicesTests(SimpleTestCase):
+    def test_crashed_worker_is_restarted_until_web_exits(self):
+        import sys
+
+        from webhooks.management.commands import run_services
+
+        services = {
+            "web": [sys.executable, "-c", "import time; time.sleep(1.5)"],
+            "update-worker": [sys.executable, "-c", "raise SystemExit(3)"],
+        }
+        out = io.StringIO()
+        with mock.patch.dict(run_services.SERVICES, services, clear=True), \
+                mock.patch.dict(run_services.ONESHOT, {}, clear=True):
+            call_command("run_services", "--check-interval", "0.05", "--max-backoff", "0.1",
+                         stdout=out, stderr=io.StringIO())
+        restarts = json.loads(out.getvalue().splitlines()[-1])["restarts"]
+        self.assertGreaterEqual(restarts["update-worker"], 2)
+        self.assertEqual(restarts["web"], 0)
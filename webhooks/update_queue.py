@@ -0,0 +1,189 @@
+"""
+Очередь апдейтов Telegram в БД (UpdateJob): вебхук кладёт апдейт одним INSERT, воркер забирает и обрабатывает.
+
+Порядок внутри чата: задачи чата воркер выполняет в одной очереди ChatScheduler (webhooks.scheduler),
+а в БД не берёт задачу, пока более ранняя задача чата ждёт повтора или в работе у другого воркера —
+поэтому апдейты одного чата идут строго по id, а разные чаты — параллельно.
+Захват — условный UPDATE status=queued -> processing, гонку выигрывает один воркер.
+"""
+from __future__ import annotations
+
+import logging
+import traceback
+from datetime import timedelta
+from time import monotonic
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Count, Exists, F, Min, OuterRef, Q
+from django.db.models.functions import Abs, Mod
+from django.utils import timezone
+
+from webhooks.models import UpdateJob
+
+log = logging.getLogger(__name__)
+
+QUEUED, PROCESSING = UpdateJob.Status.QUEUED, UpdateJob.Status.PROCESSING
+DONE, FAILED = UpdateJob.Status.DONE, UpdateJob.Status.FAILED
+
+MAX_ATTEMPTS = int(getattr(settings, "UPDATE_MAX_ATTEMPTS", 5))
+# повтор через RETRY_BASE * 2**(попытка-1) секунд, но не дольше RETRY_MAX
+RETRY_BASE = float(getattr(settings, "UPDATE_RETRY_BASE", 2.0))
+RETRY_MAX = float(getattr(settings, "UPDATE_RETRY_MAX", 300.0))
+
+# счётчики этого процесса (воркера)
+_stats = {"processed": 0, "failed": 0, "retried": 0, "requeued": 0, "busy_sec": 0.0}
+
+
+def _handlers() -> dict:
+    from webhooks import handlers
+    return {
+        UpdateJob.Kind.DICE: handlers.handle_dice_update,
+        UpdateJob.Kind.ANSWER: handlers.handle_answer_update,
+    }
+
+
+def chat_of(payload: dict) -> Optional[int]:
+    """chat_id апдейта (или id отправителя), None — апдейт не из чата: такие не ставим в очередь."""
+    message = payload.get("message") or (payload.get("data") or {}).get("message") or {}
+    chat = (message.get("chat") or {}).get("id") or (message.get("from") or {}).get("id")
+    try:
+        return int(chat) if chat is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def enqueue(kind: str, payload: dict, chat_id: Optional[int]) -> UpdateJob:
+    update_id = payload.get("update_id")
+    return UpdateJob.objects.create(
+        kind=kind,
+        payload=payload,
+        chat_id=chat_id,
+        update_id=update_id if isinstance(update_id, int) else None,
+    )
+
+
+def enqueue_many(items: List[Tuple[str, dict, Optional[int]]]) -> List[UpdateJob]:
+    """Пачка апдейтов (kind, payload, chat_id) одним INSERT — для getUpdates (webhooks.polling)."""
+    jobs = []
+    for kind, payload, chat_id in items:
+        update_id = payload.get("update_id")
+        jobs.append(UpdateJob(kind=kind, payload=payload, chat_id=chat_id,
+                              update_id=update_id if isinstance(update_id, int) else None))
+    return UpdateJob.objects.bulk_create(jobs)
+
+
+def run(kind: str, payload: dict) -> dict:
+    """Обработать апдейт сразу, в этом процессе."""
+    return _handlers()[kind](payload)
+
+
+# ---------- воркер ----------
+
+def claim(worker: str, limit: int, shard: int = 0, shards: int = 1) -> List[UpdateJob]:
+    """
+    Забрать до limit готовых задач по порядку id. Задачу чата не берём, пока более ранняя задача этого чата
+    ждёт повтора или в работе у другого воркера; свои более ранние — можно: воркер выполняет задачи
+    одного чата в одной очереди планировщика (ChatScheduler), строго друг за другом.
+    shard/shards — доля чатов этого процесса (chat_id mod shards), чтобы чат не делили два процесса.
+    """
+    if limit <= 0:
+        return []
+    now = timezone.now()
+    blocking = UpdateJob.objects.filter(chat_id=OuterRef("chat_id"), id__lt=OuterRef("id")).filter(
+        Q(status=QUEUED, available_at__gt=now) | (Q(status=PROCESSING) & ~Q(locked_by=worker))
+    )
+    qs = UpdateJob.objects.filter(status=QUEUED, available_at__lte=now)
+    if shards > 1:
+        qs = qs.annotate(shard=Mod(Abs("chat_id"), shards)).filter(shard=shard)
+    candidates = list(qs.filter(~Exists(blocking)).order_by("id").values_list("pk", "chat_id")[:limit])
+
+    claimed, lost_chats = [], set()
+    for pk, chat_id in candidates:
+        if chat_id in lost_chats:
+            continue
+        took = UpdateJob.objects.filter(pk=pk, status=QUEUED).update(
+            status=PROCESSING, locked_by=worker, locked_at=now, attempts=F("attempts") + 1,
+        )
+        if took:
+            claimed.append(pk)
+        else:
+            # более раннюю задачу чата перехватили — поздние этого чата не берём, иначе нарушим порядок
+            lost_chats.add(chat_id)
+    return list(UpdateJob.objects.filter(pk__in=claimed).order_by("id"))
+
+
+def release(job: UpdateJob) -> None:
+    """Вернуть взятую задачу в очередь, не засчитывая попытку (её чат ждёт повтора более ранней)."""
+    UpdateJob.objects.filter(pk=job.pk, status=PROCESSING).update(
+        status=QUEUED, attempts=F("attempts") - 1, locked_by="", locked_at=None,
+    )
+
+
+def process(job: UpdateJob, max_attempts: int = MAX_ATTEMPTS) -> bool:
+    """Выполнить задачу и записать итог; при ошибке — повтор с backoff или FAILED. True — успех."""
+    started = monotonic()
+    try:
+        result = run(job.kind, job.payload)
+    except Exception as e:
+        _stats["busy_sec"] += monotonic() - started
+        fail(job, e, max_attempts=max_attempts)
+        return False
+    _stats["busy_sec"] += monotonic() - started
+    _stats["processed"] += 1
+    UpdateJob.objects.filter(pk=job.pk).update(
+        status=DONE, finished_at=timezone.now(), result=result if isinstance(result, dict) else {},
+        last_error="",
+    )
+    return True
+
+
+def fail(job: UpdateJob, exc: BaseException, max_attempts: int = MAX_ATTEMPTS) -> None:
+    error = "".join(traceback.format_exception_only(type(exc), exc)).strip()
+    if job.attempts < max_attempts:
+        delay = min(RETRY_BASE * 2 ** max(job.attempts - 1, 0), RETRY_MAX)
+        _stats["retried"] += 1
+        log.warning("update job %s failed (attempt %s), retry in %.0fs: %s", job.pk, job.attempts, delay, error)
+        UpdateJob.objects.filter(pk=job.pk).update(
+            status=QUEUED, available_at=timezone.now() + timedelta(seconds=delay), last_error=error,
+            locked_by="", locked_at=None,
+        )
+        return
+    _stats["failed"] += 1
+    log.error("update job %s failed permanently after %s attempts: %s", job.pk, job.attempts, error)
+    UpdateJob.objects.filter(pk=job.pk).update(status=FAILED, finished_at=timezone.now(), last_error=error)
+
+
+def requeue_stale(lease_seconds: float) -> int:
+    """Задачи, зависшие в работе дольше lease (воркер умер), возвращаем в очередь."""
+    cutoff = timezone.now() - timedelta(seconds=lease_seconds)
+    n = UpdateJob.objects.filter(status=PROCESSING, locked_at__lt=cutoff).update(
+        status=QUEUED, locked_by="", locked_at=None, available_at=timezone.now(),
+    )
+    _stats["requeued"] += n
+    return n
+
+
+def purge_done(older_than_seconds: float) -> int:
+    cutoff = timezone.now() - timedelta(seconds=older_than_seconds)
+    deleted, _ = UpdateJob.objects.filter(status=DONE, finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def queue_metrics() -> dict:
+    """Глубина очереди и лаг (возраст самой старой ждущей задачи) — одним запросом; плюс счётчики процесса."""
+    now = timezone.now()
+    agg = UpdateJob.objects.aggregate(
+        queued=Count("pk", filter=Q(status=QUEUED)),
+        ready=Count("pk", filter=Q(status=QUEUED, available_at__lte=now)),
+        retrying=Count("pk", filter=Q(status=QUEUED, attempts__gt=0)),
+        processing=Count("pk", filter=Q(status=PROCESSING)),
+        failed=Count("pk", filter=Q(status=FAILED)),
+        oldest=Min("created_at", filter=Q(status__in=[QUEUED, PROCESSING])),
+    )
+    oldest = agg.pop("oldest")
+    return {
+        **agg,
+        "lag_sec": round((now - oldest).total_seconds(), 3) if oldest else 0.0,
+        "worker": {**_stats, "busy_sec": round(_stats["busy_sec"], 3)},
+    }
@@ -1,8 +1,9 @@
 from django.urls import path
-from .views import  telegram_dice_webhook, telegram_answer_webhook
+from .views import  telegram_dice_webhook, telegram_answer_webhook, update_queue_metrics
 
 
 urlpatterns = [
     path("telegram/diceResult", telegram_dice_webhook),
     path("webhooks/telegram/answer", telegram_answer_webhook),
+    path("queue/metrics", update_queue_metrics),
 ]